@@ -0,0 +1,55 @@
+import time
+import calendar
+
+
+# The API reports times, such as CREATE_DT, in US Eastern time (America/New_York),
+# which is UTC-5, or UTC-4 during daylight saving time.
+EST_OFFSET = -5 * 3600
+EDT_OFFSET = -4 * 3600
+
+API_TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def _sunday(year, month, n):
+    # Day of the month of the nth Sunday of the month, or of the last one if n is -1.
+    days = calendar.monthrange(year, month)[1]
+    sundays = [day for day in range(1, days + 1) if calendar.weekday(year, month, day) == calendar.SUNDAY]
+    return sundays[n - 1] if n > 0 else sundays[n]
+
+
+def _dst_bounds(year):
+    # Local wall clock times, in seconds as if they were UTC, at which daylight saving
+    # time starts and ends. Both switches happen at 2:00 local time.
+    if year >= 2007:
+        start, end = (3, _sunday(year, 3, 2)), (11, _sunday(year, 11, 1))
+    else:
+        start, end = (4, _sunday(year, 4, 1)), (10, _sunday(year, 10, -1))
+    return (calendar.timegm((year, start[0], start[1], 2, 0, 0)),
+        calendar.timegm((year, end[0], end[1], 2, 0, 0)))
+
+
+def parse_api_time(value):
+    '''
+    Converts an API timestamp like '2015-08-13 17:39:55.0' to seconds since the epoch.
+
+    The hour skipped when daylight saving time starts, and the hour repeated when it
+    ends, are read as standard time. That's the later of the possible instants, so a
+    record never looks older than it is.
+    '''
+    t = time.strptime(value.split('.')[0], API_TIME_FORMAT)
+    wall = calendar.timegm(t)
+    start, end = _dst_bounds(t.tm_year)
+    if start + 3600 <= wall < end - 3600:
+        return wall - EDT_OFFSET
+    return wall - EST_OFFSET
+
+
+def format_api_time(t):
+    '''
+    Formats seconds since the epoch as an API timestamp, in US Eastern time.
+    '''
+    year = time.gmtime(t + EST_OFFSET).tm_year
+    start, end = _dst_bounds(year)
+    # The switches happen at 2:00 standard time and 2:00 daylight saving time.
+    offset = EDT_OFFSET if start - EST_OFFSET <= t < end - EDT_OFFSET else EST_OFFSET
+    return time.strftime(API_TIME_FORMAT + '.0', time.gmtime(t + offset))
@@ -0,0 +1,247 @@
+import sys
+import Queue
+import threading
+
+import linode_api as lin
+
+
+class Future(object):
+    '''
+    The eventual result of an operation submitted to an :class:`AsyncClient`.
+    '''
+
+    def __init__(self):
+        self._done = threading.Event()
+        self._result = None
+        self._exc_info = None
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+
+    def done(self):
+        return self._done.is_set()
+
+
+    def result(self, timeout = None):
+        '''
+        Block until the operation finishes and return its result, or re-raise its exception.
+        Raises RuntimeError if `timeout` seconds pass first.
+        '''
+        if not self._done.wait(timeout):
+            raise RuntimeError('Timed out waiting for result')
+
+        if self._exc_info is not None:
+            raise self._exc_info[0], self._exc_info[1], self._exc_info[2]
+
+        return self._result
+
+
+    def exception(self, timeout = None):
+        if not self._done.wait(timeout):
+            raise RuntimeError('Timed out waiting for result')
+
+        return self._exc_info[1] if self._exc_info else None
+
+
+    def add_done_callback(self, callback):
+        '''
+        Call `callback(future)` once the operation finishes. If it has already
+        finished, `callback` is called immediately.
+        '''
+        with self._lock:
+            if not self._done.is_set():
+                self._callbacks.append(callback)
+                return
+
+        callback(self)
+
+
+    def set_result(self, result):
+        self._result = result
+        self._finish()
+
+
+    def set_exception(self, exc_info):
+        # exc_info is a (type, value, traceback) tuple, as returned by sys.exc_info()
+        self._exc_info = exc_info
+        self._finish()
+
+
+    def _finish(self):
+        with self._lock:
+            self._done.set()
+            callbacks, self._callbacks = self._callbacks, []
+
+        for callback in callbacks:
+            try:
+                callback(self)
+            except Exception:
+                pass
+
+
+
+def gather(futures):
+    '''
+    Wait for all `futures` and return their results in the same order.
+    '''
+    return [f.result() for f in futures]
+
+
+
+class AsyncClient(object):
+    '''
+    Non-blocking front end to the linode_api operations.
+
+    Each operation returns a :class:`Future` immediately. Operations are executed by a
+    fixed pool of `max_concurrency` worker threads, and all job waits are served by
+    a :class:`job_watcher.JobWatcher`, whose single thread checks every pending job
+    with batched requests. So a process can drive hundreds of in-flight creations
+    with a small, bounded number of threads.
+
+    Example:
+        client = AsyncClient(max_concurrency = 8)
+        nodes = gather([client.create_node(1, 'singapore') for i in range(100)])
+        ...
+        jobs = [client.wait_for_job(linode_id, job_id) for linode_id, job_id in pending]
+        results = gather(jobs)
+        client.close()
+    '''
+
+    def __init__(self, max_concurrency = 16, poll_interval = 5, job_timeout = 240, client = None):
+        '''
+        Args:
+            - max_concurrency : Max number of API requests in flight at once.
+            - poll_interval : Seconds between job status polls.
+            - job_timeout : Default seconds after which wait_for_job gives up.
+            - client : The :class:`linode_api.LinodeClient` to use. Defaults to the default client.
+        '''
+        self.client = client if client is not None else lin.default_client()
+        self.max_concurrency = max_concurrency
+        self.poll_interval = poll_interval
+        self.job_timeout = job_timeout
+
+        self._queue = Queue.Queue()
+        self._workers = []
+        self._lock = threading.Lock()
+        self._closed = False
+
+        # Imported here, since job_watcher imports Future from this module.
+        from job_watcher import JobWatcher
+        from polling import PollPolicy
+        self.job_watcher = JobWatcher(self.client,
+            PollPolicy(min_interval = poll_interval, max_interval = poll_interval, timeout = job_timeout))
+
+
+    def submit(self, func, *args, **kwargs):
+        '''
+        Run `func(*args, **kwargs)` on a worker thread and return a :class:`Future` for its result.
+        '''
+        future = Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError('Client is closed')
+            if len(self._workers) < self.max_concurrency:
+                self._start_worker()
+
+        self._queue.put( (future, func, args, kwargs) )
+        return future
+
+
+    def create_node(self, plan, datacenter, do_validations = True):
+        return self.submit(self.client.create_node, plan, datacenter, do_validations)
+
+    def update_node(self, linode_id, label, display_group):
+        return self.submit(self.client.update_node, linode_id, label, display_group)
+
+    def delete_node(self, linode_id, skip_checks):
+        return self.submit(self.client.delete_node, linode_id, skip_checks)
+
+    def create_disk(self, linode_id, disk_type, disk_size, label,
+        distribution = None, root_password = None, root_ssh_key_file = None):
+        return self.submit(self.client.create_disk, linode_id, disk_type, disk_size, label,
+            distribution, root_password, root_ssh_key_file)
+
+    def create_swap_disk(self, linode_id, swap_disk_size_mb = None):
+        return self.submit(self.client.create_swap_disk, linode_id, swap_disk_size_mb)
+
+    def create_disk_from_distribution(self, linode_id, distribution, disk_size, root_password, root_ssh_key_file):
+        return self.submit(self.client.create_disk_from_distribution, linode_id, distribution, disk_size,
+            root_password, root_ssh_key_file)
+
+    def create_disk_from_image(self, linode_id, image_id, label, disk_size, root_password, root_ssh_key_file):
+        return self.submit(self.client.create_disk_from_image, linode_id, image_id, label, disk_size,
+            root_password, root_ssh_key_file)
+
+    def create_diskimage(self, linode_id, disk_id, image_label):
+        return self.submit(self.client.create_diskimage, linode_id, disk_id, image_label)
+
+    def create_config(self, linode_id, kernel, disks, config_label, do_validations = True):
+        return self.submit(self.client.create_config, linode_id, kernel, disks, config_label, do_validations)
+
+    def boot_node(self, linode_id, config_id = None):
+        return self.submit(self.client.boot_node, linode_id, config_id)
+
+    def shutdown_node(self, linode_id):
+        return self.submit(self.client.shutdown_node, linode_id)
+
+    def add_private_ip(self, linode_id):
+        return self.submit(self.client.add_private_ip, linode_id)
+
+    def get_public_ip_address(self, linode_id):
+        return self.submit(self.client.get_public_ip_address, linode_id)
+
+    def is_job_finished(self, linode_id, job_id):
+        return self.submit(self.client.is_job_finished, linode_id, job_id)
+
+
+    def wait_for_job(self, linode_id, job_id, timeout = None, job_label = 'job'):
+        '''
+        Returns a :class:`Future` that resolves to (finished, success) once the job finishes,
+        or (False, None) after `timeout` seconds, with the same values as
+        :meth:`linode_core.Core.wait_for_job`. The job is checked right away, then
+        every `poll_interval` seconds.
+        '''
+        with self._lock:
+            if self._closed:
+                raise RuntimeError('Client is closed')
+
+        return self.job_watcher.watch(linode_id, job_id, job_label,
+            timeout if timeout is not None else self.job_timeout)
+
+
+    def close(self):
+        '''
+        Finish queued operations and stop all threads. Pending job waits are
+        resolved as not finished.
+        '''
+        with self._lock:
+            self._closed = True
+            workers = self._workers
+
+        for w in workers:
+            self._queue.put(None)
+        for w in workers:
+            w.join()
+
+        self.job_watcher.close()
+
+
+    def _start_worker(self):
+        # Caller must hold self._lock
+        t = threading.Thread(target = self._work, name = 'async-worker-%d' % (len(self._workers)))
+        t.daemon = True
+        t.start()
+        self._workers.append(t)
+
+
+    def _work(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+
+            future, func, args, kwargs = item
+            try:
+                future.set_result(func(*args, **kwargs))
+            except Exception:
+                future.set_exception(sys.exc_info())
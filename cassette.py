@@ -0,0 +1,234 @@
+import gzip
+import json
+import time
+import urllib
+import urlparse
+import threading
+import StringIO
+
+from exc import CassetteMissError, TransportError
+
+
+# Request params that differ on every run, such as the random root passwords
+# generated by linode_core.Core, and so are ignored when matching requests.
+DEFAULT_IGNORED_PARAMS = ('rootPass',)
+
+CASSETTE_VERSION = 1
+
+
+def request_key(body, ignored_params = DEFAULT_IGNORED_PARAMS):
+    '''
+    Returns the key a request is recorded under: its urlencoded params, sorted,
+    without the api_key or `ignored_params`. The requests of a batch are
+    normalized the same way.
+    '''
+    ignored = set(ignored_params) | set(['api_key'])
+    params = [(k, v) for k, v in urlparse.parse_qsl(body or '', keep_blank_values = True) if k not in ignored]
+
+    normalized = []
+    for k, v in params:
+        if k == 'api_requestArray':
+            try:
+                requests = json.loads(v)
+                v = json.dumps([dict([(rk, rv) for rk, rv in r.items() if rk not in ignored]) for r in requests],
+                    sort_keys = True, separators = (',',':'))
+            except (ValueError, AttributeError):
+                pass
+        normalized.append( (k, v) )
+
+    return urllib.urlencode(sorted(normalized))
+
+
+
+class CassetteTransport(object):
+    '''
+    Transport that records API requests and their responses to a cassette file,
+    or replays them from one without any network access.
+
+    A cassette is an NDJSON file, gzipped if its name ends with .gz. The api_key
+    is never written. Response bodies that were already recorded, such as
+    repeated catalog fetches, are stored once and referenced by later entries.
+
+    In replay mode, the cassette is loaded into a map of request key -> responses.
+    Requests recorded several times, like polls of a pending job, are answered
+    with their responses in the recorded order, and then with the last one.
+    Call :meth:`rewind` to replay a cassette again from the start.
+
+    Example:
+        # Record
+        cassette = CassetteTransport('create_linode.ndjson', 'record')
+        client = linode_api.LinodeClient(api_key, url, transport = cassette)
+        core = linode_core.Core(app_ctx, client)
+        core.create_linode(spec)
+        cassette.close()
+
+        # Replay, as fast as possible
+        cassette = CassetteTransport('create_linode.ndjson')
+        client = linode_api.LinodeClient(api_key, url, transport = cassette)
+        for i in range(1000):
+            cassette.rewind()
+            core.create_linode(spec)
+    '''
+
+    def __init__(self, path, mode = 'replay', transport = None, replay_timing = False, speed = 1.0,
+        ignored_params = DEFAULT_IGNORED_PARAMS):
+        '''
+        Args:
+            - path : The cassette file.
+            - mode : 'record' or 'replay'.
+            - transport : The transport requests are recorded from. Defaults to the
+                transport shared by linode_api clients.
+            - replay_timing : If True, replayed responses take as long as they did when
+                recorded, divided by `speed`. Otherwise they are returned immediately.
+            - ignored_params : Request params that are not used to match requests.
+        '''
+        if mode not in ('record', 'replay'):
+            raise ValueError('Unsupported cassette mode: %s' % (mode))
+
+        self.path = path
+        self.mode = mode
+        self.replay_timing = replay_timing
+        self.speed = speed
+        self.ignored_params = ignored_params
+
+        self._lock = threading.Lock()
+        self.recorded = 0
+        self.replayed = 0
+        self.misses = 0
+
+        if mode == 'record':
+            if transport is None:
+                import linode_api
+                transport = linode_api.shared_transport
+            self.transport = transport
+            self._file = self._open('w')
+            self._bodies = {}
+            self._write({'version' : CASSETTE_VERSION, 'created' : time.time()})
+        else:
+            self.transport = None
+            self._file = None
+            self._load()
+
+
+    def post(self, url, body, headers = None):
+        if self.mode == 'record':
+            return self._record(url, body, headers)
+        return self._replay(url, body)
+
+
+    def post_stream(self, url, body, headers = None):
+        return StringIO.StringIO(self.post(url, body, headers))
+
+
+    def rewind(self):
+        '''
+        Replay from the start of the cassette again.
+        '''
+        with self._lock:
+            self._cursors = {}
+
+
+    def stats(self):
+        with self._lock:
+            return {
+                'mode' : self.mode,
+                'recorded' : self.recorded,
+                'replayed' : self.replayed,
+                'misses' : self.misses
+            }
+
+
+    def evict_idle(self, max_idle = None):
+        if self.transport is not None:
+            return self.transport.evict_idle(max_idle)
+        return 0
+
+
+    def close(self):
+        with self._lock:
+            f, self._file = self._file, None
+        if f is not None:
+            f.close()
+
+
+    def _record(self, url, body, headers):
+        key = request_key(body, self.ignored_params)
+        start = time.time()
+        try:
+            data = self.transport.post(url, body, headers)
+        except TransportError as e:
+            self._add({'k' : key, 'd' : round(time.time() - start, 6), 'e' : [e.status, e.reason, e.body]})
+            raise
+
+        self._add({'k' : key, 'd' : round(time.time() - start, 6)}, data)
+        return data
+
+
+    def _add(self, entry, data = None):
+        # Entries are numbered in the order they're written, which is what 'ref' refers to.
+        with self._lock:
+            if data is not None:
+                ref = self._bodies.get(data)
+                if ref is None:
+                    self._bodies[data] = self.recorded
+                    entry['r'] = data
+                else:
+                    entry['ref'] = ref
+
+            self._write(entry)
+            self.recorded += 1
+
+
+    def _replay(self, url, body):
+        key = request_key(body, self.ignored_params)
+        with self._lock:
+            entries = self._entries.get(key)
+            if not entries:
+                self.misses += 1
+                raise CassetteMissError(self.path, key)
+
+            pos = self._cursors.get(key, 0)
+            self._cursors[key] = pos + 1
+            entry = entries[min(pos, len(entries) - 1)]
+            self.replayed += 1
+
+        if self.replay_timing and entry['d'] > 0:
+            time.sleep(entry['d'] / self.speed)
+
+        if 'e' in entry:
+            status, reason, data = entry['e']
+            raise TransportError(url, status, reason, data)
+
+        return entry['r']
+
+
+    def _load(self):
+        self._entries = {}
+        self._cursors = {}
+
+        f = self._open('r')
+        try:
+            header = json.loads(f.readline())
+            if header.get('version') != CASSETTE_VERSION:
+                raise ValueError('Unsupported cassette version in %s' % (self.path))
+
+            bodies = []
+            for line in f:
+                entry = json.loads(line)
+                if 'ref' in entry:
+                    entry['r'] = bodies[entry.pop('ref')]
+                bodies.append(entry.get('r'))
+                self._entries.setdefault(entry.pop('k'), []).append(entry)
+        finally:
+            f.close()
+
+
+    def _open(self, mode):
+        if self.path.endswith('.gz'):
+            return gzip.open(self.path, mode + 'b')
+        return open(self.path, mode)
+
+
+    def _write(self, record):
+        self._file.write(json.dumps(record, separators = (',',':')) + '\n')
+        self._file.flush()
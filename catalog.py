@@ -0,0 +1,366 @@
+import os
+import json
+import time
+import bisect
+import threading
+
+
+# Seconds after which a cached catalog is refetched. These catalogs
+# change rarely - new kernels and distributions are added maybe once a month.
+DEFAULT_TTLS = {
+    'avail.datacenters' : 24 * 3600,
+    'avail.distributions' : 6 * 3600,
+    'avail.kernels' : 6 * 3600,
+    'avail.linodeplans' : 6 * 3600,
+
+    # Images are account state, and change when we imagize or delete disks.
+    # linode_api invalidates this on its own image mutations.
+    'image.list' : 60
+}
+
+DEFAULT_TTL = 3600
+
+# How each catalog is indexed: (ID key, [name keys], substring key or None).
+# Name keys are matched case insensitively. The substring key is used for 
+# partial matches, like kernel labels in find_kernel.
+DEFAULT_INDEXES = {
+    'avail.datacenters' : ('DATACENTERID', ['LOCATION', 'ABBR'], None),
+    'avail.distributions' : ('DISTRIBUTIONID', ['LABEL'], None),
+    'avail.kernels' : ('KERNELID', ['LABEL'], 'LABEL'),
+    'avail.linodeplans' : ('PLANID', ['LABEL'], None),
+    'image.list' : ('IMAGEID', ['LABEL'], None)
+}
+
+
+class CatalogEntry(object):
+    def __init__(self, data, fetched_at):
+        self.data = data
+        self.fetched_at = fetched_at
+        self.index = None
+
+
+
+class CatalogIndex(object):
+    '''
+    Lookup tables over the records of a catalog, built once per fetched copy.
+
+    Where several records match, the one that comes first in the catalog wins,
+    same as a linear scan would.
+    '''
+
+    # Max number of memoized substring queries.
+    MAX_MEMO = 1024
+
+    def __init__(self, records, id_key, name_keys = None, substring_key = None):
+        self.records = records
+        self.by_id = {}
+        self.by_name = {}
+
+        for r in records:
+            self.by_id.setdefault(r[id_key], r)
+            for key in name_keys or []:
+                self.by_name.setdefault(r[key].lower(), r)
+
+        # Sorted suffixes of all lowercased labels, with the position of their
+        # record. All labels containing a string are found by binary search for
+        # the suffixes that start with it.
+        self._suffixes = None
+        self._positions = None
+        self._memo = {}
+        if substring_key:
+            suffixes = []
+            for pos, r in enumerate(records):
+                label = r[substring_key].lower()
+                for i in range(len(label)):
+                    suffixes.append( (label[i:], pos) )
+            suffixes.sort()
+            self._suffixes = [suffix for suffix, pos in suffixes]
+            self._positions = [pos for suffix, pos in suffixes]
+
+
+    def find(self, key):
+        '''
+        Returns the record whose ID is `key` if it's numeric, else the record
+        with a name that matches `key`. None if there's no such record.
+        '''
+        if str(key).isdigit():
+            return self.by_id.get(int(key))
+
+        return self.by_name.get(key.lower())
+
+
+    def find_substring(self, text):
+        '''
+        Returns the first record whose substring key contains `text`, or None.
+        '''
+        text = text.lower()
+        if text in self._memo:
+            return self._memo[text]
+
+        first = None
+        i = bisect.bisect_left(self._suffixes, text)
+        while i < len(self._suffixes) and self._suffixes[i].startswith(text):
+            if first is None or self._positions[i] < first:
+                first = self._positions[i]
+            i += 1
+
+        if first is None and text == '':
+            first = 0 if self.records else None
+
+        record = self.records[first] if first is not None else None
+
+        if len(self._memo) >= self.MAX_MEMO:
+            self._memo.clear()
+        self._memo[text] = record
+        return record
+
+
+
+class CatalogCache(object):
+    '''
+    Caches the DATA of read-only catalog actions such as avail.kernels.
+
+    - Each action has its own TTL.
+    - Fetched catalogs are optionally persisted to a snapshot file, so that a new
+      process starts with warm catalogs instead of refetching them.
+    - Catalogs can be refreshed in the background before they expire, so that
+      callers never wait for a fetch.
+    - Concurrent callers asking for the same expired catalog cause only one fetch.
+    '''
+
+    def __init__(self, fetch, ttls = None, snapshot_file = None, namespace = None, indexes = None):
+        '''
+        Args:
+            - fetch : A function that takes an action name and returns the DATA of its response.
+            - ttls : dict of action -> TTL seconds. Defaults to DEFAULT_TTLS.
+            - snapshot_file : Optional path of a JSON file to persist catalogs in.
+            - namespace : Identifies the API endpoint the catalogs come from, usually
+                the API URL. Snapshot entries from a different namespace are ignored.
+            - indexes : dict of action -> (ID key, [name keys], substring key) used by 
+                :meth:`index`. Defaults to DEFAULT_INDEXES.
+        '''
+        self.fetch = fetch
+        self.ttls = dict(DEFAULT_TTLS)
+        if ttls:
+            self.ttls.update(ttls)
+        self.snapshot_file = snapshot_file
+        self.namespace = namespace
+        self.indexes = dict(DEFAULT_INDEXES)
+        if indexes:
+            self.indexes.update(indexes)
+
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._fetch_locks = {}
+
+        self._refresher = None
+        self._stop_refresh = threading.Event()
+
+        self.hits = 0
+        self.misses = 0
+
+        if snapshot_file:
+            self.load_snapshot()
+
+
+    def get(self, action):
+        '''
+        Returns the cached DATA of `action`, fetching it if missing or expired.
+        '''
+        return self._get_entry(action).data
+
+
+    def index(self, action):
+        '''
+        Returns a :class:`CatalogIndex` over the cached DATA of `action`. The index
+        is built once per fetched copy of the catalog.
+        '''
+        entry = self._get_entry(action)
+        if entry.index is None:
+            id_key, name_keys, substring_key = self.indexes[action]
+            # Two threads may build it at the same time. Both results are identical.
+            entry.index = CatalogIndex(entry.data, id_key, name_keys, substring_key)
+
+        return entry.index
+
+
+    def refresh(self, action):
+        '''
+        Fetch `action` now and replace its cached copy.
+        '''
+        with self._fetch_lock(action):
+            return self._refresh(action).data
+
+
+    def _get_entry(self, action):
+        entry = self._valid_entry(action)
+        if entry is not None:
+            return entry
+
+        with self._fetch_lock(action):
+            # Another thread may have fetched it while we waited for the lock.
+            entry = self._valid_entry(action)
+            if entry is not None:
+                return entry
+
+            with self._lock:
+                self.misses += 1
+            return self._refresh(action)
+
+
+    def invalidate(self, action = None):
+        '''
+        Drop the cached copy of `action`, or of all catalogs if `action` is None.
+        The snapshot file is updated too.
+        '''
+        with self._lock:
+            if action is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(action, None)
+
+        if self.snapshot_file and (action is None or action.startswith('avail.')):
+            self.save_snapshot()
+
+
+    def ttl(self, action):
+        return self.ttls.get(action, DEFAULT_TTL)
+
+
+    def age(self, action):
+        '''
+        Seconds since `action` was fetched, or None if it's not cached.
+        '''
+        with self._lock:
+            entry = self._entries.get(action)
+        if entry is None:
+            return None
+        return time.time() - entry.fetched_at
+
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits' : self.hits,
+                'misses' : self.misses,
+                'cached' : sorted(self._entries.keys())
+            }
+
+
+    def start_background_refresh(self, interval = 60, refresh_ahead = 0.8):
+        '''
+        Start a daemon thread that wakes up every `interval` seconds and refetches
+        cached catalogs whose age has crossed `refresh_ahead` fraction of their TTL.
+        '''
+        if self._refresher is not None:
+            return
+
+        self._stop_refresh.clear()
+
+        def refresher():
+            while not self._stop_refresh.wait(interval):
+                with self._lock:
+                    actions = self._entries.keys()
+
+                for action in actions:
+                    age = self.age(action)
+                    if age is not None and age >= refresh_ahead * self.ttl(action):
+                        try:
+                            self.refresh(action)
+                        except Exception:
+                            # Keep serving the old copy. It'll be refetched on
+                            # demand once it expires.
+                            pass
+
+        self._refresher = threading.Thread(target = refresher, name = 'catalog-refresher')
+        self._refresher.daemon = True
+        self._refresher.start()
+
+
+    def stop_background_refresh(self):
+        if self._refresher is None:
+            return
+        self._stop_refresh.set()
+        self._refresher.join()
+        self._refresher = None
+
+
+    def load_snapshot(self):
+        '''
+        Load catalogs persisted by a previous process. Expired entries are loaded too;
+        they're refetched on first use but serve as a fallback if that fetch fails.
+        '''
+        try:
+            with open(self.snapshot_file, 'r') as f:
+                snapshot = json.load(f)
+        except (IOError, ValueError):
+            return
+
+        if snapshot.get('namespace') != self.namespace:
+            return
+
+        with self._lock:
+            for action, e in snapshot.get('catalogs', {}).items():
+                if action not in self._entries:
+                    self._entries[action] = CatalogEntry(e['data'], e['fetched_at'])
+
+
+    def save_snapshot(self):
+        # Only the avail.* catalogs are persisted. Others, like image.list, 
+        # are account state and are only cached for the life of the process.
+        with self._lock:
+            snapshot = {
+                'namespace' : self.namespace,
+                'catalogs' : dict([(action, {'fetched_at' : e.fetched_at, 'data' : e.data})
+                    for action, e in self._entries.items() if action.startswith('avail.')])
+            }
+
+        # Write to a temporary file and rename, so that other processes never
+        # see a partially written snapshot.
+        tmp_file = '%s.%d.tmp' % (self.snapshot_file, os.getpid())
+        try:
+            with open(tmp_file, 'w') as f:
+                json.dump(snapshot, f)
+            os.rename(tmp_file, self.snapshot_file)
+        except (IOError, OSError):
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+
+
+    def _valid_entry(self, action):
+        with self._lock:
+            entry = self._entries.get(action)
+            if entry is not None and time.time() - entry.fetched_at < self.ttl(action):
+                self.hits += 1
+                return entry
+        return None
+
+
+    def _fetch_lock(self, action):
+        with self._lock:
+            lock = self._fetch_locks.get(action)
+            if lock is None:
+                lock = self._fetch_locks[action] = threading.Lock()
+        return lock
+
+
+    def _refresh(self, action):
+        # Caller must hold the fetch lock of the action.
+        try:
+            data = self.fetch(action)
+        except Exception:
+            with self._lock:
+                stale = self._entries.get(action)
+            if stale is None:
+                raise
+            # Serve the expired copy rather than failing.
+            return stale
+
+        entry = CatalogEntry(data, time.time())
+        with self._lock:
+            self._entries[action] = entry
+
+        if self.snapshot_file and action.startswith('avail.'):
+            self.save_snapshot()
+
+        return entry
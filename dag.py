@@ -0,0 +1,146 @@
+import sys
+import time
+import Queue
+import threading
+import collections
+
+
+class StepGraph(object):
+    '''
+    A set of steps with dependencies, executed with as much overlap as the
+    dependencies allow: each step starts on its own thread as soon as all the
+    steps it depends on have finished.
+
+    After a run, :meth:`critical_path` tells which chain of steps the run's
+    duration was spent on.
+
+    Example:
+        graph = StepGraph()
+        graph.add('create', lambda results: create())
+        graph.add('disk', lambda results: create_disk(results['create']), ['create'])
+        graph.add('ip', lambda results: add_ip(results['create']), ['create'])
+        graph.add('boot', lambda results: boot(results['create']), ['disk', 'ip'])
+        results = graph.run()
+    '''
+
+    def __init__(self):
+        self._steps = collections.OrderedDict()     # name -> (func, dependencies)
+        self.results = {}
+        self.timings = {}                           # name -> (start, end)
+
+
+    def add(self, name, func, dependencies = ()):
+        '''
+        Args:
+            - name : Unique name of the step.
+            - func : Called as func(results), where results is a dict of step name -> return
+                value of the steps that have finished. Steps fail by raising.
+            - dependencies : Names of the steps that must finish before this one starts.
+                They must have been added already.
+        '''
+        if name in self._steps:
+            raise ValueError('Duplicate step %s' % (name))
+        for dependency in dependencies:
+            if dependency not in self._steps:
+                raise ValueError('Step %s depends on unknown step %s' % (name, dependency))
+
+        self._steps[name] = (func, tuple(dependencies))
+
+
+    def run(self, completed = None):
+        '''
+        Execute all steps. If a step raises, no more steps are started, and once
+        the running ones finish the first exception is re-raised.
+
+        Args:
+            - completed : Optional dict of step name -> result of steps that already
+                finished in an earlier run, such as one that was interrupted. They
+                aren't run again.
+
+        Returns:
+            A dict of step name -> return value.
+        '''
+        completed = completed or {}
+        self.results.update(completed)
+
+        done = Queue.Queue()
+        waiting = collections.OrderedDict([(name, set(deps) - set(completed.keys()))
+            for name, (func, deps) in self._steps.items() if name not in completed])
+        running = 0
+        failure = None
+
+        while True:
+            if failure is None:
+                ready = [name for name, deps in waiting.items() if not deps]
+                for name in ready:
+                    del waiting[name]
+                    self._start(name, done)
+                    running += 1
+
+            if running == 0:
+                break
+
+            name, exc_info = done.get()
+            running -= 1
+            if exc_info is not None:
+                if failure is None:
+                    failure = exc_info
+                continue
+
+            for deps in waiting.values():
+                deps.discard(name)
+
+        if failure is not None:
+            raise failure[0], failure[1], failure[2]
+
+        return self.results
+
+
+    def critical_path(self):
+        '''
+        Returns the chain of steps that determined the duration of the last run, as a
+        list of (name, seconds) tuples from first to last. Starting from the step that
+        finished last, each step is preceded by whichever of its dependencies finished last.
+        '''
+        if not self.timings:
+            return []
+
+        path = []
+        name = max(self.timings.keys(), key = lambda n: self.timings[n][1])
+        while name is not None:
+            start, end = self.timings[name]
+            path.append( (name, end - start) )
+            deps = [d for d in self._steps[name][1] if d in self.timings]
+            name = max(deps, key = lambda d: self.timings[d][1]) if deps else None
+
+        path.reverse()
+        return path
+
+
+    def _start(self, name, done):
+        func = self._steps[name][0]
+        # Steps only see results of finished steps, which are never modified again.
+        results = dict(self.results)
+
+        def run_step():
+            start = time.time()
+            try:
+                self.results[name] = func(results)
+                exc_info = None
+            except Exception:
+                exc_info = sys.exc_info()
+            self.timings[name] = (start, time.time())
+            done.put( (name, exc_info) )
+
+        t = threading.Thread(target = run_step, name = 'step-%s' % (name))
+        t.daemon = True
+        t.start()
+
+
+
+def format_path(path):
+    '''
+    Formats a critical path as 'step 1.20s -> step 3.40s = 4.60s'.
+    '''
+    return '%s = %.2fs' % (' -> '.join(['%s %.2fs' % (name, seconds) for name, seconds in path]),
+        sum([seconds for name, seconds in path]))
@@ -1,2 +1,35 @@
 class CreationError(Exception):
     pass
+
+
+class TransportError(Exception):
+    def __init__(self, url, status, reason, body = None):
+        Exception.__init__(self, 'HTTP %s %s from %s' % (status, reason, url))
+        self.url = url
+        self.status = status
+        self.reason = reason
+        self.body = body
+
+
+class ApiError(Exception):
+    def __init__(self, action, errors):
+        Exception.__init__(self, '%s failed: %s' % (action, errors))
+        self.action = action
+        self.errors = errors
+
+
+class ConfigError(Exception):
+    pass
+
+
+class CassetteMissError(Exception):
+    def __init__(self, path, key):
+        Exception.__init__(self, 'No recorded response in %s for %s' % (path, key))
+        self.path = path
+        self.key = key
+
+
+class PlanError(Exception):
+    def __init__(self, errors):
+        Exception.__init__(self, 'Invalid linode spec: %s' % ('; '.join(errors)))
+        self.errors = errors
@@ -0,0 +1,355 @@
+import array
+import socket
+import struct
+import fnmatch
+import collections
+from json.encoder import encode_basestring_ascii
+
+from linode_core import Linode
+
+
+# Column values standing for None. Linode IDs, datacenter and plan IDs and RAM are
+# never 0, and neither is a linode's IP address.
+NO_STATUS = -128
+
+
+def pack_ip(address):
+    '''
+    Returns the IPv4 `address` as an int, or 0 if it's None.
+    '''
+    if address is None:
+        return 0
+    try:
+        return struct.unpack('!I', socket.inet_aton(address))[0]
+    except socket.error:
+        raise ValueError('Not an IPv4 address: %s' % (address))
+
+
+def unpack_ip(packed):
+    '''
+    Returns the address of an IPv4 packed by :func:`pack_ip`, or None for 0.
+    '''
+    if not packed:
+        return None
+    return socket.inet_ntoa(struct.pack('!I', packed))
+
+
+
+class Fleet(object):
+    '''
+    Columnar store of many linodes, for fleets where a :class:`linode_core.Linode`
+    per linode costs too much memory or is too slow to scan and serialize.
+
+    Each attribute is a column: IDs, datacenter and plan IDs, RAM and status are
+    arrays of machine ints, IP addresses are arrays of IPv4 addresses packed into
+    ints, display groups are stored once and referred to by code, and only labels
+    are a list of strings. Only the first public IP of a linode is kept.
+
+    Rows are addressed by position. :meth:`filter` and the lookups work on the
+    columns directly, and :meth:`iter_json` encodes rows without building a
+    dict per linode.
+
+    Example:
+        fleet = Fleet.from_inventory(client.inventory)
+        web = fleet.filter(group = 'web', status = lin.STATUS_RUNNING)
+        web.write_ndjson(f)
+    '''
+
+    def __init__(self, linodes = ()):
+        '''
+        Args:
+            - linodes : Optional iterable of :class:`linode_core.Linode` to start with.
+        '''
+        self.ids = array.array('l')
+        self.labels = []
+        self.datacenter_ids = array.array('i')
+        self.plan_ids = array.array('i')
+        self.ram_mb = array.array('l')
+        self.status = array.array('b')
+        self.public_ips = array.array('I')
+        self.private_ips = array.array('I')
+
+        self._group_codes = array.array('H')
+        self._group_names = []          # code -> display group
+        self._group_index = {}          # display group -> code
+
+        self._rows = {}                 # linode ID -> row
+        self._ip_rows = None            # packed IP -> row, built on first lookup
+
+        self.extend(linodes)
+
+
+    @classmethod
+    def from_nodes(cls, nodes, ips = ()):
+        '''
+        Returns a Fleet of linode.list records, and optionally the linode.ip.list
+        records of their IPs.
+        '''
+        fleet = cls()
+        public = {}
+        private = {}
+        for ip in ips:
+            addresses = public if ip['ISPUBLIC'] else private
+            addresses.setdefault(ip['LINODEID'], ip['IPADDRESS'])
+
+        for node in nodes:
+            linode_id = node['LINODEID']
+            fleet.add(linode_id, node.get('LABEL'), node.get('LPM_DISPLAYGROUP'), node.get('DATACENTERID'),
+                node.get('PLANID'), node.get('TOTALRAM'), node.get('STATUS'),
+                public.get(linode_id), private.get(linode_id))
+        return fleet
+
+
+    @classmethod
+    def from_inventory(cls, inventory):
+        '''
+        Returns a Fleet of the linodes of an :class:`inventory.Inventory`.
+        '''
+        nodes = inventory.nodes()
+        ips = []
+        for node in nodes:
+            ips.extend(inventory.ips(node['LINODEID']))
+        return cls.from_nodes(nodes, ips)
+
+
+    #=============================================================
+    # Rows
+
+    def add(self, linode_id, label = None, group = None, datacenter_id = None, plan_id = None,
+        ram_mb = None, status = None, public_ip = None, private_ip = None):
+        '''
+        Append a linode. Returns its row.
+        '''
+        if linode_id in self._rows:
+            raise ValueError('Duplicate linode %s' % (linode_id))
+
+        code = self._group_index.get(group)
+        if code is None:
+            code = self._group_index[group] = len(self._group_names)
+            self._group_names.append(group)
+
+        row = len(self.ids)
+        self.ids.append(linode_id)
+        self.labels.append(label)
+        self._group_codes.append(code)
+        self.datacenter_ids.append(datacenter_id or 0)
+        self.plan_ids.append(plan_id or 0)
+        self.ram_mb.append(ram_mb or 0)
+        self.status.append(status if status is not None else NO_STATUS)
+        self.public_ips.append(pack_ip(public_ip))
+        self.private_ips.append(pack_ip(private_ip))
+
+        self._rows[linode_id] = row
+        self._ip_rows = None
+        return row
+
+
+    def append(self, linode):
+        '''
+        Append a :class:`linode_core.Linode`. Returns its row.
+        '''
+        return self.add(linode.id, linode.label, linode.group, linode.datacenter_id, linode.plan_id,
+            linode.ram_mb, linode.status, linode.public_ip[0] if linode.public_ip else None,
+            linode.private_ip)
+
+
+    def extend(self, linodes):
+        for linode in linodes:
+            self.append(linode)
+
+
+    def __len__(self):
+        return len(self.ids)
+
+
+    def __getitem__(self, row):
+        '''
+        Returns the linode at `row` as a :class:`linode_core.Linode`.
+        '''
+        public_ip = unpack_ip(self.public_ips[row])
+        status = self.status[row]
+        linode = Linode(self.ids[row], self.labels[row], self.group(row), self.datacenter_ids[row] or None,
+            self.plan_ids[row] or None, self.ram_mb[row] or None, status if status != NO_STATUS else None,
+            unpack_ip(self.private_ips[row]), [public_ip] if public_ip else [])
+        linode.created = True
+        linode.inited = True
+        return linode
+
+
+    def __iter__(self):
+        for row in xrange(len(self.ids)):
+            yield self[row]
+
+
+    def group(self, row):
+        return self._group_names[self._group_codes[row]]
+
+
+    def take(self, rows):
+        '''
+        Returns a new Fleet of the linodes at `rows`.
+        '''
+        rows = list(rows)
+        fleet = Fleet()
+        # Columns are copied as they are. Group codes stay valid since the group names are shared.
+        fleet.ids.extend([self.ids[row] for row in rows])
+        fleet.labels = [self.labels[row] for row in rows]
+        fleet.datacenter_ids.extend([self.datacenter_ids[row] for row in rows])
+        fleet.plan_ids.extend([self.plan_ids[row] for row in rows])
+        fleet.ram_mb.extend([self.ram_mb[row] for row in rows])
+        fleet.status.extend([self.status[row] for row in rows])
+        fleet.public_ips.extend([self.public_ips[row] for row in rows])
+        fleet.private_ips.extend([self.private_ips[row] for row in rows])
+        fleet._group_codes.extend([self._group_codes[row] for row in rows])
+        fleet._group_names = list(self._group_names)
+        fleet._group_index = dict(self._group_index)
+        fleet._rows = dict(zip(fleet.ids, xrange(len(rows))))
+        return fleet
+
+
+    #=============================================================
+    # Lookups
+
+    def row(self, linode_id):
+        '''
+        Returns the row of `linode_id`, or None.
+        '''
+        return self._rows.get(linode_id)
+
+
+    def rows(self, linode_ids):
+        '''
+        Returns the rows of a list of linode IDs, with None for those not in the fleet.
+        '''
+        get = self._rows.get
+        return [get(linode_id) for linode_id in linode_ids]
+
+
+    def ids_by_ip(self, addresses):
+        '''
+        Returns the linode IDs of a list of public or private IP addresses, with None
+        for those of no linode in the fleet.
+        '''
+        if self._ip_rows is None:
+            ip_rows = dict(zip(self.private_ips, xrange(len(self.ids))))
+            ip_rows.update(zip(self.public_ips, xrange(len(self.ids))))
+            ip_rows.pop(0, None)
+            self._ip_rows = ip_rows
+
+        get = self._ip_rows.get
+        ids = self.ids
+        result = []
+        for address in addresses:
+            row = get(pack_ip(address))
+            result.append(ids[row] if row is not None else None)
+        return result
+
+
+    def filter(self, group = None, status = None, datacenter_id = None, plan_id = None,
+        min_ram_mb = None, label = None):
+        '''
+        Returns a new Fleet of the linodes matching all the given criteria.
+
+        Args:
+            - group : Display group.
+            - status : linode.list STATUS.
+            - datacenter_id, plan_id : Datacenter and plan IDs.
+            - min_ram_mb : Minimum RAM.
+            - label : fnmatch pattern of labels, case sensitive.
+        '''
+        return self.take(self.select(group, status, datacenter_id, plan_id, min_ram_mb, label))
+
+
+    def select(self, group = None, status = None, datacenter_id = None, plan_id = None,
+        min_ram_mb = None, label = None):
+        '''
+        Like :meth:`filter`, but returns the matching rows.
+        '''
+        rows = xrange(len(self.ids))
+
+        # Each criterion scans one column, and only the rows still matching.
+        if group is not None:
+            code = self._group_index.get(group)
+            codes = self._group_codes
+            rows = [row for row in rows if codes[row] == code] if code is not None else []
+        if status is not None:
+            column = self.status
+            rows = [row for row in rows if column[row] == status]
+        if datacenter_id is not None:
+            column = self.datacenter_ids
+            rows = [row for row in rows if column[row] == datacenter_id]
+        if plan_id is not None:
+            column = self.plan_ids
+            rows = [row for row in rows if column[row] == plan_id]
+        if min_ram_mb is not None:
+            column = self.ram_mb
+            rows = [row for row in rows if column[row] >= min_ram_mb]
+        if label is not None:
+            labels = self.labels
+            rows = [row for row in rows if labels[row] is not None and fnmatch.fnmatchcase(labels[row], label)]
+
+        return list(rows)
+
+
+    def stats(self):
+        status = collections.Counter(self.status)
+        if NO_STATUS in status:
+            status[None] = status.pop(NO_STATUS)
+        return {
+            'linodes' : len(self.ids),
+            'groups' : len(self._group_names),
+            'ram_mb' : sum(self.ram_mb),
+            'status' : dict(status)
+        }
+
+
+    #=============================================================
+    # JSON
+
+    def iter_json(self):
+        '''
+        Yields the JSON object of each linode, with the keys of :meth:`linode_core.Linode.to_dict`
+        the fleet has.
+        '''
+        groups = [encode_basestring_ascii(group) if group is not None else 'null' for group in self._group_names]
+        group_codes = self._group_codes
+        labels = self.labels
+        ip_cache = {0 : 'null'}
+
+        def encode_ip(packed):
+            encoded = ip_cache.get(packed)
+            if encoded is None:
+                encoded = ip_cache[packed] = '"%s"' % (unpack_ip(packed))
+            return encoded
+
+        for row, linode_id in enumerate(self.ids):
+            label = labels[row]
+            status = self.status[row]
+            public_ip = self.public_ips[row]
+            yield ('{"id":%d,"label":%s,"group":%s,"datacenter_id":%s,"plan_id":%s,"ram_mb":%s,'
+                '"status":%s,"private_ip":%s,"public_ip":%s}') % (
+                linode_id,
+                encode_basestring_ascii(label) if label is not None else 'null',
+                groups[group_codes[row]],
+                self.datacenter_ids[row] or 'null',
+                self.plan_ids[row] or 'null',
+                self.ram_mb[row] or 'null',
+                status if status != NO_STATUS else 'null',
+                encode_ip(self.private_ips[row]),
+                '[%s]' % (encode_ip(public_ip)) if public_ip else '[]')
+
+
+    def to_json(self):
+        '''
+        Returns the fleet as a JSON array of objects.
+        '''
+        return '[' + ','.join(self.iter_json()) + ']'
+
+
+    def write_ndjson(self, f):
+        '''
+        Writes the fleet to file object `f`, one JSON object per line.
+        '''
+        for line in self.iter_json():
+            f.write(line)
+            f.write('\n')
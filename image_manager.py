@@ -36,15 +36,17 @@ class ImageManager(object):
     
     '''
     
-    def __init__(self, app_ctx):
+    def __init__(self, app_ctx, client = None):
         '''
         Create an image manager object.
         
         Args:
             - app_ctx : Application definied settings such as the configuration directory to use.
+            - client : The :class:`linode_api.LinodeClient` to use. Defaults to the default client.
         '''
         assert type(app_ctx) is dict and app_ctx.get('conf-dir')
         self.app_ctx = app_ctx
+        self.client = client
         
         
         
@@ -57,7 +59,7 @@ class ImageManager(object):
         assert image is not None
         
         if image.provider == 'linode':
-            linode_provider = LinodeImageProvider(self.app_ctx)
+            linode_provider = LinodeImageProvider(self.app_ctx, self.client)
             linode_provider.create_image(image, provisioner, delete_on_error)
             
         else:
@@ -72,7 +74,7 @@ class ImageManager(object):
             return (False, None, ['No such image %s' % (image_label)])
         
         if image.provider == 'linode':
-            linode_provider = LinodeImageProvider(self.app_ctx)
+            linode_provider = LinodeImageProvider(self.app_ctx, self.client)
             success, disk_details, errors = linode_provider.create_disk_from_image(image, disk_spec)
             return (success, disk_details, errors)
             
@@ -130,8 +132,9 @@ class Image(object):
         
 class LinodeImageProvider(object):
     
-    def __init__(self, app_ctx):
+    def __init__(self, app_ctx, client = None):
         self.app_ctx = app_ctx
+        self.client = client if client is not None else lin.default_client()
         self.image_conf_dir = os.path.join(self.app_ctx.get('conf-dir'), 'images')
         
         
@@ -180,7 +183,7 @@ class LinodeImageProvider(object):
 
         }
         
-        core = linode_core.Core(self.app_ctx)
+        core = linode_core.Core(self.app_ctx, self.client)
         
         temp_linode = None
 
@@ -213,19 +216,19 @@ class LinodeImageProvider(object):
             
             # Shutdown the linode
             logger.msg('Shutting down')
-            shutdown, job_id, errors = lin.shutdown_node(temp_linode.id)
+            shutdown, job_id, errors = self.client.shutdown_node(temp_linode.id)
             if not shutdown:
                 logger.error_msg('Shutdown failed. Deleting.' + errors)
                 raise CreationError()
                 
-            finished, success = core.wait_for_job(temp_linode.id, job_id)
+            finished, success = core.wait_for_job(temp_linode.id, job_id, 'linode.shutdown')
             if not success:
                 logger.error_msg('Shutdown failed. Deleting')
                 raise CreationError()
             
             # Imagize the disk
             logger.msg('Imaging')
-            success, image_id, job_id, errors = lin.create_diskimage(temp_linode.id, 
+            success, image_id, job_id, errors = self.client.create_diskimage(temp_linode.id, 
                 temp_linode.boot_disk_id, 
                 '%s' % (image.label))
             
@@ -233,7 +236,7 @@ class LinodeImageProvider(object):
                 logger.error_msg('Imaging failed. ' + errors)
                 raise CreationError()
                 
-            finished, success = core.wait_for_job(temp_linode.id, job_id)
+            finished, success = core.wait_for_job(temp_linode.id, job_id, 'linode.disk.imagize')
             if not success:
                 logger.error_msg('Imaging failed')
                 raise CreationError()
@@ -252,9 +255,12 @@ class LinodeImageProvider(object):
                 
                 # If there's an error delete the image because we won't get the image ID again.
                 if image_id is not None:
-                    deleted, _, errors = lin.delete_image(image_id)
+                    deleted, _, errors = self.client.delete_image(image_id)
                     if not deleted:
-                        logger.warn_msg('Warning: Unable to delete image. Please delete from Linode Manager. ' + errors)
+                        if core.reaper is not None:
+                            core.reaper.track_image(image_id, 'Failed imaging:%s' % (errors))
+                        else:
+                            logger.warn_msg('Warning: Unable to delete image. Please delete from Linode Manager. ' + str(errors))
                     
                 # Delete the image folder too.
                 os.rmdir(image_dir)
@@ -266,9 +272,12 @@ class LinodeImageProvider(object):
             if delete_on_error:
                 if temp_linode:
                     logger.msg('Deleting temporary node created for imaging')
-                    deleted, _, errors = lin.delete_node(temp_linode.id, True)
+                    deleted, _, errors = self.client.delete_node(temp_linode.id, True)
                     if not deleted:
-                        logger.warn_msg('Warning: Unable to delete node. Please delete from Linode Manager.' + errors)
+                        if core.reaper is not None:
+                            core.reaper.track_linode(temp_linode.id, 'Temporary imaging linode:%s' % (errors))
+                        else:
+                            logger.warn_msg('Warning: Unable to delete node. Please delete from Linode Manager.' + str(errors))
                 
         return ret
             
@@ -330,7 +339,7 @@ class LinodeImageProvider(object):
         
         # TODO Password and SSH key should be handled better. Read from
         # vault. SSH key should not be a file.
-        success, disk_id, job_id, errors = lin.create_disk_from_image(
+        success, disk_id, job_id, errors = self.client.create_disk_from_image(
             linode_id, 
             linode_image_id, 
             disk_spec['label'], 
@@ -342,8 +351,8 @@ class LinodeImageProvider(object):
             logger.error_msg('Create disk from linode image failed.' + errors)
             return (False, None, errors)
             
-        core = linode_core.Core(self.app_ctx)
-        finished, success = core.wait_for_job(linode_id, job_id)
+        core = linode_core.Core(self.app_ctx, self.client)
+        finished, success = core.wait_for_job(linode_id, job_id, 'linode.disk.createfromimage')
         if not success:
             logger.error_msg('Create disk from linode image failed.')
             return None
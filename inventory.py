@@ -0,0 +1,390 @@
+import time
+import threading
+
+
+class Inventory(object):
+    '''
+    Local mirror of the linodes of an account: linode.list, linode.ip.list,
+    linode.disk.list and linode.config.list, indexed by linode ID, label,
+    display group and IP address.
+
+    Lookups are answered from memory. The mirror is updated:
+
+    - Incrementally by :meth:`refresh`: linode.list and linode.ip.list are listed
+      in full, but disks and configs are only fetched for linodes that are new,
+      changed or marked dirty, all in batch requests.
+    - On the client's own mutations, which :class:`linode_api.LinodeClient` reports
+      with :meth:`on_mutation`. A mutated linode is marked dirty and resynced with
+      a single batch request the next time it's looked up. Deleted linodes are
+      dropped immediately.
+    - Periodically, with :meth:`start_background_refresh`.
+
+    Returned records are shared with the mirror and must not be modified.
+    '''
+
+    def __init__(self, client):
+        '''
+        Args:
+            - client : The :class:`linode_api.LinodeClient` of the account.
+        '''
+        self.client = client
+
+        self._nodes = {}            # linode ID -> linode.list record
+        self._ips = {}              # linode ID -> [linode.ip.list records]
+        self._disks = {}            # linode ID -> [linode.disk.list records]
+        self._configs = {}          # linode ID -> [linode.config.list records]
+
+        self._by_label = {}         # lowercase label -> linode ID
+        self._by_group = {}         # display group -> set of linode IDs
+        self._by_ip = {}            # IP address -> linode ID
+
+        # linode ID -> mutation sequence number when it was marked dirty
+        self._dirty = {}
+        self._seq = 0
+        self._loaded = False
+
+        self._lock = threading.RLock()
+        self._refresh_lock = threading.RLock()
+        self._refresher = None
+        self._stop_refresh = threading.Event()
+
+        self.lookups = 0
+        self.refreshes = 0
+        self.linode_refreshes = 0
+        self.refreshed_at = None
+
+
+    #=============================================================
+    # Lookups
+
+    def node(self, linode_id):
+        '''
+        Returns the linode.list record of `linode_id`, or None.
+        '''
+        linode_id = int(linode_id)
+        self._check(linode_id)
+        with self._lock:
+            return self._nodes.get(linode_id)
+
+
+    def find(self, label):
+        '''
+        Returns the linode.list record of the linode with this label (case insensitive), or None.
+        '''
+        self._check()
+        with self._lock:
+            linode_id = self._by_label.get(label.lower())
+        if linode_id is None:
+            return None
+        return self.node(linode_id)
+
+
+    def group(self, display_group):
+        '''
+        Returns the linode.list records of the linodes in a display group, ordered by ID.
+        '''
+        self._check()
+        with self._lock:
+            ids = sorted(self._by_group.get(display_group, ()))
+        return [n for n in [self.node(i) for i in ids] if n is not None]
+
+
+    def node_by_ip(self, address):
+        '''
+        Returns the linode.list record of the linode that has this IP address, or None.
+        '''
+        self._check()
+        with self._lock:
+            linode_id = self._by_ip.get(address)
+        if linode_id is None:
+            return None
+        return self.node(linode_id)
+
+
+    def nodes(self):
+        self._check()
+        with self._lock:
+            ids = sorted(self._nodes.keys())
+        return [n for n in [self.node(i) for i in ids] if n is not None]
+
+
+    def ips(self, linode_id):
+        linode_id = int(linode_id)
+        self._check(linode_id)
+        with self._lock:
+            return list(self._ips.get(linode_id, []))
+
+
+    def public_ip(self, linode_id):
+        for ip in self.ips(linode_id):
+            if ip['ISPUBLIC'] == 1:
+                return ip['IPADDRESS']
+        return None
+
+
+    def private_ip(self, linode_id):
+        for ip in self.ips(linode_id):
+            if ip['ISPUBLIC'] == 0:
+                return ip['IPADDRESS']
+        return None
+
+
+    def memory(self, linode_id):
+        node = self.node(linode_id)
+        if node is None:
+            return None
+        return node['TOTALRAM']
+
+
+    def disks(self, linode_id):
+        linode_id = int(linode_id)
+        self._check(linode_id)
+        with self._lock:
+            return list(self._disks.get(linode_id, []))
+
+
+    def configs(self, linode_id):
+        linode_id = int(linode_id)
+        self._check(linode_id)
+        with self._lock:
+            return list(self._configs.get(linode_id, []))
+
+
+    def stats(self):
+        with self._lock:
+            return {
+                'linodes' : len(self._nodes),
+                'dirty' : len(self._dirty),
+                'lookups' : self.lookups,
+                'refreshes' : self.refreshes,
+                'linode_refreshes' : self.linode_refreshes,
+                'age' : None if self.refreshed_at is None else time.time() - self.refreshed_at
+            }
+
+
+    #=============================================================
+    # Updates
+
+    def on_mutation(self, action, params, resp):
+        '''
+        Called by the client after each request that may change account state.
+        '''
+        params = params or {}
+        linode_id = params.get('LinodeID')
+        errors = resp.get('ERRORARRAY') if isinstance(resp, dict) else None
+
+        if action == 'linode.create' and not errors:
+            linode_id = resp['DATA']['LinodeID']
+
+        if linode_id is None:
+            return
+
+        linode_id = int(linode_id)
+        with self._lock:
+            if action == 'linode.delete' and not errors:
+                self._remove(linode_id)
+                self._dirty.pop(linode_id, None)
+            else:
+                self._seq += 1
+                self._dirty[linode_id] = self._seq
+
+
+    def mark_dirty(self, linode_id = None):
+        '''
+        Resync `linode_id` on its next lookup. If `linode_id` is None, the whole
+        mirror is resynced on the next lookup.
+        '''
+        with self._lock:
+            if linode_id is None:
+                self._loaded = False
+            else:
+                self._seq += 1
+                self._dirty[int(linode_id)] = self._seq
+
+
+    def refresh(self, full = False):
+        '''
+        Resync the mirror with the account. Disks and configs are fetched only for
+        linodes that are new, changed or dirty, or for all linodes if `full` is True.
+        '''
+        with self._refresh_lock:
+            with self._lock:
+                start_seq = self._seq
+                previous = self._nodes
+                dirty = set(self._dirty.keys())
+                loaded = self._loaded
+
+            nodes = dict([(n['LINODEID'], n) for n in self.client.iter_nodes()])
+            ips = {}
+            for ip in self.client.iter_ip_addresses():
+                ips.setdefault(ip['LINODEID'], []).append(ip)
+
+            stale = [linode_id for linode_id, n in nodes.items()
+                if full or not loaded or linode_id in dirty or previous.get(linode_id) != n]
+            details = self._fetch_details(stale)
+
+            with self._lock:
+                for linode_id in set(self._nodes.keys()) - set(nodes.keys()):
+                    self._remove(linode_id)
+
+                for linode_id, node in nodes.items():
+                    self._put_node(node)
+                    self._put_ips(linode_id, ips.get(linode_id, []))
+                for linode_id, (disks, configs) in details.items():
+                    self._disks[linode_id] = disks
+                    self._configs[linode_id] = configs
+
+                self._clear_dirty(self._dirty.keys(), start_seq)
+                self._loaded = True
+                self.refreshes += 1
+                self.refreshed_at = time.time()
+
+
+    def refresh_linode(self, linode_id):
+        '''
+        Resync a single linode with one batch request.
+        '''
+        linode_id = int(linode_id)
+        with self._lock:
+            start_seq = self._seq
+
+        params = {'LinodeID' : linode_id}
+        node_resp, ip_resp, disk_resp, config_resp = self.client.batch_request([
+            ('linode.list', params),
+            ('linode.ip.list', params),
+            ('linode.disk.list', params),
+            ('linode.config.list', params)
+        ])
+
+        with self._lock:
+            self.linode_refreshes += 1
+            if node_resp.get('ERRORARRAY') or not node_resp.get('DATA'):
+                # It no longer exists.
+                self._remove(linode_id)
+            else:
+                self._put_node(node_resp['DATA'][0])
+                self._put_ips(linode_id, ip_resp.get('DATA') or [])
+                self._disks[linode_id] = disk_resp.get('DATA') or []
+                self._configs[linode_id] = config_resp.get('DATA') or []
+            self._clear_dirty([linode_id], start_seq)
+
+
+    def start_background_refresh(self, interval = 300):
+        '''
+        Start a daemon thread that calls :meth:`refresh` every `interval` seconds.
+        '''
+        if self._refresher is not None:
+            return
+
+        self._stop_refresh.clear()
+
+        def refresher():
+            while not self._stop_refresh.wait(interval):
+                try:
+                    self.refresh()
+                except Exception:
+                    # Keep serving the current mirror, and try again next time.
+                    pass
+
+        self._refresher = threading.Thread(target = refresher, name = 'inventory-refresher')
+        self._refresher.daemon = True
+        self._refresher.start()
+
+
+    def stop_background_refresh(self):
+        if self._refresher is None:
+            return
+        self._stop_refresh.set()
+        self._refresher.join()
+        self._refresher = None
+
+
+    def _check(self, linode_id = None):
+        # Loads the mirror on first use, and resyncs a dirty linode before it's returned.
+        with self._lock:
+            self.lookups += 1
+            loaded = self._loaded
+            refreshes = self.refreshes
+            dirty = linode_id is not None and linode_id in self._dirty
+
+        if not loaded:
+            self._load(refreshes)
+        elif dirty:
+            self.refresh_linode(linode_id)
+
+
+    def _load(self, refreshes):
+        # Loads a cold mirror. Of the callers that find it cold at once, only the
+        # first lists the account. The others wait for it, and find it loaded.
+        with self._refresh_lock:
+            with self._lock:
+                if self._loaded and self.refreshes != refreshes:
+                    return
+            self.refresh()
+
+
+    def _fetch_details(self, linode_ids):
+        requests = []
+        for linode_id in linode_ids:
+            requests.append( ('linode.disk.list', {'LinodeID' : linode_id}) )
+            requests.append( ('linode.config.list', {'LinodeID' : linode_id}) )
+
+        responses = self.client.batch_request(requests) if requests else []
+        details = {}
+        for i, linode_id in enumerate(linode_ids):
+            disk_resp, config_resp = responses[2 * i], responses[2 * i + 1]
+            details[linode_id] = (disk_resp.get('DATA') or [], config_resp.get('DATA') or [])
+        return details
+
+
+    # The following are called with self._lock held.
+
+    def _put_node(self, node):
+        linode_id = node['LINODEID']
+        old = self._nodes.get(linode_id)
+        if old is not None:
+            self._unindex_node(old)
+
+        self._nodes[linode_id] = node
+        self._by_label[(node.get('LABEL') or '').lower()] = linode_id
+        self._by_group.setdefault(node.get('LPM_DISPLAYGROUP') or '', set()).add(linode_id)
+
+
+    def _put_ips(self, linode_id, ips):
+        for ip in self._ips.get(linode_id, []):
+            if self._by_ip.get(ip['IPADDRESS']) == linode_id:
+                del self._by_ip[ip['IPADDRESS']]
+
+        self._ips[linode_id] = ips
+        for ip in ips:
+            self._by_ip[ip['IPADDRESS']] = linode_id
+
+
+    def _remove(self, linode_id):
+        node = self._nodes.pop(linode_id, None)
+        if node is not None:
+            self._unindex_node(node)
+        self._put_ips(linode_id, [])
+        for table in [self._ips, self._disks, self._configs]:
+            table.pop(linode_id, None)
+
+
+    def _unindex_node(self, node):
+        linode_id = node['LINODEID']
+        label = (node.get('LABEL') or '').lower()
+        if self._by_label.get(label) == linode_id:
+            del self._by_label[label]
+
+        group = node.get('LPM_DISPLAYGROUP') or ''
+        members = self._by_group.get(group)
+        if members is not None:
+            members.discard(linode_id)
+            if not members:
+                del self._by_group[group]
+
+
+    def _clear_dirty(self, linode_ids, start_seq):
+        # Linodes mutated after start_seq stay dirty.
+        for linode_id in list(linode_ids):
+            if self._dirty.get(linode_id, start_seq + 1) <= start_seq:
+                del self._dirty[linode_id]
@@ -0,0 +1,289 @@
+import sys
+import time
+import threading
+
+import linode_api as lin
+import ratelimit
+from async_api import Future
+from polling import PollPolicy
+
+
+class _Watch(object):
+    # One watched job. Slotted, since a watcher may track tens of thousands of them.
+    __slots__ = ('job_id', 'job_label', 'future', 'start', 'deadline', 'delays', 'next_check')
+
+    def __init__(self, job_id, job_label, start, deadline, delays):
+        self.job_id = job_id
+        self.job_label = job_label
+        self.future = Future()
+        self.start = start
+        self.deadline = deadline
+        self.delays = delays
+        self.next_check = start + next(delays)
+
+
+
+class JobWatcher(object):
+    '''
+    Waits for any number of jobs with a single thread.
+
+    Watched jobs are grouped by linode. Each poll checks all the jobs of a linode
+    with one linode.job.list, and the linodes due for a check are polled together
+    in batch requests, so 100 linodes with 4 jobs each take 4 HTTP requests per
+    poll instead of 400. When each job is checked follows the :class:`polling.PollPolicy`.
+
+    The poller thread is started when jobs are watched and exits when there are
+    none left. Finished jobs are forgotten, so memory is bounded by the jobs
+    being waited on.
+
+    Example:
+        watcher = JobWatcher(client)
+        futures = watcher.watch_all(linodes_jobs, 'linode.disk.create')
+        results = async_api.gather(futures)
+    '''
+
+    def __init__(self, client, poll_policy = None):
+        '''
+        Args:
+            - client : The :class:`linode_api.LinodeClient` the jobs belong to.
+            - poll_policy : Defaults to a new :class:`polling.PollPolicy`.
+        '''
+        self.client = client
+        self.poll_policy = poll_policy if poll_policy is not None else PollPolicy()
+
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._linodes = {}          # linode ID -> {job ID -> _Watch}
+        self._poller = None
+        self._closed = False
+
+        self.polls = 0              # Rounds of polling
+        self.checks = 0             # linode.job.list actions sent
+
+
+    def watch(self, linode_id, job_id, job_label = 'job', timeout = None, callback = None):
+        '''
+        Returns a :class:`async_api.Future` that resolves to (finished, success), with
+        the same values as :meth:`linode_core.Core.wait_for_job`, once the job finishes
+        or `timeout` seconds pass.
+
+        Args:
+            - job_label : Kind of job, for the poll policy and job metrics.
+            - timeout : Defaults to the poll policy's timeout for `job_label`.
+            - callback : Optional function called as callback(future) when it resolves.
+        '''
+        future = self.watch_all([(linode_id, job_id)], job_label, timeout)[0]
+        if callback is not None:
+            future.add_done_callback(callback)
+        return future
+
+
+    def watch_all(self, linodes_jobs, job_label = 'job', timeout = None):
+        '''
+        Like :meth:`watch`, for a list of (linode_id, job_id) tuples. Returns a list of
+        futures in the same order. Watching them all at once lets their first checks
+        share requests.
+        '''
+        if timeout is None:
+            timeout = self.poll_policy.timeout_for(job_label)
+
+        now = time.time()
+        futures = []
+        with self._lock:
+            if self._closed:
+                raise RuntimeError('Job watcher is closed')
+
+            for linode_id, job_id in linodes_jobs:
+                jobs = self._linodes.setdefault(linode_id, {})
+                watch = jobs.get(job_id)
+                if watch is None:
+                    watch = jobs[job_id] = _Watch(job_id, job_label, now, now + timeout,
+                        self.poll_policy.delays(job_label))
+                else:
+                    watch.deadline = max(watch.deadline, now + timeout)
+                futures.append(watch.future)
+
+            if self._poller is None:
+                self._poller = threading.Thread(target = self._poll, name = 'job-watcher')
+                self._poller.daemon = True
+                self._poller.start()
+            self._wakeup.notify()
+
+        return futures
+
+
+    def pending(self):
+        with self._lock:
+            return sum([len(jobs) for jobs in self._linodes.values()])
+
+
+    def stats(self):
+        with self._lock:
+            return {
+                'pending' : sum([len(jobs) for jobs in self._linodes.values()]),
+                'polls' : self.polls,
+                'checks' : self.checks
+            }
+
+
+    def close(self):
+        '''
+        Stop polling. Jobs still being watched are resolved as not finished.
+        '''
+        with self._lock:
+            self._closed = True
+            poller = self._poller
+            self._wakeup.notify()
+
+        if poller is not None:
+            poller.join()
+
+        with self._lock:
+            linodes, self._linodes = self._linodes, {}
+        for jobs in linodes.values():
+            for watch in jobs.values():
+                watch.future.set_result( (False, None) )
+
+
+    def _poll(self):
+        try:
+            while True:
+                with self._lock:
+                    while True:
+                        if self._closed or not self._linodes:
+                            self._poller = None
+                            return
+
+                        now = time.time()
+                        next_check = min([min([w.next_check for w in jobs.values()]) for jobs in self._linodes.values()])
+                        if next_check <= now:
+                            break
+                        self._wakeup.wait(next_check - now)
+
+                    # A linode is polled when any of its jobs is due, and the poll covers all of them.
+                    due = [(linode_id, jobs.keys()) for linode_id, jobs in self._linodes.items()
+                        if any([w.next_check <= now for w in jobs.values()])]
+
+                try:
+                    self._check(due)
+                except Exception:
+                    # Such as a response of an unexpected shape. Fail the jobs of this check
+                    # instead of the poller, which the other jobs still need.
+                    self._fail(due, sys.exc_info())
+        finally:
+            # If the poller dies anyway, the next watch() starts another one.
+            with self._lock:
+                if self._poller is threading.current_thread():
+                    self._poller = None
+
+
+    def _check(self, due):
+        requests = []
+        for linode_id, job_ids in due:
+            params = {'LinodeID' : linode_id}
+            if len(job_ids) == 1:
+                params['JobID'] = job_ids[0]
+            requests.append( ('linode.job.list', params) )
+
+        # A sharded client splits the batch per account.
+        try:
+            responses = self.client.batch_request(requests)
+        except ratelimit.TRANSIENT_EXCEPTIONS:
+            # Check again after the next delay.
+            responses = [None] * len(requests)
+        except Exception:
+            # Not something another check would fix. Fail the jobs instead of
+            # polling them until their deadline.
+            self._fail(due, sys.exc_info())
+            return
+
+        now = time.time()
+        resolved = []
+        failed = []
+        with self._lock:
+            self.polls += 1
+            self.checks += len(requests)
+
+            for (linode_id, job_ids), resp in zip(due, responses):
+                jobs = self._linodes.get(linode_id)
+                if jobs is None:
+                    continue
+
+                try:
+                    outcomes = _parse_jobs(job_ids, resp)
+                except Exception:
+                    # A response of an unexpected shape. Checking again won't change it.
+                    exc_info = sys.exc_info()
+                    for job_id in job_ids:
+                        watch = jobs.pop(job_id, None)
+                        if watch is not None:
+                            failed.append( (watch, exc_info) )
+                    outcomes = {}
+
+                for job_id, (finished, success) in outcomes.items():
+                    watch = jobs.get(job_id)
+                    if watch is None:
+                        continue
+
+                    if finished is False and now < watch.deadline:
+                        # Jobs still running at their deadline get one last check then.
+                        watch.next_check = min(now + next(watch.delays), watch.deadline)
+                        continue
+
+                    del jobs[job_id]
+                    resolved.append( (watch, finished, success) )
+
+                if not jobs:
+                    del self._linodes[linode_id]
+
+        # Resolved jobs are no longer watched, so their futures are all set before
+        # anything that could raise.
+        for watch, exc_info in failed:
+            watch.future.set_exception(exc_info)
+        for watch, finished, success in resolved:
+            watch.future.set_result( (finished, success) )
+
+        for watch, finished, success in resolved:
+            duration = now - watch.start
+            if finished:
+                self.poll_policy.record(watch.job_label, duration)
+            if lin.METRICS:
+                lin.api_metrics.record_job(watch.job_label, duration, success if finished else None)
+
+
+    def _fail(self, due, exc_info):
+        failed = []
+        with self._lock:
+            for linode_id, job_ids in due:
+                jobs = self._linodes.get(linode_id)
+                if jobs is None:
+                    continue
+                for job_id in job_ids:
+                    watch = jobs.pop(job_id, None)
+                    if watch is not None:
+                        failed.append(watch)
+                if not jobs:
+                    del self._linodes[linode_id]
+
+        for watch in failed:
+            watch.future.set_exception(exc_info)
+
+
+
+def _parse_jobs(job_ids, resp):
+    # Returns a dict of job ID -> (finished, success) of a linode.job.list response,
+    # or of None if the request failed.
+    if resp is None or ratelimit.is_throttled(resp) or \
+        bool(ratelimit.error_codes(resp) & ratelimit.TRANSIENT_ERROR_CODES):
+        # Check again after the next delay.
+        return dict([(job_id, (False, None)) for job_id in job_ids])
+
+    found = {}
+    if not resp['ERRORARRAY']:
+        found = dict([(job['JOBID'], job) for job in resp['DATA']])
+
+    outcomes = {}
+    for job_id in job_ids:
+        job = found.get(job_id)
+        outcomes[job_id] = lin.parse_job_finished({'DATA' : [job] if job else []})
+    return outcomes
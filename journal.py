@@ -0,0 +1,190 @@
+import os
+import json
+import time
+import uuid
+import threading
+
+import logger
+
+
+JOURNAL_VERSION = 1
+JOURNAL_SUFFIX = '.journal'
+CORRUPT_SUFFIX = '.corrupt'
+
+
+class CreationJournal(object):
+    '''
+    Durable record of the progress of one linode creation, so that it can be resumed
+    after a crash or a failed step instead of starting over from linode.create.
+
+    A journal is an NDJSON file. The first line holds the linode_spec, then each line
+    records a finished step and its result (the linode ID, a disk ID, the config ID...),
+    or a job a step started, so that a resumed step waits for that job instead of
+    starting another. Disks of failed jobs are kept until they're deleted, so that a
+    resumed step deletes them before it creates its disk again. Every line is fsynced before the creation goes on. Root passwords
+    are never written.
+
+    Journals are removed by :meth:`finish` once their creation succeeds.
+    '''
+
+    def __init__(self, path, linode_spec, boot, results = None, jobs = None, created = None,
+        failed_disks = None):
+        self.path = path
+        self.linode_spec = linode_spec
+        self.boot = boot
+        self.created = created if created is not None else time.time()
+        self.results = results or {}        # step -> result
+        self.jobs = jobs or {}              # step -> {'job_id', 'disk_id'}
+        self.failed_disks = failed_disks or {}  # step -> list of disk IDs of failed jobs
+        self._lock = threading.Lock()
+
+
+    @classmethod
+    def create(cls, journal_dir, linode_spec, boot = True):
+        '''
+        Start a new journal for a creation of `linode_spec` in `journal_dir`.
+        '''
+        if not os.path.exists(journal_dir):
+            os.makedirs(journal_dir)
+
+        path = os.path.join(journal_dir, uuid.uuid4().hex + JOURNAL_SUFFIX)
+        journal = cls(path, linode_spec, boot)
+        journal._append({'version' : JOURNAL_VERSION, 'created' : journal.created,
+            'linode_spec' : linode_spec, 'boot' : boot})
+        return journal
+
+
+    @classmethod
+    def load(cls, path):
+        '''
+        Load the journal at `path`. Raises ValueError if it has no readable header,
+        which happens when a crash tore it while it was created.
+        '''
+        with open(path, 'r') as f:
+            lines = f.read().splitlines()
+
+        try:
+            header = json.loads(lines[0])
+            linode_spec, boot = header['linode_spec'], header['boot']
+        except (IndexError, ValueError, KeyError, TypeError):
+            raise ValueError('Unreadable journal header in %s' % (path))
+        if header.get('version') != JOURNAL_VERSION:
+            raise ValueError('Unsupported journal version in %s' % (path))
+
+        results = {}
+        jobs = {}
+        failed_disks = {}
+        for line in lines[1:]:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # A line torn by a crash while it was written. Its step will run again.
+                break
+
+            if 'result' in entry:
+                results[entry['step']] = entry['result']
+            elif entry.get('failed'):
+                jobs.pop(entry['step'], None)
+                if entry.get('disk_id') is not None:
+                    failed_disks.setdefault(entry['step'], []).append(entry['disk_id'])
+            elif 'deleted_disk' in entry:
+                disks = failed_disks.get(entry['step'], [])
+                if entry['deleted_disk'] in disks:
+                    disks.remove(entry['deleted_disk'])
+            else:
+                jobs[entry['step']] = {'job_id' : entry['job_id'], 'disk_id' : entry.get('disk_id')}
+
+        return cls(path, linode_spec, boot, results, jobs, header.get('created'), failed_disks)
+
+
+    @property
+    def linode_id(self):
+        return self.results.get('create_node')
+
+
+    def record(self, step, result):
+        '''
+        Record that `step` finished with `result`, which must be JSON serializable.
+        '''
+        with self._lock:
+            self._append({'step' : step, 'result' : result})
+            self.results[step] = result
+
+
+    def record_job(self, step, job_id, disk_id = None):
+        '''
+        Record that `step` started a job, before waiting for it.
+        '''
+        with self._lock:
+            self._append({'step' : step, 'job_id' : job_id, 'disk_id' : disk_id})
+            self.jobs[step] = {'job_id' : job_id, 'disk_id' : disk_id}
+
+
+    def record_job_failed(self, step):
+        '''
+        Record that the job of `step` failed, so that a resumed step starts a new one.
+        The disk of the job, if any, is kept in :attr:`failed_disks` until it's deleted.
+        '''
+        with self._lock:
+            disk_id = self.jobs.get(step, {}).get('disk_id')
+            self._append({'step' : step, 'failed' : True, 'disk_id' : disk_id})
+            self.jobs.pop(step, None)
+            if disk_id is not None:
+                self.failed_disks.setdefault(step, []).append(disk_id)
+
+
+    def record_disk_deleted(self, step, disk_id):
+        '''
+        Record that the disk of a failed job of `step` was deleted.
+        '''
+        with self._lock:
+            self._append({'step' : step, 'deleted_disk' : disk_id})
+            disks = self.failed_disks.get(step, [])
+            if disk_id in disks:
+                disks.remove(disk_id)
+
+
+    def finish(self):
+        '''
+        The creation succeeded. Remove the journal.
+        '''
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+    def _append(self, entry):
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(entry, separators = (',',':')) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+
+
+def pending_journals(journal_dir):
+    '''
+    Returns the journals of the creations in `journal_dir` that haven't finished,
+    oldest first.
+
+    Journals that can't be loaded are renamed with a '.corrupt' suffix, so that they're
+    skipped from then on.
+    '''
+    if not os.path.isdir(journal_dir):
+        return []
+
+    paths = [os.path.join(journal_dir, name) for name in os.listdir(journal_dir) if name.endswith(JOURNAL_SUFFIX)]
+    paths.sort(key = os.path.getmtime)
+
+    journals = []
+    for path in paths:
+        try:
+            journals.append(CreationJournal.load(path))
+        except (IOError, OSError):
+            # Finished by another thread or process since it was listed.
+            continue
+        except ValueError as e:
+            logger.warn_msg('Skip journal %s:%s' % (path, e))
+            try:
+                os.rename(path, path + CORRUPT_SUFFIX)
+            except OSError:
+                pass
+    return journals
@@ -0,0 +1,164 @@
+import json
+
+
+CHUNK_SIZE = 64 * 1024
+
+WHITESPACE = ' \t\n\r'
+
+
+class ResponseStream(object):
+    '''
+    Incrementally decodes a Linode API response read from a file-like object,
+    yielding the records of its DATA array one at a time. Only one record and one
+    chunk of the body are held in memory at once.
+
+    Keys other than DATA are available as attributes once iteration is over:
+    `errors` (the ERRORARRAY), `action` and `other` (a dict of any remaining keys).
+    `count` and `bytes_read` are the number of records and bytes read so far.
+
+    Example:
+        stream = ResponseStream(response, fields = ['LINODEID', 'LABEL'])
+        for node in stream:
+            ...
+        if stream.errors:
+            ...
+    '''
+
+    def __init__(self, fileobj, fields = None, chunk_size = CHUNK_SIZE):
+        '''
+        Args:
+            - fileobj : Object with a read(size) method returning the response body.
+            - fields : Optional list of keys. If given, each record is reduced to these keys.
+            - chunk_size : Number of bytes read at a time.
+        '''
+        self.fields = fields
+        self.chunk_size = chunk_size
+
+        self.errors = None
+        self.action = None
+        self.other = {}
+        self.count = 0
+        self.bytes_read = 0
+
+        self._file = fileobj
+        self._decoder = json.JSONDecoder()
+        self._buf = ''
+        self._pos = 0
+        self._eof = False
+
+
+    def __iter__(self):
+        self._expect('{')
+        if self._peek() == '}':
+            self._pos += 1
+            return
+
+        while True:
+            key = self._decode_value()
+            self._expect(':')
+
+            if key == 'DATA' and self._peek() == '[':
+                for record in self._iter_array():
+                    self.count += 1
+                    yield self._project(record)
+
+            else:
+                value = self._decode_value()
+                if key == 'ERRORARRAY':
+                    self.errors = value
+                elif key == 'ACTION':
+                    self.action = value
+                else:
+                    self.other[key] = value
+
+            c = self._next()
+            if c == '}':
+                break
+            if c != ',':
+                raise ValueError('Expected , or } at offset %d' % (self._pos))
+
+
+    def _iter_array(self):
+        self._expect('[')
+        if self._peek() == ']':
+            self._pos += 1
+            return
+
+        while True:
+            yield self._decode_value()
+
+            c = self._next()
+            if c == ']':
+                break
+            if c != ',':
+                raise ValueError('Expected , or ] at offset %d' % (self._pos))
+
+
+    def _project(self, record):
+        if self.fields is None or not isinstance(record, dict):
+            return record
+
+        return dict([(f, record[f]) for f in self.fields if f in record])
+
+
+    def _decode_value(self):
+        self._skip_whitespace()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buf, self._pos)
+            except ValueError:
+                # Incomplete value. Read more and try again.
+                if self._eof:
+                    raise
+                self._fill()
+                continue
+
+            if end == len(self._buf) and not self._eof:
+                # A number at the end of the buffer may continue in the next chunk.
+                self._fill()
+                continue
+
+            self._pos = end
+            return value
+
+
+    def _expect(self, char):
+        c = self._next()
+        if c != char:
+            raise ValueError('Expected %s at offset %d, found %r' % (char, self._pos, c))
+
+
+    def _next(self):
+        c = self._peek()
+        self._pos += 1
+        return c
+
+
+    def _peek(self):
+        self._skip_whitespace()
+        if self._pos >= len(self._buf):
+            raise ValueError('Unexpected end of response')
+        return self._buf[self._pos]
+
+
+    def _skip_whitespace(self):
+        while True:
+            while self._pos < len(self._buf) and self._buf[self._pos] in WHITESPACE:
+                self._pos += 1
+
+            if self._pos < len(self._buf) or self._eof:
+                return
+
+            self._fill()
+
+
+    def _fill(self):
+        chunk = self._file.read(self.chunk_size)
+        if not chunk:
+            self._eof = True
+            return
+
+        self.bytes_read += len(chunk)
+        # Drop what's been consumed so the buffer stays around one chunk in size.
+        self._buf = self._buf[self._pos:] + chunk
+        self._pos = 0
@@ -1,44 +1,1645 @@
 #!/usr/bin/python
 
 import urllib
-import urllib2
 import json
 import os
 import sys
 import re
-import datetime
 import operator
+import threading
+import time
+import Queue
+import fnmatch
+import itertools
+import collections
+
+from transport import PooledTransport
+from catalog import CatalogCache, CatalogIndex
+from exc import ApiError, ConfigError
+from json_stream import ResponseStream
+from request_log import RequestLog
+from metrics import ApiMetrics
+from cassette import CassetteTransport
+from inventory import Inventory
+from api_time import parse_api_time
+import ratelimit
 
 
 API_PRODUCTION_URL = 'https://api.linode.com/'
+# Run `python simulator.py` to serve a local simulation of the API here.
 API_SIMULATOR_URL = 'http://localhost:5000/'
-api_key = os.getenv('LINODE_API_KEY', None)
-if (api_key is None):
-    print "Error : LINODE_API_KEY environment var is not defined"
-    sys.exit(1)
 
-url = os.getenv('LINODE_API_URL', None)
-if (url is None):
-    print "Error : LINODE_API_URL environment var is not defined"
-    sys.exit(1)
+# STATUS of linode.list records.
+STATUS_BEING_CREATED = -1
+STATUS_BRAND_NEW = 0
+STATUS_RUNNING = 1
+STATUS_POWERED_OFF = 2
 
+# Set LOG to True, or call configure_log(), to log every request. 
 LOG = False
+request_log = None
+_log_lock = threading.RLock()
+
+# Set METRICS to True, or call enable_metrics(), to record per action call counts,
+# latencies, bytes and error codes in api_metrics. When disabled, requests only
+# pay for checking the flag.
+METRICS = False
+api_metrics = ApiMetrics()
+
+# Keep-alive connections are pooled per host and shared by all clients and
+# threads, including the job waiter threads of linode_core.Core.wait_for_jobs.
+# Use shared_transport.stats() to see how many connections were reused.
+shared_transport = PooledTransport()
+
+
+#=============================================================
+# Response decoding
+#
+# json_loads decodes whole responses. It can be switched to a faster
+# decoder with set_json_backend, or with the LINODE_JSON_BACKEND env var.
+
+JSON_BACKENDS = ['json', 'simplejson', 'ujson']
+
+def set_json_backend(name):
+    global json_loads
+    if name not in JSON_BACKENDS:
+        raise ValueError('Unsupported JSON backend: %s' % (name))
+    json_loads = __import__(name).loads
+
+
+json_loads = json.loads
+set_json_backend(os.getenv('LINODE_JSON_BACKEND', 'json'))
+
+
+def print_records(records):
+    # Prints records in the same format as json.dumps(list(records), indent=4, separators=(',',':'))
+    # without holding all of them in memory.
+    first = True
+    for record in records:
+        text = json.dumps(record, indent=4, separators=(',',':'))
+        sys.stdout.write(('[\n' if first else ',\n') + '\n'.join(['    ' + line for line in text.split('\n')]))
+        first = False
+
+    print '[]' if first else '\n]'
+
+
+#=============================================================
+# Batching
+#
+# The v3 API accepts api_action=batch with an api_requestArray of
+# actions, and returns an array with one response per action, in order.
+# See https://www.linode.com/api/utility/batch
+
+# Linode rejects batches that are too large (error code 10), so larger
+# batches are sent in chunks of this size.
+MAX_BATCH_SIZE = 25
+
+
+class BatchCall(object):
+    '''
+    A single action inside a :class:`Batch`. After the batch is sent, `response` holds
+    the raw response object and `result` holds the parsed return value.
+    '''
+
+    def __init__(self, action, params, parser = None):
+        self.action = action
+        self.params = params
+        self.parser = parser
+        self.response = None
+        self.result = None
+        self.error = None
+        self._done = threading.Event()
+
+
+    def set_response(self, response):
+        self.response = response
+        self.result = self.parser(response) if self.parser else response
+        self._done.set()
+
+
+    def set_error(self, error):
+        self.error = error
+        self._done.set()
+
+
+    def wait(self):
+        self._done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class Batch(object):
+    '''
+    Collects API actions and sends them together with api_action=batch.
+
+    Example:
+        batch = Batch()
+        calls = [batch.add('linode.job.list', {'LinodeID':l, 'JobID':j}, parse_job_finished)
+                    for l, j in jobs]
+        batch.send()
+        for call in calls:
+            finished, success = call.result
+    '''
+
+    def __init__(self, client = None):
+        '''
+        Args:
+            - client : The :class:`LinodeClient` to send the batch with. Defaults
+                to the default client.
+        '''
+        self.client = client
+        self.calls = []
+
+
+    def add(self, action, params = None, parser = None):
+        '''
+        Args:
+            - action : The api_action.
+            - params : dict of parameters for the action.
+            - parser : Optional function that converts the response object into the
+                return value of this call, such as :func:`parse_job_finished`.
+
+        Returns:
+            A :class:`BatchCall` whose result is available after :meth:`send`.
+        '''
+        call = BatchCall(action, params, parser)
+        self.calls.append(call)
+        return call
+
+
+    def send(self):
+        '''
+        Send all the collected actions and return the list of their results.
+        '''
+        calls, self.calls = self.calls, []
+        if not calls:
+            return []
+
+        client = self.client or default_client()
+        responses = client.batch_request([(c.action, c.params) for c in calls])
+        for call, response in zip(calls, responses):
+            call.set_response(response)
+
+        return [c.result for c in calls]
+
+
+    def __len__(self):
+        return len(self.calls)
+
+
+class Coalescer(object):
+    '''
+    Merges requests made by concurrent callers within a short time window
+    into a single batch request. Each caller still blocks and receives its own
+    response as if it had called linode_request directly.
+
+    Enable it for all requests of a client with :meth:`LinodeClient.enable_coalescing`.
+    '''
+
+    def __init__(self, client, window = 0.05, max_batch = MAX_BATCH_SIZE):
+        '''
+        Args:
+            - client : The :class:`LinodeClient` that sends the merged requests.
+            - window : Seconds to wait for other callers after the first request
+                of a batch arrives.
+            - max_batch : A batch is sent immediately once it has these many requests.
+        '''
+        self.client = client
+        self.window = window
+        self.max_batch = max_batch
+        self._pending = []
+        self._timer = None
+        self._lock = threading.Lock()
+
+        self.requests = 0
+        self.http_requests = 0
+
+
+    def request(self, action, params):
+        call = BatchCall(action, params)
+
+        ready = None
+        with self._lock:
+            self.requests += 1
+            self._pending.append(call)
+            if len(self._pending) >= self.max_batch:
+                ready = self._take_pending()
+
+            elif self._timer is None:
+                self._timer = threading.Timer(self.window, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+        if ready:
+            self._send(ready)
+
+        return call.wait()
+
+
+    def flush(self):
+        with self._lock:
+            ready = self._take_pending()
+
+        if ready:
+            self._send(ready)
+
+
+    def stats(self):
+        with self._lock:
+            return {
+                'requests' : self.requests,
+                'http_requests' : self.http_requests
+            }
+
+
+    def _take_pending(self):
+        # Caller must hold self._lock
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        ready, self._pending = self._pending, []
+        return ready
+
+
+    def _send(self, calls):
+        if len(calls) == 1:
+            # A single request retries on its own.
+            with self._lock:
+                self.http_requests += 1
+            try:
+                calls[0].set_response(self.client._send_request(calls[0].action, calls[0].params))
+            except Exception as e:
+                calls[0].set_error(e)
+            return
+
+        # A batch is only retried by _send_request when all of it was rejected, so the
+        # requests in it that were rejected are retried here, the way they would have
+        # been if they had been sent on their own.
+        retry_policy = self.client.retry_policy
+        attempt = 0
+        while calls:
+            with self._lock:
+                self.http_requests += 1
+
+            try:
+                # Not batch_request, since request() tells the inventory about each call.
+                responses = self.client._send_batch([(c.action, c.params) for c in calls])
+
+            except Exception as e:
+                for call in calls:
+                    call.set_error(e)
+                return
+
+            if len(responses) != len(calls):
+                error = ValueError('Batch returned %d responses for %d requests' % (len(responses), len(calls)))
+                for call in calls:
+                    call.set_error(error)
+                return
+
+            retry = []
+            for call, response in zip(calls, responses):
+                if retry_policy is not None and retry_policy.should_retry_response(call.action, response, attempt):
+                    retry.append(call)
+                else:
+                    call.set_response(response)
+
+            if retry:
+                time.sleep(retry_policy.backoff(attempt))
+                attempt += 1
+            calls = retry
+
+
+
+class SingleFlight(object):
+    '''
+    Lets concurrent callers of the same read action with the same params share
+    one request. The first caller (the leader) sends it; callers that arrive while
+    it's in flight wait for the leader's response instead of sending their own.
+
+    Only idempotent actions (see :func:`ratelimit.is_idempotent`) are deduplicated.
+    Followers receive the same response object as the leader, so responses must
+    not be modified.
+    '''
+
+    def __init__(self, send):
+        '''
+        Args:
+            - send : Function called as send(action, params) to send a request.
+        '''
+        self.send = send
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+        self.requests = 0
+        self.saved = 0
+
+
+    def request(self, action, params):
+        key = (action, tuple(sorted([(k, str(v)) for k, v in (params or {}).items()])))
+
+        with self._lock:
+            self.requests += 1
+            call = self._in_flight.get(key)
+            if call is not None:
+                self.saved += 1
+                leader = False
+            else:
+                call = self._in_flight[key] = BatchCall(action, params)
+                leader = True
+
+        if not leader:
+            return call.wait()
+
+        try:
+            response = self.send(action, params)
+        except Exception as e:
+            self._done(key)
+            call.set_error(e)
+            raise
+
+        self._done(key)
+        call.set_response(response)
+        return response
+
+
+    def _done(self, key):
+        # Later callers send a new request.
+        with self._lock:
+            del self._in_flight[key]
+
+
+    def stats(self):
+        with self._lock:
+            return {
+                'requests' : self.requests,
+                'saved' : self.saved,
+                'in_flight' : len(self._in_flight)
+            }
+
+
+#=============================================================
+# Clients
+
+
+class LinodeClient(object):
+    '''
+    A connection to one Linode account: its API key and URL, plus the state tied
+    to them - the catalog cache, rate limiter, retry policy, request coalescer,
+    single-flight deduplication of reads and optional inventory mirror.
+
+    The module level functions of linode_api call the same methods on the
+    default client, which is configured from the LINODE_API_KEY and LINODE_API_URL
+    env vars. Create clients explicitly to use other accounts or endpoints in
+    the same process.
+    '''
+
+    def __init__(self, api_key, url, transport = None, catalogs = None,
+        rate_limiter = None, retry_policy = None):
+        '''
+        Args:
+            - api_key, url : API key and URL of the account.
+            - transport : Defaults to the transport shared by all clients.
+            - catalogs : A :class:`catalog.CatalogCache`. By default each client gets
+                its own, persisted to LINODE_CATALOG_CACHE if that's set.
+            - rate_limiter, retry_policy : Default to new instances. Linode rate limits
+                per API key, so clients should not share rate limiters.
+        '''
+        if not api_key:
+            raise ConfigError('Linode API key is not set')
+        if not url:
+            raise ConfigError('Linode API URL is not set')
+
+        self.api_key = api_key
+        self.url = url
+        self.transport = transport or shared_transport
+
+        # avail.* catalogs rarely change, so validation lookups like find_kernel
+        # are answered from a cache instead of refetching the whole catalog on every call.
+        # Set LINODE_CATALOG_CACHE to a file path to persist catalogs across processes.
+        if catalogs is None:
+            catalogs = CatalogCache(self._fetch_catalog,
+                snapshot_file = os.getenv('LINODE_CATALOG_CACHE', None), namespace = url)
+        self.catalogs = catalogs
+
+        # All requests of a client share one rate limiter, which adapts its rate
+        # to what the API allows. Requests rejected due to rate limiting are retried
+        # for any action; transient failures are retried only for idempotent actions.
+        # Set either of these to None to disable them.
+        self.rate_limiter = rate_limiter or ratelimit.AdaptiveRateLimiter()
+        self.retry_policy = retry_policy or ratelimit.RetryPolicy()
+
+        # When not None, requests are coalesced into batch requests.
+        self.coalescer = None
+
+        # Concurrent identical read requests, such as the catalog and linode.list
+        # lookups of many threads creating linodes at once, share one request.
+        # Set this to None to disable it.
+        self.single_flight = SingleFlight(self._dispatch)
+
+        # When not None, an inventory.Inventory that answers lookups like
+        # get_public_ip_address locally, and is told about this client's mutations.
+        self.inventory = None
+
+
+    def request(self, action, params):
+        if ratelimit.is_idempotent(action):
+            if self.single_flight is not None:
+                return self.single_flight.request(action, params)
+            return self._dispatch(action, params)
+
+        resp = self._dispatch(action, params)
+        if self.inventory is not None:
+            self.inventory.on_mutation(action, params, resp)
+        return resp
+
+
+    def _dispatch(self, action, params):
+        if self.coalescer is not None:
+            return self.coalescer.request(action, params)
+
+        return self._send_request(action, params)
+
+
+    def _send_request(self, action, params):
+        rate_limiter = self.rate_limiter
+        retry_policy = self.retry_policy
+        attempt = 0
+        while True:
+            if rate_limiter is not None:
+                rate_limiter.acquire()
+
+            try:
+                respobj = self._post(action, params)
+
+            except ratelimit.TRANSIENT_EXCEPTIONS as e:
+                if rate_limiter is not None and ratelimit.is_throttled(error = e):
+                    rate_limiter.on_throttled()
+                if retry_policy is None or not retry_policy.should_retry_error(action, e, attempt):
+                    raise
+
+            else:
+                if rate_limiter is not None:
+                    if ratelimit.is_throttled(respobj):
+                        rate_limiter.on_throttled()
+                    else:
+                        rate_limiter.on_success()
+
+                if retry_policy is None or not retry_policy.should_retry_response(action, respobj, attempt):
+                    return respobj
+
+            time.sleep(retry_policy.backoff(attempt))
+            attempt += 1
+
+
+    def _encode(self, action, params):
+        data={
+            'api_key' : self.api_key,
+            'api_action' : action
+        }
+        if params is not None:
+            data.update(params)
+        return urllib.urlencode(data)
+
+
+    def _post(self, action, params):
+        data = self._encode(action, params)
+        start = time.time()
+        try:
+            response = self.transport.post(self.url, data)
+        except Exception as e:
+            if METRICS:
+                api_metrics.record_exception(action, e)
+            raise
+
+        respobj = json_loads(response)
+        duration = time.time() - start
+        if METRICS:
+            api_metrics.record_call(action, duration, len(data), len(response), ratelimit.error_codes(respobj))
+        if LOG:
+            log(self.url, data, respobj, duration)
+        return respobj
+
+
+    def stream_request(self, action, params, fields = None):
+        '''
+        Like :meth:`request`, but yields the records of the response's DATA array one
+        at a time as the response is read, instead of decoding the whole response.
+        Use this for list actions on large accounts.
+
+        Args:
+            - fields : Optional list of keys. If given, each record is reduced to
+                these keys, such as ['LINODEID', 'LABEL'].
+
+        Raises:
+            ApiError if the response has errors.
+        '''
+        data = self._encode(action, params)
+
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
+
+        start = time.time()
+        try:
+            response = self.transport.post_stream(self.url, data)
+        except Exception as e:
+            if METRICS:
+                api_metrics.record_exception(action, e)
+            raise
+
+        try:
+            stream = ResponseStream(response, fields)
+            for record in stream:
+                yield record
+        finally:
+            response.close()
+
+        if METRICS:
+            # Duration includes the time the caller spent consuming records.
+            api_metrics.record_call(action, time.time() - start, len(data), stream.bytes_read,
+                ratelimit.error_codes({'ERRORARRAY' : stream.errors}))
+
+        if self.rate_limiter is not None:
+            if ratelimit.is_throttled({'ERRORARRAY' : stream.errors}):
+                self.rate_limiter.on_throttled()
+            else:
+                self.rate_limiter.on_success()
+
+        if LOG:
+            log(self.url, data, {'ACTION' : action, 'ERRORARRAY' : stream.errors, 'STREAMED_RECORDS' : stream.count})
+
+        if stream.errors:
+            raise ApiError(action, stream.errors)
+
+
+    def batch_request(self, requests):
+        '''
+        Send a list of (action, params) tuples in as few HTTP requests as possible.
+
+        Returns:
+            A list of response objects, one per request, in the same order. Each
+            response has the same 'ACTION', 'DATA' and 'ERRORARRAY' keys as the
+            response of a single request.
+        '''
+        responses = self._send_batch(requests)
+
+        if self.inventory is not None:
+            for (action, params), resp in zip(requests, responses):
+                if not ratelimit.is_idempotent(action):
+                    self.inventory.on_mutation(action, params, resp)
+
+        return responses
+
+
+    def _send_batch(self, requests):
+        # Sends the requests in batches without telling the inventory, which is
+        # left to the caller, such as request() for coalesced requests.
+        responses = []
+        for start in range(0, len(requests), MAX_BATCH_SIZE):
+            chunk = requests[start:start + MAX_BATCH_SIZE]
+            request_array = []
+            for action, params in chunk:
+                req = dict(params) if params else {}
+                req['api_action'] = action
+                request_array.append(req)
+
+            start_time = time.time()
+            try:
+                resp = self._send_request('batch', {'api_requestArray' : json.dumps(request_array)})
+            except Exception as e:
+                if METRICS:
+                    for action, params in chunk:
+                        api_metrics.record_exception(action, e)
+                raise
+
+            if isinstance(resp, dict):
+                # The whole batch was rejected. Report the same errors for every request in it.
+                resp = [{'ACTION' : action, 'DATA' : {}, 'ERRORARRAY' : resp['ERRORARRAY']}
+                    for action, params in chunk]
+
+            if METRICS:
+                # Each action is counted with the latency of its batch. Bytes are
+                # only counted for the whole batch, under 'batch'.
+                duration = time.time() - start_time
+                for (action, params), item in zip(chunk, resp):
+                    api_metrics.record_call(action, duration, 0, 0, ratelimit.error_codes(item))
+
+            responses.extend(resp)
+
+        return responses
+
+
+    def enable_coalescing(self, window = 0.05, max_batch = MAX_BATCH_SIZE):
+        self.coalescer = Coalescer(self, window, max_batch)
+        return self.coalescer
+
+
+    def disable_coalescing(self):
+        coalescer, self.coalescer = self.coalescer, None
+        if coalescer is not None:
+            coalescer.flush()
+
+
+    def invalidate_catalogs(self, action = None):
+        self.catalogs.invalidate(action)
+
+
+    def enable_inventory(self, refresh_interval = None):
+        '''
+        Mirror the account's linodes, IPs, disks and configs locally, and answer
+        lookups like get_public_ip_address, get_node_memory, get_disks and
+        get_configs from the mirror.
+
+        Args:
+            - refresh_interval : If given, the mirror is also refreshed in the
+                background every `refresh_interval` seconds.
+        '''
+        if self.inventory is None:
+            self.inventory = Inventory(self)
+        if refresh_interval:
+            self.inventory.start_background_refresh(refresh_interval)
+        return self.inventory
+
+
+    def disable_inventory(self):
+        inventory, self.inventory = self.inventory, None
+        if inventory is not None:
+            inventory.stop_background_refresh()
+
+
+    def _fetch_catalog(self, action):
+        resp = self.request(action, None)
+        iserr, errors = is_error(resp)
+        if iserr:
+            raise ApiError(action, errors)
+        return resp['DATA']
+
+
+    # This returns the data centter id given a location or abbr or the ID itself.
+    def get_datacenter(self, datacenter, dcs = None):
+        if dcs is None:
+            index = self.catalogs.index('avail.datacenters')
+        else:
+            index = CatalogIndex(dcs, 'DATACENTERID', ['LOCATION', 'ABBR'])
+
+        dc = index.find(datacenter)
+        if dc is None:
+            return None
+
+        return dc['DATACENTERID']
+
+
+    def get_datacenters(self):
+        dcs = self.catalogs.get('avail.datacenters')
+        return dcs
+
+
+    def get_plans(self):
+        plans = self.catalogs.get('avail.linodeplans')
+        return plans
+
+
+    # This returns the distribution id and label given its label or just the ID itself.
+    def find_distribution(self, distribution):
+        distro = self.catalogs.index('avail.distributions').find(distribution)
+        if distro is None:
+            return (None, None)
+
+        return (distro['DISTRIBUTIONID'], distro['LABEL'])
+
+
+    # This returns the kernel id and label given its partial/full label or just the ID itself.
+    def find_kernel(self, kernel):
+        index = self.catalogs.index('avail.kernels')
+        if str(kernel).isdigit():
+            k = index.find(kernel)
+        else:
+            # Return the first partial or full match
+            k = index.find_substring(kernel)
+
+        if k is None:
+            return (None, None)
+
+        return (k['KERNELID'], k['LABEL'])
+
+
+    def iter_nodes(self, linode_id=None, fields=None):
+        params = {'LinodeID':linode_id} if linode_id else None
+        return self.stream_request('linode.list', params, fields)
+
+
+    def get_node_memory(self, linode_id):
+        if self.inventory is not None:
+            return self.inventory.memory(linode_id)
+
+        resp = self.request('linode.list', {'LinodeID':linode_id})
+        nodes = resp['DATA']
+        if nodes and len(nodes) > 0:
+            return nodes[0]["TOTALRAM"]
+
+        return None
+
+
+    def get_disks(self, linode_id):
+        if self.inventory is not None:
+            return self.inventory.disks(linode_id)
+
+        return self.request('linode.disk.list', {'LinodeID':linode_id})['DATA']
+
+
+    def get_configs(self, linode_id):
+        if self.inventory is not None:
+            return self.inventory.configs(linode_id)
+
+        return self.request('linode.config.list', {'LinodeID':linode_id})['DATA']
+
+
+    def iter_ip_addresses(self, linode_id=-1, fields=None):
+        params = None if linode_id == -1 else {'LinodeID':linode_id}
+        return self.stream_request('linode.ip.list', params, fields)
+
+
+    def get_public_ip_address(self, linode_id):
+        if self.inventory is not None:
+            return self.inventory.public_ip(linode_id)
+
+        resp = self.request('linode.ip.list', {'LinodeID':linode_id})
+        addresses = resp['DATA']
+        for address in addresses:
+            if address['ISPUBLIC'] == 1:
+                return address['IPADDRESS']
+
+        return None
+
+
+    def add_private_ip(self, linode_id):
+        resp = self.request('linode.ip.addprivate', {'LinodeID':linode_id})
+        iserr, errors = is_error(resp)
+        if iserr:
+            return (False, errors)
+
+        address = resp['DATA']
+
+        return (True, address['IPADDRESS'])
+
+
+    def is_job_finished(self, linode_id, job_id):
+        # Return values:
+        #   False, None : Job is not finished
+        #   True, True : Job is successfully completed
+        #   True, False: Job failed
+        #   None, None : No such job
+        data = self.request('linode.job.list', {'LinodeID':linode_id, 'JobID':job_id})
+        return parse_job_finished(data)
+
+
+    def are_jobs_finished(self, linodes_jobs):
+        # Batched version of is_job_finished.
+        # linodes_jobs is a list of (linode_id, job_id) tuples.
+        #
+        # Returns a list of (finished, success) tuples in the same order.
+        batch = Batch(self)
+        for linode_id, job_id in linodes_jobs:
+            batch.add('linode.job.list', {'LinodeID':linode_id, 'JobID':job_id}, parse_job_finished)
+
+        return batch.send()
+
+
+    def create_node(self, plan, datacenter, do_validations=True):
+        if do_validations:
+            datacenter = self.get_datacenter(datacenter)
+            if datacenter is None:
+                return (False, None, ['Invalid datacenter'])
+
+        resp = self.request('linode.create', 
+            {
+                'PLANID' : plan,
+                'DATACENTERID' : datacenter
+            }
+        )
+
+        iserr, errors = is_error(resp)
+        if iserr:
+            return (False, None, errors)
+
+        linode_id = resp['DATA']['LinodeID']
+        return (True, linode_id, None)
+
+
+    def update_node(self, linode_id, label, display_group):
+        resp = self.request('linode.update', 
+            {
+                'LinodeID' : linode_id,
+                'Label' : label,
+                'lpm_displayGroup' : display_group
+            }
+        )
+
+        iserr, errors = is_error(resp)
+        if iserr:
+            return (False, None, errors)
+
+        linode_id = resp['DATA']['LinodeID']
+        return (True, linode_id, None)
+
+
+    def delete_node(self, linode_id, skip_checks):
+        resp = self.request('linode.delete', 
+            {
+                'LinodeID' : linode_id,
+                'skipChecks' : skip_checks
+            }
+        )
+        return parse_delete_node(resp)
+
+
+    # skip_checks should be 0 to not skip checks, or 1 to skip.
+    def delete_all_nodes(self, skip_checks):
+        results = self.delete_nodes(skip_checks = skip_checks)
+        deleted_linodes = [linode_id for linode_id, (success, errors) in results.items() if success]
+        all_errors = [errors for linode_id, (success, errors) in results.items() if not success]
+        return (deleted_linodes, all_errors)
+
+
+    def delete_nodes(self, group = None, label = None, older_than = None, skip_checks = 1,
+        parallel = 4, batch_size = MAX_BATCH_SIZE, progress = None, dry_run = False):
+        '''
+        Delete the linodes that match all the given filters, or all linodes if none are given.
+
+        Args:
+            - group : Only linodes in this display group.
+            - label : Only linodes whose label matches this glob pattern, such as 'test-*'.
+            - older_than : Only linodes created more than this many seconds ago.
+            - skip_checks : 0 to not skip checks, or 1 to skip.
+            - parallel : Max number of delete requests in flight at once.
+            - batch_size : Number of deletes sent in each batch request.
+            - progress : Optional function called as progress(done, total, linode_id, success, errors)
+                after each linode is deleted or fails.
+            - dry_run : If True, only return the linodes that would be deleted.
+
+        Returns:
+            An OrderedDict of linode ID -> (success, errors), in the order of linode.list.
+        '''
+        linodes = [n['LINODEID'] for n in self.iter_nodes(fields = ['LINODEID', 'LABEL', 'LPM_DISPLAYGROUP', 'CREATE_DT'])
+            if match_record(n, 'LABEL', group, label, older_than)]
+
+        if dry_run:
+            return collections.OrderedDict([(linode_id, (None, None)) for linode_id in linodes])
+
+        return self.delete_node_ids(linodes, skip_checks, parallel, batch_size, progress)
+
+
+    def delete_node_ids(self, linode_ids, skip_checks = 1, parallel = 4, batch_size = MAX_BATCH_SIZE,
+        progress = None):
+        '''
+        Delete the linodes with these IDs. The arguments are the same as for :meth:`delete_nodes`.
+
+        Returns:
+            An OrderedDict of linode ID -> (success, errors), in the order of `linode_ids`.
+        '''
+        return self._bulk_delete(list(linode_ids), 'linode.delete', 
+            lambda linode_id: {'LinodeID' : linode_id, 'skipChecks' : skip_checks},
+            parallel, batch_size, progress)
+
+
+    def _bulk_delete(self, ids, action, params_for, parallel, batch_size, progress):
+        # Sends `action` for each of `ids`, in batches of `batch_size` with up to
+        # `parallel` batches in flight.
+        if parallel < 1 or batch_size < 1:
+            raise ValueError('parallel and batch_size must be at least 1, not %s and %s' % (parallel, batch_size))
+
+        results = collections.OrderedDict([(i, None) for i in ids])
+        chunks = Queue.Queue()
+        for start in range(0, len(ids), batch_size):
+            chunks.put(ids[start:start + batch_size])
+
+        lock = threading.Lock()
+        done = [0]
+
+        def finish(item_id, success, errors):
+            with lock:
+                results[item_id] = (success, errors)
+                done[0] += 1
+                count = done[0]
+            if progress is not None:
+                progress(count, len(ids), item_id, success, errors)
+
+        def work():
+            while True:
+                try:
+                    chunk = chunks.get_nowait()
+                except Queue.Empty:
+                    return
+
+                try:
+                    if len(chunk) == 1:
+                        responses = [self.request(action, params_for(chunk[0]))]
+                    else:
+                        responses = self.batch_request([(action, params_for(i)) for i in chunk])
+                except Exception as e:
+                    responses = [{'ERRORARRAY' : [{'ERRORCODE' : None, 'ERRORMESSAGE' : str(e)}]}] * len(chunk)
+
+                for item_id, resp in zip(chunk, responses):
+                    iserr, errors = is_error(resp)
+                    finish(item_id, not iserr, errors)
+
+        workers = [threading.Thread(target = work, name = 'bulk-delete-%d' % (i)) 
+            for i in range(min(parallel, chunks.qsize()))]
+        for t in workers:
+            t.start()
+        for t in workers:
+            t.join()
+
+        return results
+
+
+    def create_disk(self, linode_id, disk_type, disk_size, label, 
+        distribution = None, root_password = None, root_ssh_key_file = None):
+
+        # From https://www.linode.com/api/linode/linode.disk.create
+        # 'distribution' is optional. If distribID is not included, it boots up, goes 
+        # into kernel panic due to missing init, and keeps rebooting.
+        # 'distribution' may be an id or just a label that matches an entry in avail.distributions. 
+        # Find its actual ID and check for validity.
+
+        params={
+            'LinodeID' : linode_id,
+            'Label' : label,
+            'Type' : disk_type,
+            'Size' : disk_size
+        }
+
+        if distribution:
+            distribution_id, distribution_label = self.find_distribution(distribution)
+            if distribution_id is None:
+                return (False, None, None, ['Invalid distribution'])
+
+            params['FromDistributionID'] = distribution_id
+
+        if root_password:
+            params['rootPass'] = root_password
+
+        if root_ssh_key_file:
+            with open(root_ssh_key_file, 'r') as idfile:
+                public_key = idfile.read()
+
+            public_key = public_key.replace('\n', '')
+            params['rootSSHKey'] = public_key
+
+        resp = self.request('linode.disk.create', params)
+        iserr, errors = is_error(resp)
+        if iserr:
+            return (False, None, None, errors)
+
+        job_id = resp['DATA']['JobID']
+        disk_id = resp['DATA']['DiskID']
+        return (True, disk_id, job_id, None)
+
+
+    def create_swap_disk(self, linode_id, swap_disk_size_mb = None):
+        # From https://www.linode.com/api/linode/linode.disk.create
+
+        if swap_disk_size_mb is None:
+            ram_mb = int(self.get_node_memory(linode_id))
+            swap_disk_size_mb = calc_swap_disk_size(ram_mb)
+        else:
+            swap_disk_size_mb = int(swap_disk_size_mb)
+
+        params={
+            'LinodeID' : linode_id,
+            'Type' : 'swap',
+            'Size' : swap_disk_size_mb,
+            'Label' : 'swapdisk'
+        }
+        resp = self.request('linode.disk.create', params)
+        iserr, errors = is_error(resp)
+        if iserr:
+            return (False, None, None, errors)
+
+        job_id = resp['DATA']['JobID']
+        disk_id = resp['DATA']['DiskID']
+
+        return (True, disk_id, job_id, None)
+
+
+    def create_disk_from_distribution(self, linode_id, distribution, disk_size, root_password, root_ssh_key_file):
+        # 'distribution' may be an id or just a label that matches an entry in avail.distributions. 
+        # Find its actual ID and check for validity.
+        distribution_id, distribution_label = self.find_distribution(distribution)
+        if distribution_id is None:
+            return (False, None, None, ['Invalid distribution'])
+
+        public_key = ''
+        if root_ssh_key_file:
+            with open(root_ssh_key_file, 'r') as idfile:
+                public_key = idfile.read()
+
+            public_key = public_key.replace('\n', '')
+
+        # From https://www.linode.com/api/linode/linode.disk.createfromdistribution
+        params={
+            'LinodeID' : linode_id,
+            'DistributionID' : distribution_id,
+            'rootPass' : root_password, 
+            'rootSSHKey' : public_key,
+            'Label' : distribution_label,
+            'Size' : disk_size
+        }
+        resp = self.request('linode.disk.createfromdistribution', params)
+        iserr, errors = is_error(resp)
+        if iserr:
+            return (False, None, None, errors)
+
+        job_id = resp['DATA']['JobID']
+        disk_id = resp['DATA']['DiskID']
+        return (True, disk_id, job_id, None )
+
+
+    def create_disk_from_stackscript(self, linode_id, stackscript_id, distribution, root_password, root_ssh_key_file):
+        # 'distribution' may be an id or just a label that matches an entry in avail.distributions. 
+        # Find its actual ID and check for validity.
+        distribution_id, distribution_label = self.find_distribution(distribution)
+        if distribution_id is None:
+            return (False, None, None, ['Invalid distribution'])
+
+        public_key = ''
+        if root_ssh_key_file:
+            with open(root_ssh_key_file, 'r') as idfile:
+                public_key = idfile.read()
+
+            public_key = public_key.replace('\n', '')
+
+
+        # From https://www.linode.com/api/linode/linode.disk.createfromstackscript
+        params={
+            'LinodeID' : linode_id,
+            'StackScriptID' : stackscript_id,
+            'StackScriptUDFResponses' : '{}',
+            'DistributionID' : distribution_id,
+            'rootPass' : root_password,
+            'rootSSHKey' : public_key,
+            'Label' : distribution_label,
+            'Size' : '5000'
+        }
+        print params
+        resp=self.request('linode.disk.createfromstackscript', params)
+        iserr, errors = is_error(resp)
+        if iserr:
+            return (False, None, None, errors)
+
+        job_id = resp['DATA']['JobID']
+        disk_id = resp['DATA']['DiskID']
+        return (True, disk_id, job_id, None )
+
+
+    def create_diskimage(self, linode_id, disk_id, image_label):
+        # https://www.linode.com/api/linode/linode.disk.imagize
+        resp=self.request('linode.disk.imagize', 
+            {
+                'LinodeID' : linode_id,
+                'DiskID' : disk_id,
+                'Label' : image_label
+            }
+        )
+        iserr, errors = is_error(resp)
+        if iserr:
+            return (False, None, None, errors)
+
+        self.catalogs.invalidate('image.list')
+
+        job_id = resp['DATA']['JobID']
+        image_id = resp['DATA']['ImageID']
+        return (True, image_id, job_id, None)
+
+
+    def create_duplicate_disk(self, linode_id, disk_id):
+        # https://www.linode.com/api/linode/linode.disk.duplicate
+        resp=self.request('linode.disk.duplicate', 
+            {
+                'LinodeID' : linode_id,
+                'DiskID' : disk_id
+            }
+        )
+        iserr, errors = is_error(resp)
+        if iserr:
+            return (False, None, None, errors)
+
+        job_id = resp['DATA']['JobID']
+        new_disk_id = resp['DATA']['DiskID']
+        return (True, new_disk_id, job_id, None)
+
+
+    def delete_disk(self, linode_id, disk_id):
+
+        resp = self.request('linode.disk.delete', 
+            {
+                'LinodeID' : linode_id,
+                'DiskID' : disk_id
+            }
+        )
+
+        iserr, errors = is_error(resp)
+        if iserr:
+            return (False, None, errors)
+
+        job_id = resp['DATA']['JobID']
+        return (True, job_id, None)
+
+
+    def iter_images(self, fields=None):
+        # https://www.linode.com/api/image/image.list
+        return self.stream_request('image.list', None, fields)
+
+
+    def image_stats(self):
+        image_count = 0
+        total_image_size = 0
+        for i in self.iter_images(['MINSIZE']):
+            image_count += 1
+            total_image_size += i['MINSIZE']
+        return image_count,total_image_size
+
+
+    # This returns the image id and image label given its label or just the ID itself.
+    def find_image(self, image):
+        img = self.catalogs.index('image.list').find(image)
+        if img is None:
+            # The image may have been created after the image list was cached.
+            self.catalogs.refresh('image.list')
+            img = self.catalogs.index('image.list').find(image)
+
+        if img is None:
+            return (None, None)
+
+        return (img['IMAGEID'], img['LABEL'])
+
+
+    def delete_image(self, image_id):
+        resp = self.request('image.delete', {'ImageID':image_id})
+        self.catalogs.invalidate('image.list')
+        iserr, errors = is_error(resp)
+        if iserr:
+            return (False, None, errors)
+
+        return (True, image_id, None)
+
+
+    def delete_all_images(self):
+        results = self.delete_images()
+        deleted_images = [image_id for image_id, (success, errors) in results.items() if success]
+        all_errors = [errors for image_id, (success, errors) in results.items() if not success]
+        return (deleted_images, all_errors)
+
+
+    def delete_images(self, label = None, older_than = None, parallel = 4, batch_size = MAX_BATCH_SIZE,
+        progress = None, dry_run = False):
+        '''
+        Delete the images that match all the given filters, or all images if none are given.
+        The filters and other arguments are the same as for :meth:`delete_nodes`.
+
+        Returns:
+            An OrderedDict of image ID -> (success, errors), in the order of image.list.
+        '''
+        images = [i['IMAGEID'] for i in self.iter_images(['IMAGEID', 'LABEL', 'CREATE_DT'])
+            if match_record(i, 'LABEL', None, label, older_than)]
+
+        if dry_run:
+            return collections.OrderedDict([(image_id, (None, None)) for image_id in images])
+
+        return self.delete_image_ids(images, parallel, batch_size, progress)
+
+
+    def delete_image_ids(self, image_ids, parallel = 4, batch_size = MAX_BATCH_SIZE, progress = None):
+        '''
+        Delete the images with these IDs. The arguments are the same as for :meth:`delete_nodes`.
+
+        Returns:
+            An OrderedDict of image ID -> (success, errors), in the order of `image_ids`.
+        '''
+        try:
+            return self._bulk_delete(list(image_ids), 'image.delete', lambda image_id: {'ImageID' : image_id},
+                parallel, batch_size, progress)
+        finally:
+            self.catalogs.invalidate('image.list')
+
+
+    def create_disk_from_image(self, linode_id, image_id, label, disk_size, root_password, root_ssh_key_file):
+        # Note: This assumes the image_id is valid.
+
+        public_key = ''
+        if root_ssh_key_file:
+            with open(root_ssh_key_file, 'r') as idfile:
+                public_key = idfile.read()
+
+            public_key = public_key.replace('\n', '')
+
+
+        # From https://www.linode.com/api/linode/linode.disk.createfromimage
+        params={
+            'ImageID' : image_id,
+            'LinodeID' : linode_id,
+            'rootPass' : root_password,
+            'rootSSHKey' : public_key,
+            'Label' : label,
+            'Size' : disk_size
+        }
+        resp = self.request('linode.disk.createfromimage', params)
+        iserr, errors = is_error(resp)
+        if iserr:
+            return (False, None, None, errors)
+
+        # For 'creatediskfromimage', the returned keys are uppercase, not lowercase.
+        job_id = resp['DATA']['JOBID']
+        disk_id = resp['DATA']['DISKID']
+        return (True, disk_id, job_id, None)
+
+
+    def create_config(self, linode_id, kernel, disks, config_label, do_validations=True):
+        if do_validations:
+            kernel_id, kernel_label = self.find_kernel(kernel)
+            if kernel_id is None:
+                return (False, ['Invalid kernel'])
+        else:
+            kernel_id = kernel
+
+        linode_id = int(linode_id)
+
+        # The disks parameter to Linode API should be a comma separated list of disk IDs.
+        disk_list = ','.join(map(str, disks))
+
+        params={
+            'LinodeID' : linode_id,
+            'KernelID' : kernel_id, 
+            'Label' : config_label,
+            'DiskList' : disk_list
+        }
+        resp = self.request('linode.config.create', params)
+        iserr, errors = is_error(resp)
+        if iserr:
+            return (False, None, errors)
+
+        config_id = resp['DATA']['ConfigID']
+        return (True, config_id, None)
+
+
+    def boot_node(self, linode_id, config_id=None):
+        params = {'LinodeID':linode_id}
+        if config_id:
+            params['ConfigID'] = config_id
+
+        resp = self.request('linode.boot', params)
+        iserr, errors = is_error(resp)
+        if iserr:
+            return (False, None, errors)
+
+        job_id = resp['DATA']['JobID']
+        return (True, job_id, None)
+
+
+    def shutdown_node(self, linode_id):
+        resp = self.request('linode.shutdown', {'LinodeID':linode_id})
+        iserr, errors = is_error(resp)
+        if iserr:
+            return (False, None, errors)
+
+        job_id = resp['DATA']['JobID']
+        return (True, job_id, None)
+
+
+    def clone_node(self, linode_id):
+        params={
+            'LinodeID' : linode_id,
+            'DatacenterID' : 9, # Note: It seems it's possible to clone a linode to a different datacenter.
+            'PlanID' : 1
+        }
+        resp=self.request('linode.clone', params)
+        iserr, errors = is_error(resp)
+        if iserr:
+            return (False, None, errors)
+
+        job_id = resp['DATA']['LinodeID']
+        return (True, linode_id, None)
+
+
+class ShardedClient(object):
+    '''
+    Spreads linode creations across several accounts, to multiply the per API key
+    rate limits and account limits.
+
+    New linodes are created on the shards in turn, skipping any shard that
+    reports its hourly limit of new linodes has been reached. All later operations
+    on a linode or image are sent to the shard that owns it. Catalog lookups go to
+    the first shard, and listings of linodes, IPs and images span all shards.
+
+    Supports the operations that linode_core.Core, :class:`job_watcher.JobWatcher`,
+    :class:`inventory.Inventory` and :class:`reaper.Reaper` use, so it can be passed
+    to them in place of a single client. Other operations of :class:`LinodeClient`,
+    such as the filtered bulk deletes and enable_inventory, are only available on
+    the client of each shard.
+    '''
+
+    # Operations whose first argument is a linode ID, and so must be sent
+    # to the account that owns the linode.
+    LINODE_OPERATIONS = set(['update_node', 'delete_node', 'get_node_memory', 'is_job_finished',
+        'get_public_ip_address', 'get_disks', 'get_configs', 'add_private_ip', 'create_disk', 'create_swap_disk',
+        'create_disk_from_distribution', 'create_disk_from_stackscript', 'create_diskimage',
+        'create_duplicate_disk', 'delete_disk', 'create_disk_from_image', 'create_config',
+        'boot_node', 'shutdown_node', 'clone_node'])
+
+    # Operations that don't depend on the account.
+    CATALOG_OPERATIONS = set(['get_datacenter', 'get_datacenters', 'get_plans',
+        'find_distribution', 'find_kernel'])
+
+    # ERRORCODE for "Linodes allowed to be added per hour limit reached".
+    ERROR_HOURLY_LIMIT = 40
+
+
+    def __init__(self, clients):
+        '''
+        Args:
+            - clients : List of :class:`LinodeClient`, one per account.
+        '''
+        assert clients
+        self.clients = list(clients)
+        self._owners = {}
+        self._image_owners = {}
+        self._lock = threading.Lock()
+        self._next = itertools.cycle(range(len(self.clients)))
+
+
+    def create_node(self, plan, datacenter, do_validations=True):
+        with self._lock:
+            start = self._next.next()
+
+        for i in range(len(self.clients)):
+            client = self.clients[(start + i) % len(self.clients)]
+            result = client.create_node(plan, datacenter, do_validations)
+            success, linode_id, errors = result
+            if success:
+                with self._lock:
+                    self._owners[linode_id] = client
+                return result
+
+            codes = [e.get('ERRORCODE') for e in errors if isinstance(e, dict)]
+            if self.ERROR_HOURLY_LIMIT not in codes:
+                return result
+
+        # Every account has hit its limit.
+        return result
+
+
+    def client_for(self, linode_id):
+        '''
+        Returns the client of the account that owns `linode_id`. Linodes not
+        created through this object are looked up in each account.
+        '''
+        with self._lock:
+            client = self._owners.get(linode_id)
+        if client is not None:
+            return client
+
+        for client in self.clients:
+            if client.get_node_memory(linode_id) is not None:
+                with self._lock:
+                    self._owners[linode_id] = client
+                return client
+
+        raise ValueError('Linode %s not found in any account' % (linode_id))
+
+
+    def image_client_for(self, image_id):
+        '''
+        Returns the client of the account that owns image `image_id`.
+        '''
+        with self._lock:
+            client = self._image_owners.get(image_id)
+        if client is not None:
+            return client
+
+        for client in self.clients:
+            for image in client.iter_images(['IMAGEID']):
+                if image['IMAGEID'] == image_id:
+                    with self._lock:
+                        self._image_owners[image_id] = client
+                    return client
+
+        raise ValueError('Image %s not found in any account' % (image_id))
+
+
+    @property
+    def catalogs(self):
+        return self.clients[0].catalogs
+
+
+    def request(self, action, params = None):
+        '''
+        Sends `action` to the shard that owns the LinodeID or ImageID in `params`,
+        or to the first shard if there's neither.
+        '''
+        return self._client_for_params(params).request(action, params)
+
+
+    def batch_request(self, requests):
+        # Batch the requests per account, and put the responses back in order.
+        by_client = {}
+        for pos, (action, params) in enumerate(requests):
+            by_client.setdefault(self._client_for_params(params), []).append( (pos, (action, params)) )
+
+        responses = [None] * len(requests)
+        for client, items in by_client.items():
+            for (pos, item), resp in zip(items, client.batch_request([item for pos, item in items])):
+                responses[pos] = resp
+
+        return responses
+
+
+    def iter_nodes(self, linode_id = None, fields = None):
+        if linode_id:
+            return self._client_for_params({'LinodeID' : linode_id}).iter_nodes(linode_id, fields)
+        return self._iter_all('iter_nodes', (None, fields), 'LINODEID', self._owners)
+
+
+    def iter_ip_addresses(self, linode_id = -1, fields = None):
+        if linode_id != -1:
+            return self._client_for_params({'LinodeID' : linode_id}).iter_ip_addresses(linode_id, fields)
+        return self._iter_all('iter_ip_addresses', (-1, fields), 'LINODEID', self._owners)
+
+
+    def iter_images(self, fields = None):
+        return self._iter_all('iter_images', (fields,), 'IMAGEID', self._image_owners)
+
+
+    def create_diskimage(self, linode_id, *args, **kwargs):
+        client = self.client_for(linode_id)
+        result = client.create_diskimage(linode_id, *args, **kwargs)
+        if result[0]:
+            with self._lock:
+                self._image_owners[result[1]] = client
+        return result
+
+
+    def delete_image(self, image_id):
+        return self._client_for_params({'ImageID' : image_id}).delete_image(image_id)
+
+
+    def delete_node_ids(self, linode_ids, skip_checks = 1, parallel = 4, batch_size = MAX_BATCH_SIZE,
+        progress = None):
+        return self._delete_ids(linode_ids, 'LinodeID', progress,
+            lambda client, ids, progress: client.delete_node_ids(ids, skip_checks, parallel, batch_size, progress))
+
+
+    def delete_image_ids(self, image_ids, parallel = 4, batch_size = MAX_BATCH_SIZE, progress = None):
+        return self._delete_ids(image_ids, 'ImageID', progress,
+            lambda client, ids, progress: client.delete_image_ids(ids, parallel, batch_size, progress))
+
+
+    def _client_for_params(self, params):
+        # Linodes and images that no shard owns are sent to the first one, which
+        # answers with the API's own "not found" error.
+        try:
+            if params and params.get('LinodeID'):
+                return self.client_for(params['LinodeID'])
+            if params and params.get('ImageID'):
+                return self.image_client_for(params['ImageID'])
+        except ValueError:
+            pass
+        return self.clients[0]
+
+
+    def _iter_all(self, name, args, id_key, owners):
+        # Chains a listing over all shards, noting who owns each record along the way.
+        for client in self.clients:
+            for record in getattr(client, name)(*args):
+                if id_key in record:
+                    with self._lock:
+                        owners[record[id_key]] = client
+                yield record
+
+
+    def _delete_ids(self, ids, id_param, progress, delete):
+        # Deletes the IDs of each shard with delete(client, ids, progress), and puts the
+        # results back in the order of `ids`.
+        ids = list(ids)
+        by_client = {}
+        for item_id in ids:
+            by_client.setdefault(self._client_for_params({id_param : item_id}), []).append(item_id)
+
+        lock = threading.Lock()
+        done = [0]
+        def shard_progress(count, total, item_id, success, errors):
+            with lock:
+                done[0] += 1
+                count = done[0]
+            progress(count, len(ids), item_id, success, errors)
+
+        results = {}
+        for client, client_ids in by_client.items():
+            results.update(delete(client, client_ids, shard_progress if progress is not None else None))
+
+        return collections.OrderedDict([(item_id, results[item_id]) for item_id in ids])
+
+
+    def are_jobs_finished(self, linodes_jobs):
+        # Batch the jobs per account, and put the results back in order.
+        by_client = {}
+        for pos, (linode_id, job_id) in enumerate(linodes_jobs):
+            by_client.setdefault(self.client_for(linode_id), []).append( (pos, (linode_id, job_id)) )
+
+        results = [None] * len(linodes_jobs)
+        for client, items in by_client.items():
+            for (pos, item), result in zip(items, client.are_jobs_finished([item for pos, item in items])):
+                results[pos] = result
+
+        return results
+
+
+    def __getattr__(self, name):
+        if name in self.LINODE_OPERATIONS:
+            def route(linode_id, *args, **kwargs):
+                return getattr(self.client_for(linode_id), name)(linode_id, *args, **kwargs)
+            return route
+
+        if name in self.CATALOG_OPERATIONS:
+            return getattr(self.clients[0], name)
+
+        raise AttributeError(name)
+
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+
+def default_client():
+    '''
+    Returns the client used by the module level functions. Unless set with
+    :func:`set_default_client`, it's created on first use from the LINODE_API_KEY,
+    LINODE_API_URL, and optionally the LINODE_CASSETTE and LINODE_CASSETTE_MODE env vars.
+
+    Raises:
+        ConfigError if the env vars are not defined.
+    '''
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            api_key = os.getenv('LINODE_API_KEY', None)
+            if api_key is None:
+                raise ConfigError('LINODE_API_KEY environment var is not defined')
+
+            url = os.getenv('LINODE_API_URL', None)
+            if url is None:
+                raise ConfigError('LINODE_API_URL environment var is not defined')
+
+            # Set LINODE_CASSETTE to a cassette file to replay requests from it, or
+            # to record them to it if LINODE_CASSETTE_MODE is 'record'.
+            transport = None
+            cassette_file = os.getenv('LINODE_CASSETTE', None)
+            if cassette_file:
+                transport = CassetteTransport(cassette_file, os.getenv('LINODE_CASSETTE_MODE', 'replay'))
+
+            _default_client = LinodeClient(api_key, url, transport)
+
+        return _default_client
+
+
+def set_default_client(client):
+    global _default_client
+    with _default_client_lock:
+        _default_client = client
+
 
 def linode_request(action, params):
-    data={
-        'api_key' : api_key,
-        'api_action' : action
-    }
-    if params is not None:
-        data.update(params)
-    data = urllib.urlencode(data)
-    req = urllib2.Request(url, data)
-    response = urllib2.urlopen(req)
-    response = response.read()  
-    respobj = json.loads(response)
-    if LOG:
-        log(req, respobj)
-    return respobj
+    return default_client().request(action, params)
+
+
+def stream_request(action, params, fields = None):
+    return default_client().stream_request(action, params, fields)
+
+
+def batch_request(requests):
+    return default_client().batch_request(requests)
+
+
+def enable_coalescing(window = 0.05, max_batch = MAX_BATCH_SIZE):
+    return default_client().enable_coalescing(window, max_batch)
+
+
+def disable_coalescing():
+    default_client().disable_coalescing()
+
+
+def invalidate_catalogs(action = None):
+    default_client().invalidate_catalogs(action)
+
+
+def enable_inventory(refresh_interval = None):
+    return default_client().enable_inventory(refresh_interval)
+
+
+def disable_inventory():
+    default_client().disable_inventory()
+
+#=============================================================
 
 
 def is_error(response):
@@ -47,11 +1648,45 @@ def is_error(response):
         
     return (False, None)
     
-def log(req, resp):
-    with open('linode_api.log', 'a') as log_file:
-        log_file.write("\n\n----%s\n[REQUEST] %s %s\n[RESPONSE]\n" 
-            % (str(datetime.datetime.now()), req.get_full_url(), req.get_data()))
-        json.dump(resp, log_file, indent=4, separators=(',',':'))
+def log(request_url, request_data, resp, duration=None):
+    with _log_lock:
+        if request_log is None:
+            configure_log()
+    request_log.log(request_url, request_data, resp, duration)
+    
+    
+def enable_metrics(reset=False):
+    # Starts recording request metrics in api_metrics.
+    global METRICS
+    if reset:
+        api_metrics.reset()
+    METRICS = True
+    return api_metrics
+
+
+def disable_metrics():
+    global METRICS
+    METRICS = False
+
+
+def metrics_snapshot(format='dict'):
+    # Returns the recorded metrics as a dict, or as Prometheus text if format is 'prometheus'.
+    if format == 'prometheus':
+        return api_metrics.to_prometheus()
+    return api_metrics.to_dict()
+
+
+def configure_log(path='linode_api.log', **kwargs):
+    # Enables logging of all requests to an NDJSON file, written by a background thread. 
+    # kwargs are the rotation, compression, sampling and truncation options of RequestLog.
+    global request_log, LOG
+    with _log_lock:
+        old_log = request_log
+        request_log = RequestLog(path, **kwargs)
+        LOG = True
+    if old_log is not None:
+        old_log.close()
+    return request_log
         
         
 def list_datacenters(format='raw'):
@@ -70,30 +1705,12 @@ def list_datacenters(format='raw'):
         print json.dumps(data, indent=4, separators=(',',':'))
     
     
-# This returns the data centter id given a location or abbr or the ID itself.
 def get_datacenter(datacenter, dcs = None):
-    if dcs is None:
-        dcs = linode_request('avail.datacenters', None)['DATA']
-        
-    if str(datacenter).isdigit():
-        datacenter = int(datacenter)
-        for dc in dcs:
-            if dc['DATACENTERID'] == datacenter:
-                # It's a valid datacenter.
-                return datacenter
-        return None
-    
-    datacenter = datacenter.lower()
-    for dc in dcs:
-        if dc['LOCATION'].lower() == datacenter or dc['ABBR'].lower() == datacenter:
-            return dc['DATACENTERID']
-    
-    return None
+    return default_client().get_datacenter(datacenter, dcs)
 
 
 def get_datacenters():
-    dcs = linode_request('avail.datacenters', None)['DATA']
-    return dcs
+    return default_client().get_datacenters()
 
 
 def list_plans(format='table'):
@@ -108,10 +1725,7 @@ def list_plans(format='table'):
 
 
 def get_plans():
-    data=linode_request('avail.linodeplans', None)
-    plans=data['DATA']
-    return plans
-
+    return default_client().get_plans()
 
 
 def list_distributions(filter=None, format='raw'):
@@ -136,24 +1750,8 @@ def list_distributions(filter=None, format='raw'):
         print json.dumps(distros, indent=4, separators=(',',':'))
 
 
-# This returns the distribution id and label given its label or just the ID itself.
 def find_distribution(distribution):
-    distros = linode_request('avail.distributions', None)['DATA']
-    if str(distribution).isdigit():
-        distribution = int(distribution)
-        for distro in distros:
-            if distro['DISTRIBUTIONID'] == distribution:
-                # It's a valid distribution.
-                return (distribution, distro['LABEL'])
-                
-        return (None, None)
-    
-    distribution = distribution.lower()
-    for distro in distros:
-        if distro['LABEL'].lower() == distribution:
-            return (distro['DISTRIBUTIONID'], distro['LABEL'])
-    
-    return (None, None)
+    return default_client().find_distribution(distribution)
 
 
 def list_all_stackscripts(filter=None):
@@ -172,7 +1770,6 @@ def list_all_stackscripts(filter=None):
 #       print json.dumps(filtered, indent=4, separators=(',',':'))
 
 
-
 def list_mystackscripts():
     data=linode_request('stackscript.list', None)
     scripts=data['DATA']
@@ -185,8 +1782,6 @@ def stackscript(script_id):
     print json.dumps(script, indent=4, separators=(',',':'))    
 
 
-
-
 def list_kernels(version_filter_regex=None, format='raw'):
     data=linode_request('avail.kernels', None)
     kernels=data['DATA']
@@ -209,45 +1804,25 @@ def list_kernels(version_filter_regex=None, format='raw'):
         print json.dumps(kernels, indent=4, separators=(',',':'))
 
 
-# This returns the kernel id and label given its partial/full label or just the ID itself.
 def find_kernel(kernel):
-    kernels = linode_request('avail.kernels', None)['DATA']
-    if str(kernel).isdigit():
-        kernel = int(kernel)
-        for k in kernels:
-            if k['KERNELID'] == kernel:
-                # It's a valid kernel.
-                return (kernel, k['LABEL'])
-                
-        return (None, None)
-    
-    kernel = kernel.lower()
-    for k in kernels:
-        # Return the first partial or full match
-        if kernel in k['LABEL'].lower():
-            return (k['KERNELID'], k['LABEL'])
-    
-    return (None, None)
-
+    return default_client().find_kernel(kernel)
 
 
 def list_nodes(linode_id=None):
-    if linode_id:
-        data=linode_request('linode.list', {'LinodeID':linode_id})
+    inventory = default_client().inventory
+    if inventory is not None:
+        nodes = [inventory.node(linode_id)] if linode_id else inventory.nodes()
+        print_records([node for node in nodes if node is not None])
     else:
-        data=linode_request('linode.list', None)
-        
-    nodes=data['DATA']
-    print json.dumps(nodes, indent=4, separators=(',',':'))
+        print_records(iter_nodes(linode_id))
+
+
+def iter_nodes(linode_id=None, fields=None):
+    return default_client().iter_nodes(linode_id, fields)
 
 
 def get_node_memory(linode_id):
-    resp = linode_request('linode.list', {'LinodeID':linode_id})
-    nodes = resp['DATA']
-    if nodes and len(nodes) > 0:
-        return nodes[0]["TOTALRAM"]
-        
-    return None
+    return default_client().get_node_memory(linode_id)
 
 
 def list_jobs(linode_id):
@@ -256,35 +1831,21 @@ def list_jobs(linode_id):
     print json.dumps(jobs, indent=4, separators=(',',':'))
 
 
-
 def list_ip_addresses(linode_id):
-    if linode_id == -1:
-        data=linode_request('linode.ip.list', None)
-    else:
-        data=linode_request('linode.ip.list', {'LinodeID':linode_id})
-    addresses=data['DATA']
-    print json.dumps(addresses, indent=4, separators=(',',':'))
+    print_records(iter_ip_addresses(linode_id))
+    
+    
+def iter_ip_addresses(linode_id=-1, fields=None):
+    return default_client().iter_ip_addresses(linode_id, fields)
 
 
 def get_public_ip_address(linode_id):
-    resp = linode_request('linode.ip.list', {'LinodeID':linode_id})
-    addresses = resp['DATA']
-    for address in addresses:
-        if address['ISPUBLIC'] == 1:
-            return address['IPADDRESS']
-            
-    return None
+    return default_client().get_public_ip_address(linode_id)
+
 
 def add_private_ip(linode_id):
-    resp = linode_request('linode.ip.addprivate', {'LinodeID':linode_id})
-    iserr, errors = is_error(resp)
-    if iserr:
-        return (False, errors)
-    
-    address = resp['DATA']
-        
-    return (True, address['IPADDRESS'])
-        
+    return default_client().add_private_ip(linode_id)
+
 
 def job(linode_id, job_id):
     data=linode_request('linode.job.list', {'LinodeID':linode_id, 'JobID':job_id})
@@ -293,12 +1854,12 @@ def job(linode_id, job_id):
 
 
 def is_job_finished(linode_id, job_id):
-    # Return values:
-    #   False, None : Job is not finished
-    #   True, True : Job is successfully completed
-    #   True, False: Job failed
-    #   None, None : No such job
-    data = linode_request('linode.job.list', {'LinodeID':linode_id, 'JobID':job_id})
+    return default_client().is_job_finished(linode_id, job_id)
+
+
+def parse_job_finished(data):
+    # Converts a linode.job.list response for a single job into
+    # the return values of is_job_finished.
     jobs = data['DATA']
     if jobs: 
         job = jobs[0]
@@ -308,168 +1869,82 @@ def is_job_finished(linode_id, job_id):
         return (True, False if job['HOST_SUCCESS'] == 0 else True)
         
     return (None,None)
-        
+    
+    
+def are_jobs_finished(linodes_jobs):
+    return default_client().are_jobs_finished(linodes_jobs)
 
 
 def list_configs(linode_id):
-    data=linode_request('linode.config.list', {'LinodeID':linode_id})
-    configs=data['DATA']
+    configs=default_client().get_configs(linode_id)
     print json.dumps(configs, indent=4, separators=(',',':'))
 
 
-
 def create_node(plan, datacenter, do_validations=True):
-    if do_validations:
-        datacenter = get_datacenter(datacenter)
-        if datacenter is None:
-            return (False, ['Invalid datacenter'])
-        
-    resp = linode_request('linode.create', 
-        {
-            'PLANID' : plan,
-            'DATACENTERID' : datacenter
-        }
-    )
-    
-    iserr, errors = is_error(resp)
-    if iserr:
-        return (False, None, errors)
-        
-    linode_id = resp['DATA']['LinodeID']
-    return (True, linode_id, None)
-
+    return default_client().create_node(plan, datacenter, do_validations)
 
 
 def update_node(linode_id, label, display_group):
-    resp = linode_request('linode.update', 
-        {
-            'LinodeID' : linode_id,
-            'Label' : label,
-            'lpm_displayGroup' : display_group
-        }
-    )
-    
-    iserr, errors = is_error(resp)
-    if iserr:
-        return (False, None, errors)
-        
-    linode_id = resp['DATA']['LinodeID']
-    return (True, linode_id, None)
-
+    return default_client().update_node(linode_id, label, display_group)
 
 
 def delete_node(linode_id, skip_checks):
-    resp = linode_request('linode.delete', 
-        {
-            'LinodeID' : linode_id,
-            'skipChecks' : skip_checks
-        }
-    )
-    
+    return default_client().delete_node(linode_id, skip_checks)
+
+
+def parse_delete_node(resp):
     iserr, errors = is_error(resp)
     if iserr:
         return (False, None, errors)
         
     linode_id = resp['DATA']['LinodeID']
     return (True, linode_id, None)
-
-
-# skip_checks should be 0 to not skip checks, or 1 to skip.
-def delete_all_nodes(skip_checks):
-    linodes = linode_request('linode.list', None)['DATA']
-    
-    deleted_linodes = []
-    all_errors = []
     
-    for linode in linodes:
-        linode_id = linode['LINODEID']
-        resp = linode_request('linode.delete', 
-            {
-                'LinodeID' : linode_id,
-                'skipChecks' : skip_checks
-            }
-        )
-        
-        iserr, errors = is_error(resp)
-        if iserr:
-            all_errors.append(errors)
-        else:   
-            deleted_linodes.append(linode_id)
     
-    return (deleted_linodes, all_errors)
+def delete_all_nodes(skip_checks):
+    return default_client().delete_all_nodes(skip_checks)
 
 
-def create_disk(linode_id, disk_type, disk_size, label, 
-    distribution = None, root_password = None, root_ssh_key_file = None):
-        
-    # From https://www.linode.com/api/linode/linode.disk.create
-    # 'distribution' is optional. If distribID is not included, it boots up, goes 
-    # into kernel panic due to missing init, and keeps rebooting.
-    # 'distribution' may be an id or just a label that matches an entry in avail.distributions. 
-    # Find its actual ID and check for validity.
-    
-    params={
-        'LinodeID' : linode_id,
-        'Label' : label,
-        'Type' : disk_type,
-        'Size' : disk_size
-    }
-    
-    if distribution:
-        distribution_id, distribution_label = find_distribution(distribution)
-        if distribution_id is None:
-            return (False, None, None, ['Invalid distribution'])
-            
-        params['FromDistributionID'] = distribution_id
+def delete_nodes(group=None, label=None, older_than=None, skip_checks=1, parallel=4, 
+    batch_size=MAX_BATCH_SIZE, progress=None, dry_run=False):
+    return default_client().delete_nodes(group, label, older_than, skip_checks, parallel, 
+        batch_size, progress, dry_run)
+
 
-    if root_password:
-        params['rootPass'] = root_password
+def match_record(record, label_key, group=None, label=None, older_than=None, now=None):
+    # Checks a linode.list or image.list record against the filters of delete_nodes.
+    if group is not None and record.get('LPM_DISPLAYGROUP') != group:
+        return False
         
-    if root_ssh_key_file:
-        with open(root_ssh_key_file, 'r') as idfile:
-            public_key = idfile.read()
+    if label is not None and not fnmatch.fnmatchcase(record.get(label_key) or '', label):
+        return False
+        
+    if older_than is not None:
+        created = record.get('CREATE_DT')
+        if not created:
+            return False
+        if (now or time.time()) - parse_api_time(created) < older_than:
+            return False
             
-        public_key = public_key.replace('\n', '')
-        params['rootSSHKey'] = public_key
-    
-    resp = linode_request('linode.disk.create', params)
-    iserr, errors = is_error(resp)
-    if iserr:
-        return (False, None, None, errors)
-    
-    job_id = resp['DATA']['JobID']
-    disk_id = resp['DATA']['DiskID']
-    return (True, disk_id, job_id, None)
+    return True
 
 
+def parse_duration(value):
+    # Converts '90', '90s', '30m', '12h' or '7d' to seconds.
+    units = {'s' : 1, 'm' : 60, 'h' : 3600, 'd' : 86400}
+    value = str(value).strip()
+    if value and value[-1] in units:
+        return float(value[:-1]) * units[value[-1]]
+    return float(value)
 
 
-def create_swap_disk(linode_id, swap_disk_size_mb = None):
-    # From https://www.linode.com/api/linode/linode.disk.create
-    
-    if swap_disk_size_mb is None:
-        ram_mb = int(get_node_memory(linode_id))
-        swap_disk_size_mb = calc_swap_disk_size(ram_mb)
-    else:
-        swap_disk_size_mb = int(swap_disk_size_mb)
-        
-    params={
-        'LinodeID' : linode_id,
-        'Type' : 'swap',
-        'Size' : swap_disk_size_mb,
-        'Label' : 'swapdisk'
-    }
-    resp = linode_request('linode.disk.create', params)
-    iserr, errors = is_error(resp)
-    if iserr:
-        return (False, None, None, errors)
-    
-    job_id = resp['DATA']['JobID']
-    disk_id = resp['DATA']['DiskID']
-  
-    return (True, disk_id, job_id, None)
+def create_disk(linode_id, disk_type, disk_size, label, distribution = None, root_password = None, root_ssh_key_file = None):
+    return default_client().create_disk(linode_id, disk_type, disk_size, label, distribution, root_password, root_ssh_key_file)
 
 
+def create_swap_disk(linode_id, swap_disk_size_mb = None):
+    return default_client().create_swap_disk(linode_id, swap_disk_size_mb)
+
 
 def calc_swap_disk_size(ram_mb):
     
@@ -498,264 +1973,68 @@ def calc_swap_disk_size(ram_mb):
     return swap_disk_size_mb
 
 
-
 def create_disk_from_distribution(linode_id, distribution, disk_size, root_password, root_ssh_key_file):
-    # 'distribution' may be an id or just a label that matches an entry in avail.distributions. 
-    # Find its actual ID and check for validity.
-    distribution_id, distribution_label = find_distribution(distribution)
-    if distribution_id is None:
-        return (False, None, None, ['Invalid distribution'])
-        
-    public_key = ''
-    if root_ssh_key_file:
-        with open(root_ssh_key_file, 'r') as idfile:
-            public_key = idfile.read()
-            
-        public_key = public_key.replace('\n', '')
-    
-    # From https://www.linode.com/api/linode/linode.disk.createfromdistribution
-    params={
-        'LinodeID' : linode_id,
-        'DistributionID' : distribution_id,
-        'rootPass' : root_password, 
-        'rootSSHKey' : public_key,
-        'Label' : distribution_label,
-        'Size' : disk_size
-    }
-    resp = linode_request('linode.disk.createfromdistribution', params)
-    iserr, errors = is_error(resp)
-    if iserr:
-        return (False, None, None, errors)
-    
-    job_id = resp['DATA']['JobID']
-    disk_id = resp['DATA']['DiskID']
-    return (True, disk_id, job_id, None )
+    return default_client().create_disk_from_distribution(linode_id, distribution, disk_size, root_password, root_ssh_key_file)
 
 
 def create_disk_from_stackscript(linode_id, stackscript_id, distribution, root_password, root_ssh_key_file):
-    # 'distribution' may be an id or just a label that matches an entry in avail.distributions. 
-    # Find its actual ID and check for validity.
-    distribution_id, distribution_label = find_distribution(distribution)
-    if distribution_id is None:
-        return (False, None, None, ['Invalid distribution'])
-        
-    public_key = ''
-    if root_ssh_key_file:
-        with open(root_ssh_key_file, 'r') as idfile:
-            public_key = idfile.read()
-            
-        public_key = public_key.replace('\n', '')
-    
-
-    # From https://www.linode.com/api/linode/linode.disk.createfromstackscript
-    params={
-        'LinodeID' : linode_id,
-        'StackScriptID' : stackscript_id,
-        'StackScriptUDFResponses' : '{}',
-        'DistributionID' : distribution_id,
-        'rootPass' : root_password,
-        'rootSSHKey' : public_key,
-        'Label' : distribution_label,
-        'Size' : '5000'
-    }
-    print params
-    resp=linode_request('linode.disk.createfromstackscript', params)
-    iserr, errors = is_error(resp)
-    if iserr:
-        return (False, None, None, errors)
-    
-    job_id = resp['DATA']['JobID']
-    disk_id = resp['DATA']['DiskID']
-    return (True, disk_id, job_id, None )
-
+    return default_client().create_disk_from_stackscript(linode_id, stackscript_id, distribution, root_password, root_ssh_key_file)
 
 
 def create_diskimage(linode_id, disk_id, image_label):
-    # https://www.linode.com/api/linode/linode.disk.imagize
-    resp=linode_request('linode.disk.imagize', 
-        {
-            'LinodeID' : linode_id,
-            'DiskID' : disk_id,
-            'Label' : image_label
-        }
-    )
-    iserr, errors = is_error(resp)
-    if iserr:
-        return (False, None, None, errors)
-    
-    job_id = resp['DATA']['JobID']
-    image_id = resp['DATA']['ImageID']
-    return (True, image_id, job_id, None)
+    return default_client().create_diskimage(linode_id, disk_id, image_label)
 
 
 def create_duplicate_disk(linode_id, disk_id):
-    # https://www.linode.com/api/linode/linode.disk.duplicate
-    resp=linode_request('linode.disk.duplicate', 
-        {
-            'LinodeID' : linode_id,
-            'DiskID' : disk_id
-        }
-    )
-    iserr, errors = is_error(resp)
-    if iserr:
-        return (False, None, None, errors)
-    
-    job_id = resp['DATA']['JobID']
-    new_disk_id = resp['DATA']['DiskID']
-    return (True, new_disk_id, job_id, None)
+    return default_client().create_duplicate_disk(linode_id, disk_id)
 
 
 def delete_disk(linode_id, disk_id):
-    
-    resp = linode_request('linode.disk.delete', 
-        {
-            'LinodeID' : linode_id,
-            'DiskID' : disk_id
-        }
-    )
+    return default_client().delete_disk(linode_id, disk_id)
 
-    iserr, errors = is_error(resp)
-    if iserr:
-        return (False, None, errors)
-    
-    job_id = resp['DATA']['JobID']
-    return (True, job_id, None)
 
-
-    
 def list_disks(linode_id):
-    data=linode_request('linode.disk.list', {'LinodeID':linode_id})
-    disks=data['DATA']
+    disks=default_client().get_disks(linode_id)
     print json.dumps(disks, indent=4, separators=(',',':'))
 
 
-
-
 def list_diskimages():
     # https://www.linode.com/api/image/image.list
     data=linode_request('image.list', None)
     print json.dumps(data, indent=4, separators=(',',':'))
 
 
-def image_stats():
-    # https://www.linode.com/api/image/image.list
-    response = linode_request('image.list', None)
-    images = response['DATA']
-    image_count = len(images)
-    total_image_size = 0
-    for i in images:
-        total_image_size += i['MINSIZE']
-    return image_count,total_image_size
+def iter_images(fields=None):
+    return default_client().iter_images(fields)
 
 
+def image_stats():
+    return default_client().image_stats()
+
 
-# This returns the image id and image label given its label or just the ID itself.
 def find_image(image):
-    images = linode_request('image.list', None)['DATA']
-    if str(image).isdigit():
-        image = int(image)
-        for img in images:
-            if img['IMAGEID'] == image:
-                # It's a valid image.
-                return (image, img['LABEL'])
-                
-        return (None, None)
-    
-    image = image.lower()
-    for img in images:
-        if img['LABEL'].lower() == image:
-            return (img['IMAGEID'], img['LABEL'])
-    
-    return (None, None)
+    return default_client().find_image(image)
 
 
 def delete_image(image_id):
-    resp = linode_request('image.delete', {'ImageID':image_id})
-    iserr, errors = is_error(resp)
-    if iserr:
-        return (False, None, errors)
-    
-    return (True, image_id, None)
-    
+    return default_client().delete_image(image_id)
+
 
 def delete_all_images():
-    images = linode_request('image.list', None)['DATA']
-    
-    deleted_images = []
-    all_errors = []
-    
-    for img in images:
-        img_id = img['IMAGEID']
-        resp = linode_request('image.delete', {'ImageID' : img_id})
-        
-        iserr, errors = is_error(resp)
-        if iserr:
-            all_errors.append(errors)
-        else:   
-            deleted_images.append(img_id)
-    
-    return (deleted_images, all_errors)
+    return default_client().delete_all_images()
 
 
-def create_disk_from_image(linode_id, image_id, label, disk_size, root_password, root_ssh_key_file):
-    # Note: This assumes the image_id is valid.
-    
-    public_key = ''
-    if root_ssh_key_file:
-        with open(root_ssh_key_file, 'r') as idfile:
-            public_key = idfile.read()
-        
-        public_key = public_key.replace('\n', '')
-    
+def delete_images(label=None, older_than=None, parallel=4, batch_size=MAX_BATCH_SIZE, 
+    progress=None, dry_run=False):
+    return default_client().delete_images(label, older_than, parallel, batch_size, progress, dry_run)
 
-    # From https://www.linode.com/api/linode/linode.disk.createfromimage
-    params={
-        'ImageID' : image_id,
-        'LinodeID' : linode_id,
-        'rootPass' : root_password,
-        'rootSSHKey' : public_key,
-        'Label' : label,
-        'Size' : disk_size
-    }
-    resp = linode_request('linode.disk.createfromimage', params)
-    iserr, errors = is_error(resp)
-    if iserr:
-        return (False, None, None, errors)
-    
-    # For 'creatediskfromimage', the returned keys are uppercase, not lowercase.
-    job_id = resp['DATA']['JOBID']
-    disk_id = resp['DATA']['DISKID']
-    return (True, disk_id, job_id, None)
 
+def create_disk_from_image(linode_id, image_id, label, disk_size, root_password, root_ssh_key_file):
+    return default_client().create_disk_from_image(linode_id, image_id, label, disk_size, root_password, root_ssh_key_file)
 
-def create_config(linode_id, kernel, disks, config_label, do_validations=True):
-    if do_validations:
-        kernel_id, kernel_label = find_kernel(kernel)
-        if kernel_id is None:
-            return (False, ['Invalid kernel'])
-    else:
-        kernel_id = kernel
-    
-    linode_id = int(linode_id)
-    
-    # The disks parameter to Linode API should be a comma separated list of disk IDs.
-    disk_list = ','.join(map(str, disks))
-    
-    params={
-        'LinodeID' : linode_id,
-        'KernelID' : kernel_id, 
-        'Label' : config_label,
-        'DiskList' : disk_list
-    }
-    resp = linode_request('linode.config.create', params)
-    iserr, errors = is_error(resp)
-    if iserr:
-        return (False, None, errors)
-    
-    config_id = resp['DATA']['ConfigID']
-    return (True, config_id, None)
 
-    
+def create_config(linode_id, kernel, disks, config_label, do_validations=True):
+    return default_client().create_config(linode_id, kernel, disks, config_label, do_validations)
 
 
 def create_stackscript(script_file):
@@ -774,48 +2053,18 @@ def create_stackscript(script_file):
     print resp
 
 
-
-
 def boot_node(linode_id, config_id=None):
-    params = {'LinodeID':linode_id}
-    if config_id:
-        params['ConfigID'] = config_id
-        
-    resp = linode_request('linode.boot', params)
-    iserr, errors = is_error(resp)
-    if iserr:
-        return (False, None, errors)
-    
-    job_id = resp['DATA']['JobID']
-    return (True, job_id, None)
-
-
+    return default_client().boot_node(linode_id, config_id)
 
 
 def shutdown_node(linode_id):
-    resp = linode_request('linode.shutdown', {'LinodeID':linode_id})
-    iserr, errors = is_error(resp)
-    if iserr:
-        return (False, None, errors)
-    
-    job_id = resp['DATA']['JobID']
-    return (True, job_id, None)
-
+    return default_client().shutdown_node(linode_id)
 
 
 def clone_node(linode_id):
-    params={
-        'LinodeID' : linode_id,
-        'DatacenterID' : 9, # Note: It seems it's possible to clone a linode to a different datacenter.
-        'PlanID' : 1
-    }
-    resp=linode_request('linode.clone', params)
-    iserr, errors = is_error(resp)
-    if iserr:
-        return (False, None, errors)
-    
-    job_id = resp['DATA']['LinodeID']
-    return (True, linode_id, None)
+    return default_client().clone_node(linode_id)
+
+
 
 #=============================================================
 
@@ -827,6 +2076,12 @@ if __name__ == '__main__':
         print "No command"
         sys.exit(0)
 
+    try:
+        client = default_client()
+    except ConfigError as e:
+        print "Error :", e
+        sys.exit(1)
+
     #if url == API_PRODUCTION_URL:
         #print >> sys.stderr, "**** CAUTION: USING PRODUCTION URL"
 
@@ -972,6 +2227,24 @@ if __name__ == '__main__':
                 print 2
         sys.exit(0) 
 
+    elif (cmd == 'jobs-status'):
+        # Batched job-status. 
+        # Args: linode_id:job_id pairs, e.g. 123:456 123:457 124:458
+        # Output: One line per job, same values as job-status, or 'invalid' for no such job.
+        linodes_jobs = []
+        for arg in sys.argv[2:]:
+            linode_id, job_id = arg.split(':')
+            linodes_jobs.append( (int(linode_id), int(job_id)) )
+            
+        for finished, success in are_jobs_finished(linodes_jobs):
+            if finished is None:
+                print 'invalid'
+            elif finished == False:
+                print 0
+            else:
+                print 1 if success else 2
+        sys.exit(0)
+
     elif (cmd == 'disks'):
         list_disks(int(sys.argv[2]))
 
@@ -1072,6 +2345,47 @@ if __name__ == '__main__':
         sys.exit(0)
 
 
+    elif (cmd == 'delete-nodes' or cmd == 'delete-images'):
+        # Args: [--group GROUP] [--label PATTERN] [--older-than AGE] [--parallel N]
+        #       [--skip-checks 0|1] [--dry-run]
+        #       AGE is in seconds, or with a unit such as 30m, 12h or 7d. 
+        #       --group and --skip-checks only apply to delete-nodes.
+        #       Example: ./linode_api.py delete-nodes --group temporary --label 'test-*' --older-than 2h
+        #
+        # Output: One "id,deleted|failed|matched" line per node or image. Progress and errors on stderr.
+        # Returns: 0 on complete success or 1 if there are any errors. 
+        import argparse
+        parser = argparse.ArgumentParser(prog = cmd)
+        parser.add_argument('--group')
+        parser.add_argument('--label')
+        parser.add_argument('--older-than', type = parse_duration)
+        parser.add_argument('--parallel', type = int, default = 4)
+        parser.add_argument('--skip-checks', type = int, default = 1)
+        parser.add_argument('--dry-run', action = 'store_true')
+        args = parser.parse_args(sys.argv[2:])
+        
+        def show_progress(done, total, item_id, success, errors):
+            print >>sys.stderr, '[%d/%d] %s %s%s' % (done, total, 'Deleted' if success else 'Failed to delete', 
+                item_id, '' if success else ': %s' % (errors))
+        
+        if cmd == 'delete-nodes':
+            results = delete_nodes(args.group, args.label, args.older_than, args.skip_checks, 
+                args.parallel, progress = show_progress, dry_run = args.dry_run)
+        else:
+            results = delete_images(args.label, args.older_than, args.parallel, 
+                progress = show_progress, dry_run = args.dry_run)
+            
+        failed = False
+        for item_id, (success, errors) in results.items():
+            if success is None:
+                print '%d,matched' % (item_id)
+            else:
+                print '%d,%s' % (item_id, 'deleted' if success else 'failed')
+                failed = failed or not success
+            
+        sys.exit(1 if failed else 0)
+
+
     elif (cmd == 'create-disk'):
         create_disk(linode_id)
 
@@ -1255,6 +2569,60 @@ if __name__ == '__main__':
         
         sys.exit(0)
         
+    elif (cmd == 'transport-stats'):
+        # Output: Connection pool statistics after sending sys.argv[2] (default 5)
+        #         test.echo requests, to check that connections are reused.
+        count = 5
+        if len(sys.argv) > 2:
+            count = int(sys.argv[2])
+            
+        for i in range(count):
+            linode_request('test.echo', {'foo':'bar'})
+            
+        print json.dumps(client.transport.stats(), indent=4, separators=(',',':'))
+        sys.exit(0)
+        
+    elif (cmd == 'invalidate-catalogs'):
+        # Drops cached avail.* catalogs, or just the one in sys.argv[2]
+        # such as avail.kernels. Only useful with LINODE_CATALOG_CACHE.
+        action = None
+        if len(sys.argv) > 2:
+            action = sys.argv[2]
+        invalidate_catalogs(action)
+        sys.exit(0)
+
+    elif (cmd == 'single-flight-stats'):
+        # Output: Single-flight statistics after sending sys.argv[2] (default 10)
+        #         concurrent avail.kernels requests. 'saved' is the number of requests
+        #         that were answered by another in-flight request.
+        count = 10
+        if len(sys.argv) > 2:
+            count = int(sys.argv[2])
+            
+        threads = [threading.Thread(target = linode_request, args = ('avail.kernels', None)) for i in range(count)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+            
+        print json.dumps(client.single_flight.stats(), indent=4, separators=(',',':'))
+        sys.exit(0)
+        
+    elif (cmd == 'rate-limit-stats'):
+        # Output: Rate limiter and retry statistics after sending sys.argv[2] (default 5)
+        #         test.echo requests.
+        count = 5
+        if len(sys.argv) > 2:
+            count = int(sys.argv[2])
+            
+        for i in range(count):
+            linode_request('test.echo', {'foo':'bar'})
+            
+        stats = client.rate_limiter.stats()
+        stats['retries'] = client.retry_policy.retries
+        print json.dumps(stats, indent=4, separators=(',',':'))
+        sys.exit(0)
+        
     elif (cmd == 'api'):
         # Send details direct to API.
         # sys.argv[2] should be the api_action
@@ -14,17 +14,44 @@ import yaml
 
 import logger
 
-from exc import CreationError
+from exc import CreationError, PlanError
+from planner import plan_linode
+from polling import PollPolicy
+from job_watcher import JobWatcher
+from dag import StepGraph, format_path
+from journal import CreationJournal, pending_journals
+from reaper import ERROR_NOT_FOUND
 
 class Core(object):
     
-    def __init__(self, app_ctx):
+    def __init__(self, app_ctx, client = None):
+        '''
+        Args:
+            - app_ctx : Application defined settings such as the configuration directory to use.
+                Optional settings are 'root-ssh-key-file', the public key to install on new linodes,
+                'job-timeout', the seconds wait_for_job waits for a job, 'job-poll-interval' and
+                'job-poll-max-interval', the shortest and longest seconds between checks, or
+                'job-poll-policy', a :class:`polling.PollPolicy` that replaces all three. Set
+                'job-watcher' to a :class:`job_watcher.JobWatcher` to share one between Core
+                objects, so that the job polls of all their wait_for_jobs calls are batched together.
+                Set 'reaper' to a :class:`reaper.Reaper` to have it delete the linodes that failed
+                creations couldn't delete.
+            - client : The :class:`linode_api.LinodeClient` or :class:`linode_api.ShardedClient` 
+                to create linodes with. Defaults to the default client.
+        '''
         assert app_ctx
         self.app_ctx = app_ctx
+        self.client = client if client is not None else lin.default_client()
+        self.poll_policy = app_ctx.get('job-poll-policy') or PollPolicy(
+            min_interval = app_ctx.get('job-poll-interval', 1),
+            max_interval = app_ctx.get('job-poll-max-interval', 30),
+            timeout = app_ctx.get('job-timeout', 240)) # 4 minutes
+        self.job_watcher = app_ctx.get('job-watcher') or JobWatcher(self.client, self.poll_policy)
+        self.reaper = app_ctx.get('reaper')
         
         
         
-    def create_linode(self, linode_spec, boot = True, delete_on_error = True):
+    def create_linode(self, linode_spec, boot = True, delete_on_error = True, journal = None):
         ''' Create a linode.
         
         Args:
@@ -61,253 +88,558 @@ class Core(object):
                 linode_spec['disks']['others'] is optional.
                 linode_spec['disks']['others'][...]['type'] should be [ext4 | ext3 | swap | raw]
         
+        The spec is resolved by :meth:`plan_linode` before anything is created, so
+        an invalid spec fails without creating a linode. Steps that don't depend on
+        each other, like creating the disks and adding the private IP, run concurrently.
+        
+        If `journal` is a :class:`journal.CreationJournal`, or app_ctx has a 'journal-dir'
+        to create one in, the progress of the creation is journaled, so that a creation
+        interrupted by a crash, or failed with `delete_on_error` False, can be continued
+        by :meth:`resume_linode` from the last finished step. A creation rolled back
+        by `delete_on_error` removes its journal.
+        
         Returns:
-            A Linode object.
+            A Linode object, or None if creation failed. Its critical_path is the list
+            of (step, seconds) tuples of the longest chain of steps of the creation.
         '''
         
         assert any( [linode_spec.get('distribution'), linode_spec.get('image')] )
         
-        logger.msg("Create node")
+        try:
+            plan = self.plan_linode(linode_spec, boot)
+        except PlanError as e:
+            logger.error_msg(str(e))
+            return None
         
-        linode = Linode()
-        linode.inited = False
+        if journal is None and self.app_ctx.get('journal-dir'):
+            journal = CreationJournal.create(self.app_ctx['journal-dir'], linode_spec, boot)
+        completed = dict(journal.results) if journal is not None else {}
         
-        linode_id = None
+        linode = Linode(completed.get('create_node'), plan.label, plan.group, plan.datacenter_id,
+            plan.plan_id, plan.ram_mb)
         
-        try:
-            success, linode_id, errors = lin.create_node(linode_spec['plan_id'], linode_spec['datacenter'])
-            linode.created = success
+        # Linode requires passwords to have atleast 2 of these 4 classes - lowercase, uppercase, numbers, digits.
+        # See https://github.com/nkrim/passwordgen for understanding the pattern.
+        # TODO Use Vault here
+        root_password = pattern.Pattern('%{cwds+^}[64]').generate()
+        root_ssh_key_file = self.app_ctx.get('root-ssh-key-file', '/home/karthik/.ssh/id_rsa.pub')
+        
+        # Creation is a graph of steps, each started as soon as the steps it depends on
+        # are done. Disks are created and waited for side by side, and the IP steps
+        # overlap with the disk jobs. Steps fail by raising CreationError, and return
+        # what's journaled about them.
+        
+        def journaled(step, func):
+            def run(results):
+                result = func(results)
+                if journal is not None:
+                    journal.record(step, result)
+                return result
+            return run
+            
+            
+        def wait_for_step_job(step, start_job, job_label = 'linode.disk.create'):
+            # Starts a job with start_job() -> (disk_id, job_id) and waits for it. If an earlier
+            # run of this creation already started the job, this only waits for it.
+            job = journal.jobs.get(step) if journal is not None else None
+            if job is None:
+                if journal is not None:
+                    delete_failed_disks(step)
+                disk_id, job_id = start_job()
+                if journal is not None:
+                    journal.record_job(step, job_id, disk_id)
+            else:
+                disk_id, job_id = job['disk_id'], job['job_id']
+                logger.msg('Linode %s: Resume waiting for job %d of step %s' % (linode.id, job_id, step))
+            
+            result = self.wait_for_jobs([(linode.id, job_id)], job_label)[0]
+            if not result['success']:
+                logger.error_msg('Linode %s: Job %d of step %s failed. Aborting. %s' % (linode.id, job_id, step, result))
+                if result['finished'] and journal is not None:
+                    # Start over on resume. A job that's only taking long is waited for again.
+                    journal.record_job_failed(step)
+                raise CreationError()
+            return disk_id
+            
+            
+        def delete_failed_disks(step):
+            # Disks that failed jobs of earlier runs of this step left on the linode. They'd
+            # use up the plan's disk space, so they're deleted before the step creates another.
+            for disk_id in list(journal.failed_disks.get(step, [])):
+                logger.msg('Linode %s: Delete disk %s of a failed job of step %s' % (linode.id, disk_id, step))
+                success, job_id, errors = self.client.delete_disk(linode.id, disk_id)
+                if success:
+                    result = self.wait_for_jobs([(linode.id, job_id)], 'linode.disk.delete')[0]
+                    if not result['success']:
+                        logger.error_msg('Linode %s: Delete disk %s failed. %s' % (linode.id, disk_id, result))
+                        raise CreationError()
+                elif not errors or any([e.get('ERRORCODE') != ERROR_NOT_FOUND for e in errors]):
+                    logger.error_msg('Linode %s: Delete disk %s failed. %s' % (linode.id, disk_id, errors))
+                    raise CreationError()
+                journal.record_disk_deleted(step, disk_id)
+            
+            
+        def create_node(results):
+            logger.msg("Create node")
+            success, linode_id, errors = self.client.create_node(plan.plan_id, plan.datacenter_id, do_validations = False)
             linode.id = linode_id
             if not success:
-                logger.error_msg("Create node failed." + errors)
+                logger.error_msg("Create node failed." + str(errors))
                 raise CreationError()
                 
             logger.msg("Created node %d" % (linode.id))
+            return linode_id
+            
             
-            logger.msg("Update node label")
-            label = linode_spec['label']
+        def update_label(results):
+            logger.msg("Linode %s: Update node label" % (linode.id))
+            label = plan.label
             if '{linode_id}' in label:
-                label = label.replace('{linode_id}', str(linode_id))
-            success, linode_id, errors = lin.update_node(linode_id, label, linode_spec['group'])
+                label = label.replace('{linode_id}', str(linode.id))
+            success, linode_id, errors = self.client.update_node(linode.id, label, plan.group)
             if not success:
-                logger.warning_msg("Update node failed but continuing." + errors)
+                # If update node fails, don't abort because it's not a critical failure.
+                logger.warn_msg("Update node failed but continuing." + str(errors))
+            return label
                 
-            # If update node fails, don't abort because it's not a critical failure.
-            
-            # Linode requires passwords to have atleast 2 of these 4 classes - lowercase, uppercase, numbers, digits.
-            # See https://github.com/nkrim/passwordgen for understanding the pattern.
-            # TODO Use Vault here
-            root_password = pattern.Pattern('%{cwds+^}[64]').generate()
-            root_ssh_key_file = '/home/karthik/.ssh/id_rsa.pub'
-            
-            jobs = []
-            
-            disks = []
-            
-            distro = linode_spec.get('distribution')
-            image_label = linode_spec.get('image')
-            
-            if image_label:
-                logger.msg("Create boot disk from image '%s'" % (image_label)) 
                 
-                img_mgr = image_manager.ImageManager(self.app_ctx)
+        def boot_disk(results):
+            if plan.image_label:
+                logger.msg("Linode %s: Create boot disk from image '%s'" % (linode.id, plan.image_label))
+                
+                img_mgr = image_manager.ImageManager(self.app_ctx, self.client)
                 
                 disk_spec = {
-                    'linode_id' : linode_id,
+                    'linode_id' : linode.id,
                     'label' : 'boot', 
-                    'disk_size' : linode_spec['disks']['boot']['disk_size'], 
+                    'disk_size' : plan.boot_disk_size, 
                     'root_password' : root_password,
                     'root_ssh_key_file' : root_ssh_key_file
                 }
                 
-                success, disk_details, errors = img_mgr.create_disk_from_image(image_label, disk_spec)
-                
-                if not success:
-                    logger.error_msg("Create disk from image failed." + errors)
+                # This waits for the disk job itself, so its job isn't journaled.
+                result = img_mgr.create_disk_from_image(plan.image_label, disk_spec)
+                if result is None or not result[0]:
+                    logger.error_msg("Create disk from image failed." + str(result and result[2]))
                     raise CreationError()
                 
-                assert disk_details['disk_id']
-                disk_id = disk_details['disk_id']
+                disk_id = result[1]['disk_id']
+                assert disk_id
                 
-            elif distro:
-                logger.msg("Create boot disk from distribution")
+            else:
+                logger.msg("Linode %s: Create boot disk from distribution" % (linode.id))
                 
-                success, disk_id, disk_job_id, errors = lin.create_disk_from_distribution(linode_id, 
-                    linode_spec['distribution'], linode_spec['disks']['boot']['disk_size'], 
-                    root_password, root_ssh_key_file)
+                def start_job():
+                    success, disk_id, disk_job_id, errors = self.client.create_disk_from_distribution(linode.id, 
+                        plan.distribution_id, plan.boot_disk_size, root_password, root_ssh_key_file)
+                    
+                    if not success:
+                        logger.error_msg("Create disk from distribution failed." + str(errors))
+                        raise CreationError()
+                        
+                    logger.msg("Linode %s: Creating boot disk %d, job %d" % (linode.id, disk_id, disk_job_id))
+                    return disk_id, disk_job_id
+                    
+                disk_id = wait_for_step_job('boot_disk', start_job)
                 
-                if not success:
-                    logger.error_msg("Create disk from distribution failed." + errors)
-                    raise CreationError()
+            return disk_id
             
             
-                jobs.append( (linode_id, disk_job_id) )
-                print("Creating boot disk %d, job %d" % (disk_id, disk_job_id))
+        def swap_disk(results):
+            def start_job():
+                logger.msg("Linode %s: Create swap disk" % (linode.id))
+                # The plan computed the size from the RAM of the plan, so this doesn't look it up.
+                success, swap_disk_id, swap_job_id, errors = self.client.create_swap_disk(linode.id, plan.swap_disk_size)
+                if not success:
+                    logger.error_msg("Create swap disk failed." + str(errors))
+                    raise CreationError()
+                return swap_disk_id, swap_job_id
                 
-            linode.boot_disk_id = disk_id
-            disks.append(disk_id)
+            return wait_for_step_job('swap_disk', start_job)
             
             
-            swap_disk = linode_spec['disks'].get('swap')
-            if swap_disk is not None:
-                logger.msg("Create swap disk")
-                swap_disk_size_mb = swap_disk['disk_size']
-                if str(swap_disk_size_mb) == 'auto':
-                     swap_disk_size_mb = None
+        def other_disk_step(step, other_disk):
+            def start_job():
+                # The plan already turned types other than 'ext4|ext3|swap|raw' into raw.
+                success, other_disk_id, other_disk_job_id, errors = self.client.create_disk(
+                    linode.id, 
+                    other_disk['type'], 
+                    other_disk['disk_size'], 
+                    other_disk['label'])
                     
-                success, swap_disk_id, swap_job_id, errors = lin.create_swap_disk(linode_id, swap_disk_size_mb)
                 if not success:
-                    logger.error_msg("Create swap disk failed." + errors)
+                    logger.error_msg('other disk creation failed.' + str(errors))
                     raise CreationError()
-                    
-                jobs.append( (linode_id, swap_job_id) )
-                disks.append(swap_disk_id)
-            
-            
-            other_disks = linode_spec['disks'].get('others')
-            if other_disks is not None:
-                logger.msg('Create additional disks')
                 
-                for other_disk in other_disks:
-                    
-                    # disk type should be one of 'ext4|ext3|swap|raw'. If
-                    # it's a different filesystem, leave it as raw and create
-                    # filesystem during provisioning.
-                    disk_type = other_disk['type']
-                    if disk_type not in ['ext4', 'ext3', 'swap']:
-                        disk_type = 'raw'
-                    
-                    success, other_disk_id, other_disk_job_id, errors = lin.create_disk(
-                        linode_id, 
-                        disk_type, 
-                        other_disk['disk_size'], 
-                        other_disk['label'])
-                        
-                    if not success:
-                        logger.error_msg('other disk creation failed.' + errors)
-                        raise CreationError()
-                    
-                    logger.msg('Created additional disk:%d' % (other_disk_id))
-                    
-                    jobs.append( (linode_id, other_disk_job_id) )
-                    disks.append(other_disk_id)
-            
+                logger.msg('Linode %s: Created additional disk:%d' % (linode.id, other_disk_id))
+                return other_disk_id, other_disk_job_id
                 
-            results = self.wait_for_jobs(jobs)
+            return lambda results: wait_for_step_job(step, start_job)
             
-            for r in results:
-                if not r['success']:
-                    logger.error_msg("Job failed. Aborting")
-                    print(r)
-                    raise CreationError()
             
-            print("Create configuration")
-            success, config_id, errors = lin.create_config(linode_id, linode_spec['kernel'], 
-                disks,  'testconfig')
+        def create_config(results):
+            logger.msg("Linode %s: Create configuration" % (linode.id))
+            # Disks are attached in the order of the spec: boot, swap, others.
+            disks = [results[name] for name in disk_steps]
+            success, config_id, errors = self.client.create_config(linode.id, plan.kernel_id, 
+                disks,  'testconfig', do_validations = False)
             if not success:
-                logger.error_msg('Configuration failed.' + errors)
+                logger.error_msg('Configuration failed.' + str(errors))
                 raise CreationError()
+            return config_id
+            
             
-            print("Configure private IP")
-            success, linode.private_ip = lin.add_private_ip(linode_id)
+        def private_ip(results):
+            logger.msg("Linode %s: Configure private IP" % (linode.id))
+            success, private_ip = self.client.add_private_ip(linode.id)
             if not success:
-                print("Private IP failed")
+                logger.error_msg("Linode %s: Private IP failed" % (linode.id))
                 raise CreationError()
-            print('Private IP: %s' % (linode.private_ip))
+            logger.msg('Linode %s: Private IP: %s' % (linode.id, private_ip))
+            return private_ip
             
-            linode.public_ip = [lin.get_public_ip_address(linode_id)]
-            print('Public IP: %s' % (linode.public_ip))
             
-            logger.success_msg('Linode Created')
+        def public_ip(results):
+            public_ip = [self.client.get_public_ip_address(linode.id)]
+            logger.msg('Linode %s: Public IP: %s' % (linode.id, public_ip))
+            return public_ip
             
-            if boot:
-                print("Booting")
-                success, boot_job_id, errors = lin.boot_node(linode_id, config_id)
-                if not success:
-                    logger.error_msg('Booting failed.' + errors)
-                    raise CreationError()
-
-                finished, success = self.wait_for_job(linode_id, boot_job_id)
+            
+        def boot_linode(results):
+            def start_job():
+                logger.msg("Linode %s: Booting" % (linode.id))
+                success, boot_job_id, errors = self.client.boot_node(linode.id, results['create_config'])
                 if not success:
-                    logger.error_msg('Booting failed')
+                    logger.error_msg('Booting failed.' + str(errors))
                     raise CreationError()
-                    
-                logger.success_msg('Linode Booted')
+                return None, boot_job_id
                 
-            linode.inited = True
+            # Through the job watcher, so that concurrent creations share boot polls.
+            wait_for_step_job('boot', start_job, 'linode.boot')
+            logger.success_msg('Linode %s: Booted' % (linode.id))
+            
             
-            return linode
+        graph = StepGraph()
+        graph.add('create_node', journaled('create_node', create_node))
+        graph.add('update_label', journaled('update_label', update_label), ['create_node'])
+        
+        disk_steps = ['boot_disk']
+        graph.add('boot_disk', journaled('boot_disk', boot_disk), ['create_node'])
+        if plan.swap_disk_size is not None:
+            disk_steps.append('swap_disk')
+            graph.add('swap_disk', journaled('swap_disk', swap_disk), ['create_node'])
+        for i, other_disk in enumerate(plan.other_disks):
+            step = 'other_disk_%d' % (i)
+            disk_steps.append(step)
+            graph.add(step, journaled(step, other_disk_step(step, other_disk)), ['create_node'])
+            
+        graph.add('create_config', journaled('create_config', create_config), disk_steps)
+        graph.add('private_ip', journaled('private_ip', private_ip), ['create_node'])
+        graph.add('public_ip', journaled('public_ip', public_ip), ['private_ip'])
+        if boot:
+            # The private IP is configured by the network helper at boot, so it must exist by then.
+            graph.add('boot', journaled('boot', boot_linode), ['create_config', 'private_ip'])
+        
+        try:
+            results = graph.run(completed)
             
         except Exception as e:
             
-            if delete_on_error:
+            if linode.id is None:
+                logger.error_msg('Creation failed:%s\n%s' % (e, traceback.format_exc()))
+                # Nothing was created, so there's nothing to resume.
+                if journal is not None:
+                    journal.finish()
+                    
+            elif delete_on_error:
                 # Delete the temporarily created linode.
                 logger.error_msg('Deleting node due to error:%s\n%s' % (e, traceback.format_exc()))
-                deleted, _, errors = lin.delete_node(linode_id, True)
+                deleted, _, errors = self.client.delete_node(linode.id, True)
                 if not deleted:
-                    logger.warn_msg('Warning: Unable to delete node. Please delete from Linode Manager.' + errors)
+                    if self.reaper is not None:
+                        self.reaper.track_linode(linode.id, 'Failed creation:%s' % (errors))
+                    else:
+                        logger.warn_msg('Warning: Unable to delete node. Please delete from Linode Manager.' + str(errors))
+                        
+                # Nothing is left to resume, unless the linode couldn't be deleted and
+                # no reaper will. Then discard_linode() can try again.
+                if journal is not None and (deleted or self.reaper is not None):
+                    journal.finish()
+                    
+            elif journal is not None:
+                logger.error_msg('Creation failed:%s\n%s' % (e, traceback.format_exc()))
+                logger.error_msg('Linode %s is kept. Resume its creation from journal %s' % (linode.id, journal.path))
                 
             return None
+            
+        linode.created = True
+        linode.label = results['update_label']
+        linode.status = lin.STATUS_RUNNING if boot else lin.STATUS_BRAND_NEW
+        linode.boot_disk_id = results['boot_disk']
+        linode.private_ip = results['private_ip']
+        linode.public_ip = results['public_ip']
+        
+        if journal is not None:
+            journal.finish()
+        
+        # The chain of steps that this creation took as long as.
+        linode.critical_path = graph.critical_path()
+        logger.msg('Critical path: %s' % (format_path(linode.critical_path)))
+        
+        logger.success_msg('Linode Created')
+        linode.inited = True
+        
+        return linode
 
 
-    def wait_for_jobs(self, linodes_jobs):
-        # Multithreaded wait for jobs
+    def create_linodes(self, linode_specs, max_parallel = 8, datacenter_limits = None,
+        boot = True, delete_on_error = True):
+        ''' Create many linodes concurrently.
+        
+        Creations share this Core's client - and so its catalog cache and connections - 
+        and its job watcher, so the jobs of all of them are polled together.
+        
+        Args:
+            - linode_specs : List of linode_specs, as accepted by :meth:`create_linode`.
+            - max_parallel : Max number of linodes being created at once.
+            - datacenter_limits : Optional dict of datacenter (ID, location or abbreviation)
+                to max number of linodes being created at once in it. The '*' key applies
+                to all other datacenters. Limits must be at least 1.
+            - boot, delete_on_error : As for :meth:`create_linode`. Failed members are deleted
+                by the thread that created them, without holding up the others.
+        
+        Returns:
+            An iterator of (index, linode) tuples in the order linodes become ready,
+            where `index` is the index of the spec in `linode_specs` and `linode` is
+            a Linode object, or None if that creation failed.
+        '''
+        if max_parallel < 1:
+            raise ValueError('max_parallel must be at least 1, not %s' % (max_parallel))
+        limits = {}
+        for dc, limit in (datacenter_limits or {}).items():
+            if limit is not None and limit < 1:
+                # No creation in that datacenter could ever start.
+                raise ValueError('Limit of datacenter %s must be at least 1, not %s' % (dc, limit))
+            limits[dc if dc == '*' else self.client.get_datacenter(dc)] = limit
+        
+        pending = collections.deque()
+        for i, linode_spec in enumerate(linode_specs):
+            pending.append( (i, linode_spec, self.client.get_datacenter(linode_spec.get('datacenter'))) )
+        
+        running = collections.defaultdict(int)     # datacenter ID -> creations in progress
+        cond = threading.Condition()
+        results = Queue.Queue()
+        
+        def next_spec():
+            # Returns the first pending spec whose datacenter is below its limit, or None when done.
+            with cond:
+                while pending:
+                    for item in pending:
+                        dc = item[2]
+                        limit = limits.get(dc, limits.get('*'))
+                        if limit is None or running[dc] < limit:
+                            pending.remove(item)
+                            running[dc] += 1
+                            return item
+                    cond.wait()
+                return None
+        
+        def work():
+            while True:
+                item = next_spec()
+                if item is None:
+                    return
+                
+                i, linode_spec, dc = item
+                try:
+                    linode = self.create_linode(linode_spec, boot, delete_on_error)
+                except Exception as e:
+                    logger.error_msg('Create linode %d failed:%s\n%s' % (i, e, traceback.format_exc()))
+                    linode = None
+                finally:
+                    with cond:
+                        running[dc] -= 1
+                        cond.notify_all()
+                results.put( (i, linode) )
+        
+        for n in range(min(max_parallel, len(pending))):
+            t = threading.Thread(target = work, name = 'create-linodes-%d' % (n))
+            t.daemon = True
+            t.start()
+        
+        def iter_results():
+            for n in range(len(linode_specs)):
+                yield results.get()
+        
+        # Creations start now, not when the caller starts iterating.
+        return iter_results()
+        
+        
+    def resume_linode(self, journal):
+        '''
+        Resume a creation that crashed or failed, from the last step its
+        :class:`journal.CreationJournal` recorded. Returns what :meth:`create_linode` does.
+        '''
+        logger.msg('Resume creation of linode %s from %s' % (journal.linode_id, journal.path))
+        return self.create_linode(journal.linode_spec, journal.boot, journal = journal)
+        
+        
+    def resume_linodes(self):
+        '''
+        Resume all unfinished creations journaled in app_ctx['journal-dir'].
+        
+        Returns:
+            A list of (journal, linode) tuples, where linode is None if that creation failed again.
+        '''
+        journals = pending_journals(self.app_ctx['journal-dir'])
+        return [(journal, self.resume_linode(journal)) for journal in journals]
+        
+        
+    def discard_linode(self, journal):
+        '''
+        Give up on a journaled creation: delete its linode, if it was created, and the journal.
+        '''
+        if journal.linode_id is not None:
+            deleted, _, errors = self.client.delete_node(journal.linode_id, True)
+            if not deleted:
+                logger.warn_msg('Warning: Unable to delete node. Please delete from Linode Manager.' + str(errors))
+                return False
+        journal.finish()
+        return True
+        
+        
+    def plan_linode(self, linode_spec, boot = True):
+        '''
+        Resolve a linode_spec against the cached catalogs without creating anything.
+        
+        Returns:
+            A :class:`planner.LinodePlan`. Its call_count() is the number of API calls
+            create_linode will make, not counting job polls.
+            
+        Raises:
+            PlanError if the spec is invalid.
+        '''
+        plan = plan_linode(self.client, linode_spec, boot)
+        if plan.image_label:
+            img_mgr = image_manager.ImageManager(self.app_ctx, self.client)
+            if not img_mgr.check_image_exists(plan.image_label):
+                raise PlanError(["Image '%s' does not exist" % (plan.image_label)])
+        return plan
+        
+        
+    def wait_for_jobs(self, linodes_jobs, job_label = 'linode.disk.create'):
+        # Wait for many jobs at once. All of them are polled by the job watcher's
+        # single thread, with one linode.job.list per linode per poll.
         # linodes_jobs is a list of (linode_id, job_id) tuples
         #
-        # Returns an iterable with (linode_id, job_id, finished, success) tuples
+        # Returns a list of dicts with linode_id, job_id, finished and success keys,
+        # in the same order.
         
-        def job_waiter(q, results):
-            linode_id, job_id = q.get()
-            finished, success = self.wait_for_job(linode_id, job_id)
+        futures = self.job_watcher.watch_all(linodes_jobs, job_label)
+        
+        results = []
+        for (linode_id, job_id), future in zip(linodes_jobs, futures):
+            finished, success = future.result()
             results.append( {
                 'linode_id' : linode_id, 
                 'job_id' : job_id, 
                 'finished' : finished, 
                 'success' : success} )
-            q.task_done()
-            
-            
-        q = Queue.Queue()
-        results = collections.deque()
-        
-        threads = []
-        for linode_id, job_id in linodes_jobs:
-            t = threading.Thread( target = job_waiter, args = (q, results) )
-            t.start()
-            threads.append(t)
-
-        for item in linodes_jobs:
-            q.put(item)
-
-        # block until all tasks are done
-        q.join()
-
-        # stop workers
-        for t in threads:
-            t.join()
             
         return results
             
         
-    def wait_for_job(self, linode_id, job_id):
-        timeout = 240 # 4 minutes
-        poll_interval = 5 # seconds
-        poll_count = timeout / poll_interval
+    def wait_for_job(self, linode_id, job_id, job_label = 'job'):
+        # job_label names the kind of job, both in the job duration metrics and
+        # for the poll policy to learn how long such jobs take.
+        start = time.time()
+        deadline = start + self.poll_policy.timeout_for(job_label)
+        finished, success = False, None
         
-        for i in range(poll_count):
-            time.sleep(poll_interval)
-            finished, success = lin.is_job_finished(linode_id, job_id)
+        for delay in self.poll_policy.delays(job_label):
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                logger.error_msg('Timed out waiting for job %d for linode %d' % (job_id, linode_id))
+                break
+            
+            if delay > 0:
+                time.sleep(min(delay, remaining))
+            finished, success = self.client.is_job_finished(linode_id, job_id)
             if finished is None:
                 logger.error_msg('No such job %d for linode %d' % (job_id, linode_id))
                 break
             
             if finished is True:
                 logger.msg('Finished job %d for linode %d' % (job_id, linode_id))
+                self.poll_policy.record(job_label, time.time() - start)
                 break
        
+        if lin.METRICS:
+            lin.api_metrics.record_job(job_label, time.time() - start, success if finished else None)
         return finished, success
 
 
 class Linode(object):
-    def __init__(self):
-        pass
+    '''
+    A linode, as created by :meth:`Core.create_linode` or read from linode.list.
+    
+    Only the attributes in __slots__ can be set, which keeps the records of large
+    fleets small. Slotted objects have no __dict__: serialize them with :meth:`to_dict`.
+    For bulk work over many linodes, see :class:`fleet.Fleet`.
+    
+    Attributes:
+        - id : Linode ID.
+        - label, group : Label and display group.
+        - datacenter_id, plan_id, ram_mb : Where and how big it is.
+        - status : linode.list STATUS (-1 being created, 0 brand new, 1 running, 2 powered off).
+        - private_ip : Private IP address, or None.
+        - public_ip : List of public IP addresses.
+        - boot_disk_id : Disk ID of the boot disk.
+        - created : Whether the linode exists.
+        - inited : Whether its creation finished.
+        - critical_path : List of (step, seconds) tuples of the longest chain of steps of its creation.
+    '''
+    
+    __slots__ = ('id', 'label', 'group', 'datacenter_id', 'plan_id', 'ram_mb', 'status',
+        'private_ip', 'public_ip', 'boot_disk_id', 'created', 'inited', 'critical_path')
+    
+    def __init__(self, id = None, label = None, group = None, datacenter_id = None, plan_id = None,
+        ram_mb = None, status = None, private_ip = None, public_ip = None, boot_disk_id = None):
+        self.id = id
+        self.label = label
+        self.group = group
+        self.datacenter_id = datacenter_id
+        self.plan_id = plan_id
+        self.ram_mb = ram_mb
+        self.status = status
+        self.private_ip = private_ip
+        self.public_ip = public_ip if public_ip is not None else []
+        self.boot_disk_id = boot_disk_id
+        self.created = False
+        self.inited = False
+        self.critical_path = None
+        
+        
+    @classmethod
+    def from_node(cls, node, ips = ()):
+        '''
+        Returns a Linode of a linode.list record, and optionally its linode.ip.list records.
+        '''
+        linode = cls(node['LINODEID'], node.get('LABEL'), node.get('LPM_DISPLAYGROUP'),
+            node.get('DATACENTERID'), node.get('PLANID'), node.get('TOTALRAM'), node.get('STATUS'))
+        for ip in ips:
+            if ip['ISPUBLIC']:
+                linode.public_ip.append(ip['IPADDRESS'])
+            elif linode.private_ip is None:
+                linode.private_ip = ip['IPADDRESS']
+        linode.created = True
+        linode.inited = True
+        return linode
+        
+        
+    def to_dict(self):
+        return dict([(name, getattr(self, name)) for name in self.__slots__])
+        
+        
+    def __repr__(self):
+        return 'Linode(id=%r, label=%r)' % (self.id, self.label)
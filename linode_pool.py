@@ -0,0 +1,243 @@
+import copy
+import time
+import threading
+import collections
+
+import logger
+from metrics import Histogram
+
+
+# Display group of the linodes waiting in a pool.
+POOL_GROUP = 'linode-pool'
+
+# Bucket upper bounds in seconds. Hits take a linode.update, misses a whole creation.
+ACQUIRE_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+
+class LinodePool(object):
+    '''
+    Keeps pre-created linodes ready, so that acquiring one takes a linode.update
+    instead of a whole creation.
+
+    Linodes are pooled per resolved spec - plan, datacenter, image or distribution,
+    kernel and disks - so a spec is served by linodes built from any spec that resolves
+    the same. Pooled linodes wait in the POOL_GROUP display group, and acquiring one
+    relabels it into the caller's label and group. The pool is topped up and its
+    surplus deleted by :meth:`replenish`, which a background thread calls every
+    `interval` seconds after :meth:`start`, and right after each acquisition.
+
+    Pooled linodes are billed like any other, booted ones included.
+
+    Example:
+        pool = LinodePool(core)
+        pool.reserve(web_spec, 3)
+        pool.start()
+        ...
+        linode = pool.acquire(web_spec, 'web-{linode_id}', 'web')
+    '''
+
+    def __init__(self, core, boot = True, group = POOL_GROUP, max_parallel = 4):
+        '''
+        Args:
+            - core : The :class:`linode_core.Core` linodes are created with.
+            - boot : Whether pooled linodes are booted.
+            - group : Display group of pooled linodes.
+            - max_parallel : Max number of linodes being created at once to refill the pool.
+        '''
+        self.core = core
+        self.boot = boot
+        self.group = group
+        self.max_parallel = max_parallel
+
+        self._lock = threading.Lock()
+        self._targets = {}                              # key -> (linode_spec, count)
+        self._warm = collections.defaultdict(collections.deque)   # key -> Linodes
+        self._creating = collections.defaultdict(int)   # key -> creations in progress
+        self._replenish_lock = threading.Lock()
+
+        self._thread = None
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+
+        self.hits = 0
+        self.misses = 0
+        self.created = 0
+        self.failed = 0
+        self.reaped = 0
+        self.acquire_latency = Histogram(ACQUIRE_BUCKETS)
+
+
+    def reserve(self, linode_spec, count):
+        '''
+        Keep `count` linodes of `linode_spec` ready. A count of 0 stops pooling the
+        spec, and its pooled linodes are deleted by the next replenish.
+
+        Raises:
+            PlanError if the spec is invalid.
+        '''
+        key = self._key(linode_spec)
+        with self._lock:
+            self._targets[key] = (copy.deepcopy(linode_spec), count)
+        self._wakeup.set()
+
+
+    def acquire(self, linode_spec, label = None, group = None):
+        '''
+        Returns a Linode of `linode_spec` labelled `label` in display group `group`, which
+        default to those of the spec. A pooled linode is used if there's one, otherwise
+        a new one is created. Returns None if that creation fails.
+        '''
+        start = time.time()
+        key = self._key(linode_spec)
+        label = label if label is not None else linode_spec['label']
+        group = group if group is not None else linode_spec['group']
+
+        with self._lock:
+            warm = self._warm.get(key)
+            linode = warm.popleft() if warm else None
+
+        if linode is not None:
+            hit = True
+            if '{linode_id}' in label:
+                label = label.replace('{linode_id}', str(linode.id))
+            success, linode_id, errors = self.core.client.update_node(linode.id, label, group)
+            if success:
+                linode.label = label
+                linode.group = group
+            else:
+                logger.warn_msg('Relabelling pooled linode %d failed but continuing. %s' % (linode.id, errors))
+        else:
+            hit = False
+            linode_spec = dict(linode_spec, label = label, group = group)
+            linode = self.core.create_linode(linode_spec, self.boot)
+
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+            self.acquire_latency.observe(time.time() - start)
+
+        # Top up the pool now rather than at the next interval.
+        self._wakeup.set()
+        return linode
+
+
+    def replenish(self):
+        '''
+        Create linodes for specs below their reserved count, and delete pooled linodes
+        beyond it. Blocks until the creations finish.
+        '''
+        with self._replenish_lock:
+            todo = []
+            surplus = []
+            with self._lock:
+                for key in set(self._targets.keys()) | set(self._warm.keys()):
+                    linode_spec, count = self._targets.get(key, (None, 0))
+                    warm = self._warm[key]
+                    missing = count - len(warm) - self._creating[key]
+                    if missing > 0:
+                        todo.extend([(key, linode_spec)] * missing)
+                        self._creating[key] += missing
+                    while len(warm) > count:
+                        surplus.append(warm.pop())
+
+            done = set()
+            try:
+                for linode in surplus:
+                    deleted, _, errors = self.core.client.delete_node(linode.id, 1)
+                    if deleted:
+                        with self._lock:
+                            self.reaped += 1
+                    else:
+                        logger.warn_msg('Deleting pooled linode %d failed. %s' % (linode.id, errors))
+                        if self.core.reaper is not None:
+                            self.core.reaper.track_linode(linode.id, 'Surplus pooled linode:%s' % (errors))
+
+                if not todo:
+                    return
+
+                specs = [dict(linode_spec, label = 'pool-{linode_id}', group = self.group) for key, linode_spec in todo]
+                for i, linode in self.core.create_linodes(specs, self.max_parallel, boot = self.boot):
+                    key = todo[i][0]
+                    with self._lock:
+                        done.add(i)
+                        self._creating[key] -= 1
+                        if linode is None:
+                            self.failed += 1
+                        else:
+                            self.created += 1
+                            self._warm[key].append(linode)
+            finally:
+                # Creations that never ran, or whose results were lost, no longer count
+                # as in progress, so the next replenish tops up their specs again.
+                with self._lock:
+                    for i, (key, linode_spec) in enumerate(todo):
+                        if i not in done:
+                            self._creating[key] -= 1
+
+
+    def start(self, interval = 60):
+        '''
+        Start a daemon thread that calls :meth:`replenish` every `interval` seconds,
+        and after each acquisition.
+        '''
+        if self._thread is not None:
+            return
+
+        self._stop.clear()
+
+        def replenisher():
+            while not self._stop.is_set():
+                try:
+                    self.replenish()
+                except Exception as e:
+                    logger.error_msg('Replenishing linode pool failed:%s' % (e))
+                self._wakeup.wait(interval)
+                self._wakeup.clear()
+
+        self._thread = threading.Thread(target = replenisher, name = 'linode-pool')
+        self._thread.daemon = True
+        self._thread.start()
+
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._wakeup.set()
+        self._thread.join()
+        self._thread = None
+
+
+    def drain(self):
+        '''
+        Stop pooling all specs and delete all pooled linodes.
+        '''
+        with self._lock:
+            for key, (linode_spec, count) in self._targets.items():
+                self._targets[key] = (linode_spec, 0)
+        self.replenish()
+
+
+    def stats(self):
+        with self._lock:
+            acquisitions = self.hits + self.misses
+            return {
+                'warm' : sum([len(warm) for warm in self._warm.values()]),
+                'creating' : sum(self._creating.values()),
+                'hits' : self.hits,
+                'misses' : self.misses,
+                'hit_ratio' : float(self.hits) / acquisitions if acquisitions else None,
+                'created' : self.created,
+                'failed' : self.failed,
+                'reaped' : self.reaped,
+                'acquire_latency' : self.acquire_latency.to_dict()
+            }
+
+
+    def _key(self, linode_spec):
+        plan = self.core.plan_linode(linode_spec, self.boot)
+        return (plan.plan_id, plan.datacenter_id, plan.image_label, plan.distribution_id, plan.kernel_id,
+            plan.boot_disk_size, plan.swap_disk_size,
+            tuple([(d['label'], d['type'], d['disk_size']) for d in plan.other_disks]))
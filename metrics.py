@@ -0,0 +1,167 @@
+import bisect
+import threading
+
+
+# Bucket upper bounds in seconds.
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+JOB_DURATION_BUCKETS = (5, 10, 20, 30, 60, 90, 120, 180, 240, 360, 600)
+
+
+class Histogram(object):
+    '''
+    Cumulative histogram in the Prometheus style: counts of observations
+    less than or equal to each bucket bound, plus their sum and count.
+    '''
+
+    def __init__(self, buckets):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+
+    def observe(self, value):
+        # Caller must hold the lock of the owning Metrics object.
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+    def to_dict(self):
+        cumulative = []
+        total = 0
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            total += count
+            cumulative.append( (bound, total) )
+
+        return {
+            'buckets' : cumulative,
+            'sum' : self.sum,
+            'count' : self.count
+        }
+
+
+
+class ApiMetrics(object):
+    '''
+    Per api_action call counts, latency histograms, bytes transferred and error
+    codes, plus job duration histograms per job label.
+
+    Export a snapshot with :meth:`to_dict` or :meth:`to_prometheus`.
+    '''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+
+    def reset(self):
+        with self._lock:
+            self.calls = {}
+            self.latency = {}
+            self.bytes_sent = {}
+            self.bytes_received = {}
+            self.errors = {}
+            self.exceptions = {}
+            self.job_durations = {}
+
+
+    def record_call(self, action, duration, bytes_sent = 0, bytes_received = 0, error_codes = None):
+        with self._lock:
+            self.calls[action] = self.calls.get(action, 0) + 1
+            histogram = self.latency.get(action)
+            if histogram is None:
+                histogram = self.latency[action] = Histogram(LATENCY_BUCKETS)
+            histogram.observe(duration)
+
+            self.bytes_sent[action] = self.bytes_sent.get(action, 0) + bytes_sent
+            self.bytes_received[action] = self.bytes_received.get(action, 0) + bytes_received
+
+            for code in error_codes or []:
+                key = (action, code)
+                self.errors[key] = self.errors.get(key, 0) + 1
+
+
+    def record_exception(self, action, exc):
+        with self._lock:
+            key = (action, type(exc).__name__)
+            self.exceptions[key] = self.exceptions.get(key, 0) + 1
+
+
+    def record_job(self, job_label, duration, success):
+        '''
+        Args:
+            - job_label : Kind of job, such as 'linode.boot' or 'disk'.
+            - duration : Seconds from when the wait started until the job was seen finished.
+            - success : True, False or None (no such job / timed out).
+        '''
+        outcome = {True : 'success', False : 'failure'}.get(success, 'unknown')
+        with self._lock:
+            key = (job_label, outcome)
+            histogram = self.job_durations.get(key)
+            if histogram is None:
+                histogram = self.job_durations[key] = Histogram(JOB_DURATION_BUCKETS)
+            histogram.observe(duration)
+
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                'calls' : dict(self.calls),
+                'latency' : dict([(a, h.to_dict()) for a, h in self.latency.items()]),
+                'bytes_sent' : dict(self.bytes_sent),
+                'bytes_received' : dict(self.bytes_received),
+                'errors' : dict([('%s:%s' % k, v) for k, v in self.errors.items()]),
+                'exceptions' : dict([('%s:%s' % k, v) for k, v in self.exceptions.items()]),
+                'job_durations' : dict([('%s:%s' % k, h.to_dict()) for k, h in self.job_durations.items()])
+            }
+
+
+    def to_prometheus(self, prefix = 'linode_api'):
+        '''
+        Returns a snapshot in the Prometheus text exposition format.
+        '''
+        lines = []
+        with self._lock:
+            self._counter(lines, prefix + '_calls_total', 'API calls by action.',
+                [({'action' : a}, v) for a, v in self.calls.items()])
+            self._counter(lines, prefix + '_bytes_sent_total', 'Request bytes sent by action.',
+                [({'action' : a}, v) for a, v in self.bytes_sent.items()])
+            self._counter(lines, prefix + '_bytes_received_total', 'Response bytes received by action.',
+                [({'action' : a}, v) for a, v in self.bytes_received.items()])
+            self._counter(lines, prefix + '_errors_total', 'API errors by action and ERRORCODE.',
+                [({'action' : a, 'code' : c}, v) for (a, c), v in self.errors.items()])
+            self._counter(lines, prefix + '_exceptions_total', 'Failed requests by action and exception.',
+                [({'action' : a, 'exception' : e}, v) for (a, e), v in self.exceptions.items()])
+            self._histograms(lines, prefix + '_request_duration_seconds', 'API call latency by action.',
+                [({'action' : a}, h) for a, h in self.latency.items()])
+            self._histograms(lines, prefix + '_job_duration_seconds', 'Job durations by job and outcome.',
+                [({'job' : j, 'outcome' : o}, h) for (j, o), h in self.job_durations.items()])
+
+        return '\n'.join(lines) + '\n'
+
+
+    def _counter(self, lines, name, help_text, samples):
+        lines.append('# HELP %s %s' % (name, help_text))
+        lines.append('# TYPE %s counter' % (name))
+        for labels, value in sorted(samples):
+            lines.append('%s%s %s' % (name, _labels(labels), value))
+
+
+    def _histograms(self, lines, name, help_text, samples):
+        lines.append('# HELP %s %s' % (name, help_text))
+        lines.append('# TYPE %s histogram' % (name))
+        for labels, histogram in sorted(samples):
+            d = histogram.to_dict()
+            for bound, count in d['buckets']:
+                bucket_labels = dict(labels)
+                bucket_labels['le'] = str(bound)
+                lines.append('%s_bucket%s %d' % (name, _labels(bucket_labels), count))
+            lines.append('%s_sum%s %s' % (name, _labels(labels), d['sum']))
+            lines.append('%s_count%s %d' % (name, _labels(labels), d['count']))
+
+
+
+def _labels(labels):
+    return '{%s}' % (','.join(['%s="%s"' % (k, str(v).replace('\\', '\\\\').replace('"', '\\"'))
+        for k, v in sorted(labels.items())]))
@@ -0,0 +1,146 @@
+import linode_api as lin
+
+from exc import PlanError
+
+
+# Types a disk can be created with. Other filesystems are created as raw disks
+# and formatted during provisioning.
+DISK_TYPES = ['ext4', 'ext3', 'swap', 'raw']
+
+
+class LinodePlan(object):
+    '''
+    A linode_spec resolved against the catalogs: every name is replaced by its ID,
+    and the swap size is computed from the plan's RAM. Executing a plan only sends
+    the calls listed by :meth:`calls` - no catalog lookups, validations or
+    linode.list calls to find the RAM of the new linode.
+    '''
+
+    def __init__(self):
+        self.plan_id = None
+        self.ram_mb = None
+        self.datacenter_id = None
+        self.distribution_id = None
+        self.distribution_label = None
+        self.image_label = None
+        self.kernel_id = None
+        self.kernel_label = None
+        self.label = None
+        self.group = None
+        self.boot_disk_size = None
+        self.swap_disk_size = None
+        self.other_disks = []       # [{'label', 'type', 'disk_size'}]
+        self.boot = True
+
+
+    def calls(self):
+        '''
+        Returns the API actions executing this plan sends, in order, not counting
+        polls of the disk and boot jobs.
+        '''
+        calls = ['linode.create', 'linode.update']
+        if self.image_label:
+            calls.append('linode.disk.createfromimage')
+        else:
+            calls.append('linode.disk.createfromdistribution')
+        if self.swap_disk_size is not None:
+            calls.append('linode.disk.create')
+        calls.extend(['linode.disk.create'] * len(self.other_disks))
+        calls.extend(['linode.config.create', 'linode.ip.addprivate', 'linode.ip.list'])
+        if self.boot:
+            calls.append('linode.boot')
+        return calls
+
+
+    def call_count(self):
+        return len(self.calls())
+
+
+    def job_count(self):
+        # One job per disk, plus the boot job.
+        return 1 + (self.swap_disk_size is not None) + len(self.other_disks) + (1 if self.boot else 0)
+
+
+    def to_dict(self):
+        d = dict(self.__dict__)
+        d['calls'] = self.calls()
+        d['call_count'] = self.call_count()
+        d['job_count'] = self.job_count()
+        return d
+
+
+
+def plan_linode(client, linode_spec, boot = True):
+    '''
+    Resolve a linode_spec, as accepted by :meth:`linode_core.Core.create_linode`,
+    into a :class:`LinodePlan`. Catalogs are read through the client's catalog cache,
+    so planning many linodes fetches each catalog at most once.
+
+    Raises:
+        PlanError with all the problems found in the spec.
+    '''
+    errors = []
+    plan = LinodePlan()
+    plan.boot = boot
+
+    plans = dict([(p['PLANID'], p) for p in client.get_plans()])
+    try:
+        plan.plan_id = int(linode_spec['plan_id'])
+    except (KeyError, TypeError, ValueError):
+        errors.append('Invalid plan %s' % (linode_spec.get('plan_id')))
+    else:
+        if plan.plan_id in plans:
+            plan.ram_mb = int(plans[plan.plan_id]['RAM'])
+        else:
+            errors.append('Invalid plan %s' % (plan.plan_id))
+
+    plan.datacenter_id = client.get_datacenter(linode_spec.get('datacenter'))
+    if plan.datacenter_id is None:
+        errors.append('Invalid datacenter %s' % (linode_spec.get('datacenter')))
+
+    plan.image_label = linode_spec.get('image')
+    distribution = linode_spec.get('distribution')
+    if not plan.image_label:
+        if not distribution:
+            errors.append('Either distribution or image is required')
+        else:
+            plan.distribution_id, plan.distribution_label = client.find_distribution(distribution)
+            if plan.distribution_id is None:
+                errors.append('Invalid distribution %s' % (distribution))
+
+    plan.kernel_id, plan.kernel_label = client.find_kernel(linode_spec.get('kernel'))
+    if plan.kernel_id is None:
+        errors.append('Invalid kernel %s' % (linode_spec.get('kernel')))
+
+    plan.label = linode_spec.get('label')
+    plan.group = linode_spec.get('group')
+
+    disks = linode_spec.get('disks') or {}
+    boot_disk = disks.get('boot') or {}
+    plan.boot_disk_size = boot_disk.get('disk_size')
+    if plan.boot_disk_size is None:
+        errors.append('Boot disk size is required')
+
+    swap_disk = disks.get('swap')
+    if swap_disk is not None:
+        swap_disk_size_mb = swap_disk.get('disk_size', 'auto')
+        if str(swap_disk_size_mb) == 'auto':
+            if plan.ram_mb is not None:
+                plan.swap_disk_size = lin.calc_swap_disk_size(plan.ram_mb)
+        else:
+            plan.swap_disk_size = int(swap_disk_size_mb)
+
+    for other_disk in disks.get('others') or []:
+        disk_type = other_disk.get('type')
+        if disk_type not in DISK_TYPES:
+            disk_type = 'raw'
+        plan.other_disks.append({
+            'label' : other_disk['label'],
+            'type' : disk_type,
+            'disk_size' : other_disk['disk_size']
+        })
+
+    if errors:
+        raise PlanError(errors)
+
+    return plan
@@ -0,0 +1,102 @@
+import threading
+import collections
+
+
+# Jobs done sooner than this are expected to be done on the first, immediate check.
+MIN_ESTIMATE = 1.0
+
+# The check after the immediate one happens at this fraction of the expected duration,
+# so that jobs that finish a bit early aren't waited on for a whole backoff step.
+ESTIMATE_FRACTION = 0.8
+
+
+class JobHistory(object):
+    '''
+    Recent durations of finished jobs per job label, such as 'linode.boot'.
+    '''
+
+    def __init__(self, size = 20):
+        self.size = size
+        self._lock = threading.Lock()
+        self._durations = {}
+
+
+    def record(self, job_label, duration):
+        with self._lock:
+            durations = self._durations.get(job_label)
+            if durations is None:
+                durations = self._durations[job_label] = collections.deque(maxlen = self.size)
+            durations.append(duration)
+
+
+    def estimate(self, job_label):
+        '''
+        Returns the median recent duration of `job_label` jobs, or None if there's no history.
+        '''
+        with self._lock:
+            durations = sorted(self._durations.get(job_label) or [])
+        if not durations:
+            return None
+        return durations[len(durations) / 2]
+
+
+    def clear(self):
+        with self._lock:
+            self._durations = {}
+
+
+# Shared by all poll policies by default, so that every Core learns from
+# the jobs the others waited on.
+shared_history = JobHistory()
+
+
+
+class PollPolicy(object):
+    '''
+    Decides when Core.wait_for_job checks a job, and when it gives up.
+
+    The first check is immediate. The second is at a fraction of the duration of
+    recent jobs of the same kind, if there are any, and later checks back off
+    exponentially from `min_interval` up to `max_interval`.
+    '''
+
+    def __init__(self, min_interval = 1.0, max_interval = 30.0, backoff = 2.0, timeout = 240,
+        timeouts = None, history = None):
+        '''
+        Args:
+            - min_interval, max_interval : Seconds between checks.
+            - backoff : Factor the interval grows by after each check.
+            - timeout : Seconds to wait for a job before giving up.
+            - timeouts : Optional dict of job label -> timeout for specific kinds of jobs.
+            - history : A :class:`JobHistory`. Defaults to the shared history.
+        '''
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.timeout = timeout
+        self.timeouts = dict(timeouts or {})
+        self.history = history if history is not None else shared_history
+
+
+    def delays(self, job_label):
+        '''
+        Yields the seconds to sleep before each check of a `job_label` job, forever.
+        '''
+        yield 0
+
+        estimate = self.history.estimate(job_label)
+        if estimate is not None and estimate >= MIN_ESTIMATE:
+            yield min(estimate * ESTIMATE_FRACTION, self.timeout_for(job_label))
+
+        interval = self.min_interval
+        while True:
+            yield interval
+            interval = min(interval * self.backoff, self.max_interval)
+
+
+    def timeout_for(self, job_label):
+        return self.timeouts.get(job_label, self.timeout)
+
+
+    def record(self, job_label, duration):
+        self.history.record(job_label, duration)
@@ -0,0 +1,195 @@
+import time
+import random
+import socket
+import httplib
+import threading
+
+from exc import TransportError
+
+
+# Linode API v3 error codes. See https://www.linode.com/api
+ERROR_BATCH_TIMEOUT = 12
+ERROR_RATE_LIMITED = 14
+
+# Errors that mean the request was rejected without being acted upon,
+# so it's safe to retry any action, even non-idempotent ones like linode.create.
+REJECTED_ERROR_CODES = set([ERROR_RATE_LIMITED])
+
+# Errors that are worth retrying, but only for idempotent actions because
+# the request may or may not have been acted upon.
+TRANSIENT_ERROR_CODES = set([ERROR_BATCH_TIMEOUT])
+
+# HTTP statuses that mean the server is throttling us.
+THROTTLED_HTTP_STATUSES = set([429, 503])
+
+# Exceptions raised by the transport for network level failures.
+TRANSIENT_EXCEPTIONS = (TransportError, socket.error, httplib.HTTPException)
+
+# Actions that can be repeated without side effects.
+IDEMPOTENT_ACTIONS = set(['test.echo', 'api.spec', 'account.info', 'user.getapikey'])
+
+
+def is_idempotent(action):
+    return (action in IDEMPOTENT_ACTIONS or action.startswith('avail.')
+        or action.endswith('.list'))
+
+
+def error_codes(response):
+    '''
+    Returns the set of ERRORCODEs in a response, or in all the responses of a batch.
+    '''
+    if isinstance(response, list):
+        codes = set()
+        for r in response:
+            codes.update(error_codes(r))
+        return codes
+
+    return set([e.get('ERRORCODE') for e in response.get('ERRORARRAY') or []])
+
+
+
+class AdaptiveRateLimiter(object):
+    '''
+    A token bucket shared by all threads, whose rate adapts to what the API
+    allows using AIMD (additive increase, multiplicative decrease):
+
+    - Every successful request raises the rate a little, so that the rate increases
+      by about `increase` requests/second for every second of sustained use.
+    - Every throttled request cuts the rate by `decrease_factor`.
+
+    This converges to just under the highest rate the API sustains.
+    '''
+
+    def __init__(self, rate = 20.0, burst = 40, min_rate = 0.5, max_rate = 100.0,
+        increase = 1.0, decrease_factor = 0.5):
+        '''
+        Args:
+            - rate : Initial rate in requests/second.
+            - burst : Max number of requests that can be sent back to back.
+            - min_rate, max_rate : Bounds of the adapted rate.
+            - increase : Additive increase in requests/second per second of use.
+            - decrease_factor : Multiplier applied to the rate when throttled.
+        '''
+        self.rate = float(rate)
+        self.burst = burst
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease_factor = decrease_factor
+
+        self._tokens = float(burst)
+        self._last_fill = time.time()
+        self._lock = threading.Lock()
+
+        self.requests = 0
+        self.throttled = 0
+        self.waited = 0.0
+
+
+    def acquire(self):
+        '''
+        Block until a request may be sent.
+        '''
+        while True:
+            with self._lock:
+                self._fill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    self.requests += 1
+                    return
+
+                wait = (1 - self._tokens) / self.rate
+                self.waited += wait
+
+            time.sleep(wait)
+
+
+    def on_success(self):
+        with self._lock:
+            # Each success adds increase/rate, which amounts to `increase` per
+            # second when running at the current rate.
+            self.rate = min(self.max_rate, self.rate + self.increase / self.rate)
+
+
+    def on_throttled(self):
+        with self._lock:
+            self.throttled += 1
+            self.rate = max(self.min_rate, self.rate * self.decrease_factor)
+            # Drain the bucket so that waiting callers don't burst again right away.
+            self._tokens = min(self._tokens, 0)
+
+
+    def stats(self):
+        with self._lock:
+            return {
+                'rate' : self.rate,
+                'requests' : self.requests,
+                'throttled' : self.throttled,
+                'waited' : self.waited
+            }
+
+
+    def _fill(self):
+        # Caller must hold self._lock
+        now = time.time()
+        self._tokens = min(self.burst, self._tokens + (now - self._last_fill) * self.rate)
+        self._last_fill = now
+
+
+
+class RetryPolicy(object):
+    '''
+    Decides which failed requests are retried, and how long to wait before each retry.
+    Waits grow exponentially with "full jitter", so that many throttled threads
+    don't all retry at the same moment.
+    '''
+
+    def __init__(self, max_retries = 5, base_delay = 0.5, max_delay = 30.0):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+        self.retries = 0
+
+
+    def should_retry_response(self, action, response, attempt):
+        if attempt >= self.max_retries:
+            return False
+
+        if isinstance(response, list):
+            # A batch is retried only if every action in it was rejected. Otherwise
+            # some actions have already been acted upon.
+            return bool(response) and all([is_throttled(r) for r in response])
+
+        codes = error_codes(response)
+        if codes & REJECTED_ERROR_CODES:
+            return True
+
+        return bool(codes & TRANSIENT_ERROR_CODES) and is_idempotent(action)
+
+
+    def should_retry_error(self, action, error, attempt):
+        if attempt >= self.max_retries:
+            return False
+
+        if isinstance(error, TransportError):
+            if error.status in THROTTLED_HTTP_STATUSES:
+                return True
+            if error.status < 500:
+                # The request itself is bad. Retrying won't help.
+                return False
+
+        return is_idempotent(action)
+
+
+    def backoff(self, attempt):
+        self.retries += 1
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+
+
+def is_throttled(response = None, error = None):
+    if error is not None:
+        return isinstance(error, TransportError) and error.status in THROTTLED_HTTP_STATUSES
+
+    return bool(error_codes(response) & REJECTED_ERROR_CODES)
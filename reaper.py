@@ -0,0 +1,311 @@
+import time
+import threading
+import collections
+
+import logger
+import linode_api as lin
+from journal import pending_journals
+
+
+# Linodes created for imaging are in this display group.
+TEMPORARY_GROUP = 'temporary'
+
+# Resources younger than this may still be in use by a creation in progress.
+DEFAULT_GRACE = 3 * 3600
+
+# Journals of unfinished creations older than this no longer keep their linodes
+# from being reaped. Nobody is going to resume them.
+DEFAULT_JOURNAL_EXPIRY = 24 * 3600
+
+# ERRORCODE of deletes of resources that are already gone.
+ERROR_NOT_FOUND = 5
+
+
+class ReapRule(object):
+    '''
+    Matches linode.list or image.list records of leaked resources.
+    '''
+
+    def __init__(self, kind, group = None, label = None, older_than = DEFAULT_GRACE, status = None):
+        '''
+        Args:
+            - kind : 'linode' or 'image'.
+            - group : Only linodes in this display group.
+            - label : Only resources whose label matches this glob pattern.
+            - older_than : Only resources created more than this many seconds ago.
+            - status : Optional list of the STATUS values of the records to match.
+        '''
+        if kind not in ('linode', 'image'):
+            raise ValueError('Unknown kind of resource %s' % (kind))
+        self.kind = kind
+        self.group = group
+        self.label = label
+        self.older_than = older_than
+        self.status = status
+
+
+    def matches(self, record, now = None):
+        if self.status is not None and record.get('STATUS') not in self.status:
+            return False
+        return lin.match_record(record, 'LABEL', self.group, self.label, self.older_than, now)
+
+
+    def __repr__(self):
+        return 'ReapRule(%r, group=%r, label=%r, older_than=%r, status=%r)' % (
+            self.kind, self.group, self.label, self.older_than, self.status)
+
+
+
+def default_rules(grace = DEFAULT_GRACE):
+    '''
+    Temporary imaging linodes, and images that never finished imaging, older than `grace` seconds.
+    '''
+    return [
+        ReapRule('linode', group = TEMPORARY_GROUP, older_than = grace),
+        ReapRule('image', older_than = grace, status = ['pending_upload'])
+    ]
+
+
+
+class Reaper(object):
+    '''
+    Deletes linodes and images leaked by this library: those whose cleanup failed,
+    and those matching its rules.
+
+    Resources are found two ways:
+
+    - Tracked. :class:`linode_core.Core` and the image providers report the linodes
+      and images they failed to delete with :meth:`track_linode` and :meth:`track_image`,
+      when app_ctx has a 'reaper'. Tracked resources are deleted by the next sweep
+      whatever their age, and forgotten once deleted.
+    - Orphans. Each sweep lists linodes and images once and matches them against
+      :class:`ReapRule` by group, label, age and status. There are no rules unless
+      they're given, such as :func:`default_rules`. Linodes of creations that
+      journals in `journal_dir` can still resume are not orphans, until their
+      journal is `journal_expiry` seconds old.
+
+    Deletes are sent in batch requests with bounded concurrency, and at most
+    `max_deletes` per sweep, so that a rule that's too broad can't delete a fleet
+    at once. Whatever is left is deleted by the next sweeps.
+
+    Example:
+        reaper = Reaper(client, default_rules(), journal_dir = app_ctx.get('journal-dir'))
+        app_ctx['reaper'] = reaper
+        reaper.start(interval = 600)
+    '''
+
+    def __init__(self, client, rules = None, journal_dir = None, parallel = 4,
+        batch_size = lin.MAX_BATCH_SIZE, max_deletes = 100, journal_expiry = DEFAULT_JOURNAL_EXPIRY):
+        '''
+        Args:
+            - client : The :class:`linode_api.LinodeClient` of the account.
+            - rules : Optional list of :class:`ReapRule`. Without rules, only tracked
+                resources are deleted.
+            - journal_dir : Optional directory of creation journals.
+            - parallel : Max number of delete requests in flight at once.
+            - batch_size : Number of deletes sent in each batch request.
+            - max_deletes : Max number of resources deleted per sweep, or None for no limit.
+            - journal_expiry : Seconds after which a creation journal no longer protects its linode.
+        '''
+        self.client = client
+        self.rules = rules or []
+        self.journal_dir = journal_dir
+        self.parallel = parallel
+        self.batch_size = batch_size
+        self.max_deletes = max_deletes
+        self.journal_expiry = journal_expiry
+
+        self._lock = threading.Lock()
+        self._sweep_lock = threading.Lock()
+        self._tracked = {'linode' : collections.OrderedDict(), 'image' : collections.OrderedDict()}
+
+        self._thread = None
+        self._stop = threading.Event()
+
+        self.sweeps = 0
+        self.deleted = {'linode' : 0, 'image' : 0}
+        self.failed = 0
+        self.last_report = None
+
+
+    def track_linode(self, linode_id, reason = None):
+        '''
+        Report a linode that should have been deleted and wasn't.
+        '''
+        self._track('linode', linode_id, reason)
+
+
+    def track_image(self, image_id, reason = None):
+        '''
+        Report an image that should have been deleted and wasn't.
+        '''
+        self._track('image', image_id, reason)
+
+
+    def tracked(self):
+        '''
+        Returns a dict of 'linode' and 'image' -> dict of ID -> reason.
+        '''
+        with self._lock:
+            return dict([(kind, dict(tracked)) for kind, tracked in self._tracked.items()])
+
+
+    def find(self):
+        '''
+        Returns a dict of 'linode' and 'image' -> list of IDs of the resources the next
+        sweep would delete, tracked ones first, before `max_deletes` applies.
+        '''
+        with self._lock:
+            found = dict([(kind, list(tracked.keys())) for kind, tracked in self._tracked.items()])
+
+        now = time.time()
+        kinds = set([rule.kind for rule in self.rules])
+
+        if 'linode' in kinds:
+            resumable = set()
+            if self.journal_dir:
+                resumable = set([journal.linode_id for journal in pending_journals(self.journal_dir)
+                    if now - journal.created < self.journal_expiry])
+            rules = [rule for rule in self.rules if rule.kind == 'linode']
+            for node in self.client.iter_nodes(fields = ['LINODEID', 'LABEL', 'LPM_DISPLAYGROUP', 'CREATE_DT', 'STATUS']):
+                if node['LINODEID'] in resumable or node['LINODEID'] in found['linode']:
+                    continue
+                if any([rule.matches(node, now) for rule in rules]):
+                    found['linode'].append(node['LINODEID'])
+
+        if 'image' in kinds:
+            rules = [rule for rule in self.rules if rule.kind == 'image']
+            for image in self.client.iter_images(['IMAGEID', 'LABEL', 'CREATE_DT', 'STATUS']):
+                if image['IMAGEID'] in found['image']:
+                    continue
+                if any([rule.matches(image, now) for rule in rules]):
+                    found['image'].append(image['IMAGEID'])
+
+        return found
+
+
+    def sweep(self, dry_run = False):
+        '''
+        Delete the leaked resources found by :meth:`find`.
+
+        Args:
+            - dry_run : If True, only report what would be deleted.
+
+        Returns:
+            A report dict. 'linodes' and 'images' are OrderedDicts of ID -> (success, errors),
+            which are (None, None) in a dry run. 'skipped' is the number of resources left
+            for the next sweep by `max_deletes`.
+        '''
+        with self._sweep_lock:
+            start = time.time()
+            found = self.find()
+
+            todo = found['linode'] + found['image']
+            skipped = 0
+            if self.max_deletes is not None and len(todo) > self.max_deletes:
+                skipped = len(todo) - self.max_deletes
+                linodes = found['linode'][:self.max_deletes]
+                images = found['image'][:self.max_deletes - len(linodes)]
+            else:
+                linodes, images = found['linode'], found['image']
+
+            if dry_run:
+                results = {
+                    'linode' : collections.OrderedDict([(i, (None, None)) for i in linodes]),
+                    'image' : collections.OrderedDict([(i, (None, None)) for i in images])
+                }
+            else:
+                results = {
+                    'linode' : self.client.delete_node_ids(linodes, 1, self.parallel, self.batch_size)
+                        if linodes else collections.OrderedDict(),
+                    'image' : self.client.delete_image_ids(images, self.parallel, self.batch_size)
+                        if images else collections.OrderedDict()
+                }
+
+            deleted = 0
+            failed = 0
+            if not dry_run:
+                with self._lock:
+                    for kind, kind_results in results.items():
+                        for resource_id, (success, errors) in kind_results.items():
+                            if success or _already_gone(errors):
+                                self._tracked[kind].pop(resource_id, None)
+                                self.deleted[kind] += 1
+                                deleted += 1
+                            else:
+                                # Tracked, so the next sweep tries again whatever the rules.
+                                self._tracked[kind].setdefault(resource_id, 'Delete failed:%s' % (errors))
+                                failed += 1
+                    self.failed += failed
+                    self.sweeps += 1
+
+            report = {
+                'started' : start,
+                'duration' : time.time() - start,
+                'dry_run' : dry_run,
+                'linodes' : results['linode'],
+                'images' : results['image'],
+                'deleted' : deleted,
+                'failed' : failed,
+                'skipped' : skipped
+            }
+            self.last_report = report
+
+        if linodes or images:
+            logger.msg('Reaper %s %d linodes and %d images. %d failed, %d left for the next sweep.' % (
+                'would delete' if dry_run else 'deleted', len(linodes), len(images), failed, skipped))
+        return report
+
+
+    def start(self, interval = 600):
+        '''
+        Start a daemon thread that calls :meth:`sweep` every `interval` seconds.
+        '''
+        if self._thread is not None:
+            return
+
+        self._stop.clear()
+
+        def sweeper():
+            while not self._stop.wait(interval):
+                try:
+                    self.sweep()
+                except Exception as e:
+                    logger.error_msg('Reaper sweep failed:%s' % (e))
+
+        self._thread = threading.Thread(target = sweeper, name = 'reaper')
+        self._thread.daemon = True
+        self._thread.start()
+
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+
+    def stats(self):
+        with self._lock:
+            return {
+                'sweeps' : self.sweeps,
+                'deleted_linodes' : self.deleted['linode'],
+                'deleted_images' : self.deleted['image'],
+                'failed' : self.failed,
+                'tracked_linodes' : len(self._tracked['linode']),
+                'tracked_images' : len(self._tracked['image'])
+            }
+
+
+    def _track(self, kind, resource_id, reason):
+        if resource_id is None:
+            return
+        with self._lock:
+            self._tracked[kind][resource_id] = reason
+        logger.msg('Reaper will delete %s %s' % (kind, resource_id))
+
+
+
+def _already_gone(errors):
+    return bool(errors) and all([e.get('ERRORCODE') == ERROR_NOT_FOUND for e in errors])
@@ -0,0 +1,199 @@
+import os
+import gzip
+import json
+import time
+import Queue
+import random
+import shutil
+import urlparse
+import threading
+
+
+# Parameters that are never written, compared case insensitively. rootSSHKey is
+# only a public key, but it identifies who can log in to the linode.
+SECRET_PARAMS = frozenset(['api_key', 'rootpass', 'rootsshkey'])
+
+
+class RequestLog(object):
+    '''
+    Structured log of API requests, written as one JSON object per line (NDJSON).
+
+    Callers only put records on a bounded queue; a background thread serializes
+    and writes them. If the queue is full the record is dropped instead of
+    blocking the request, and counted in `dropped`.
+
+    - The file is rotated when it grows beyond `max_bytes`, keeping `backup_count`
+      older files as <path>.1, <path>.2, ..., optionally gzipped.
+    - Only a `sample_rate` fraction of successful requests are logged. Requests
+      with errors are always logged.
+    - Response bodies longer than `max_body_bytes` are truncated.
+    - The api_key, root passwords and root SSH keys are never written, neither in
+      requests nor in the requests of a batch.
+    '''
+
+    def __init__(self, path = 'linode_api.log', max_bytes = 10 * 1024 * 1024, backup_count = 5,
+        compress = False, sample_rate = 1.0, max_body_bytes = 4096, queue_size = 10000):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.compress = compress
+        self.sample_rate = sample_rate
+        self.max_body_bytes = max_body_bytes
+
+        self._queue = Queue.Queue(queue_size)
+        self._file = None
+        self._size = 0
+        self._writer = threading.Thread(target = self._write_records, name = 'request-log-writer')
+        self._writer.daemon = True
+        self._writer.start()
+
+        self.written = 0
+        self.dropped = 0
+        self.sampled_out = 0
+
+
+    def log(self, request_url, request_data, resp, duration = None):
+        '''
+        Queue a request for logging. Never blocks.
+
+        Args:
+            - request_url : The API URL.
+            - request_data : The urlencoded request body.
+            - resp : The decoded response.
+            - duration : Optional request duration in seconds.
+        '''
+        has_errors = isinstance(resp, dict) and bool(resp.get('ERRORARRAY'))
+        if not has_errors and self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            self.sampled_out += 1
+            return
+
+        try:
+            self._queue.put_nowait( ('log', (time.time(), request_url, request_data, resp, duration)) )
+        except Queue.Full:
+            self.dropped += 1
+
+
+    def flush(self, timeout = None):
+        '''
+        Block until all queued records are written.
+        '''
+        done = threading.Event()
+        self._queue.put( ('flush', done) )
+        done.wait(timeout)
+
+
+    def close(self):
+        self._queue.put(None)
+        self._writer.join()
+
+
+    def stats(self):
+        return {
+            'written' : self.written,
+            'dropped' : self.dropped,
+            'sampled_out' : self.sampled_out,
+            'queued' : self._queue.qsize()
+        }
+
+
+    def _write_records(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+
+            kind, value = item
+            if kind == 'flush':
+                if self._file is not None:
+                    self._file.flush()
+                value.set()
+                continue
+
+            try:
+                line = self._format(*value)
+                self._write(line)
+                self.written += 1
+            except Exception:
+                # Logging must never take the process down.
+                self.dropped += 1
+
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+    def _format(self, timestamp, request_url, request_data, resp, duration):
+        params = _scrub(dict(urlparse.parse_qsl(request_data or '')))
+        action = params.pop('api_action', None)
+        if 'api_requestArray' in params:
+            try:
+                request_array = json.loads(params['api_requestArray'])
+                params['api_requestArray'] = [_scrub(request) if isinstance(request, dict) else request
+                    for request in request_array]
+            except (ValueError, TypeError):
+                # Not a list of requests. It could hold anything.
+                params['api_requestArray'] = None
+
+        record = {
+            'ts' : timestamp,
+            'url' : request_url,
+            'action' : action,
+            'params' : params
+        }
+        if duration is not None:
+            record['duration'] = round(duration, 6)
+
+        if isinstance(resp, dict):
+            record['errors'] = resp.get('ERRORARRAY')
+
+        body = json.dumps(resp, separators = (',',':'))
+        if self.max_body_bytes is not None and len(body) > self.max_body_bytes:
+            record['response_truncated'] = len(body)
+            body = body[:self.max_body_bytes]
+        record['response'] = body
+
+        return json.dumps(record, separators = (',',':')) + '\n'
+
+
+    def _write(self, line):
+        if self._file is None:
+            self._open()
+
+        if self.max_bytes and self._size > 0 and self._size + len(line) > self.max_bytes:
+            self._rotate()
+
+        self._file.write(line)
+        self._size += len(line)
+
+
+    def _open(self):
+        self._file = open(self.path, 'a')
+        self._size = os.path.getsize(self.path)
+
+
+    def _rotate(self):
+        self._file.close()
+        self._file = None
+
+        ext = '.gz' if self.compress else ''
+        for i in range(self.backup_count - 1, 0, -1):
+            src = '%s.%d%s' % (self.path, i, ext)
+            if os.path.exists(src):
+                os.rename(src, '%s.%d%s' % (self.path, i + 1, ext))
+
+        if self.backup_count > 0:
+            if self.compress:
+                with open(self.path, 'rb') as src, gzip.open(self.path + '.1.gz', 'wb') as dst:
+                    shutil.copyfileobj(src, dst)
+                os.remove(self.path)
+            else:
+                os.rename(self.path, self.path + '.1')
+        else:
+            os.remove(self.path)
+
+        self._open()
+
+
+
+def _scrub(params):
+    return dict([(key, value) for key, value in params.items() if key.lower() not in SECRET_PARAMS])
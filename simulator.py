@@ -0,0 +1,965 @@
+#!/usr/bin/python
+
+import sys
+import json
+import time
+import heapq
+import random
+import urlparse
+import threading
+import SocketServer
+import BaseHTTPServer
+import StringIO
+
+from exc import TransportError
+import ratelimit
+from api_time import format_api_time
+
+
+# Linode API v3 error codes used by the simulator, in addition to those in ratelimit.
+ERROR_AUTH_FAILED = 4
+ERROR_NOT_FOUND = 5
+ERROR_MISSING_PROPERTY = 6
+ERROR_INVALID_PROPERTY = 7
+ERROR_VALIDATION = 8
+ERROR_NOT_IMPLEMENTED = 9
+ERROR_TOO_MANY_BATCHED = 10
+ERROR_INVALID_BATCH = 11
+ERROR_LINODES_PER_HOUR = 40
+ERROR_LINODE_HAS_DISKS = 41
+
+ERROR_MESSAGES = {
+    ERROR_AUTH_FAILED : 'Authentication failed',
+    ERROR_NOT_FOUND : 'Object not found',
+    ERROR_MISSING_PROPERTY : 'A required property is missing for this action',
+    ERROR_INVALID_PROPERTY : 'Property is invalid',
+    ERROR_VALIDATION : 'A validation error has occurred',
+    ERROR_NOT_IMPLEMENTED : 'Method Not Implemented',
+    ERROR_TOO_MANY_BATCHED : 'Too many batched requests',
+    ERROR_INVALID_BATCH : 'RequestArray isn\'t valid JSON or WDDX',
+    ratelimit.ERROR_BATCH_TIMEOUT : 'Batch approaching timeout. Stopping here.',
+    ratelimit.ERROR_RATE_LIMITED : 'Rate limit exceeded',
+    ERROR_LINODES_PER_HOUR : 'Limit of Linodes added per hour reached',
+    ERROR_LINODE_HAS_DISKS : 'Linode must have no disks before delete'
+}
+
+MAX_BATCH_SIZE = 25
+
+# Linode statuses
+STATUS_BEING_CREATED = -1
+STATUS_BRAND_NEW = 0
+STATUS_RUNNING = 1
+STATUS_POWERED_OFF = 2
+
+
+DATACENTERS = [
+    {'DATACENTERID' : 2, 'LOCATION' : 'Dallas, TX, USA', 'ABBR' : 'dallas'},
+    {'DATACENTERID' : 3, 'LOCATION' : 'Fremont, CA, USA', 'ABBR' : 'fremont'},
+    {'DATACENTERID' : 4, 'LOCATION' : 'Atlanta, GA, USA', 'ABBR' : 'atlanta'},
+    {'DATACENTERID' : 6, 'LOCATION' : 'Newark, NJ, USA', 'ABBR' : 'newark'},
+    {'DATACENTERID' : 7, 'LOCATION' : 'London, England, UK', 'ABBR' : 'london'},
+    {'DATACENTERID' : 8, 'LOCATION' : 'Tokyo, JP', 'ABBR' : 'tokyo'},
+    {'DATACENTERID' : 9, 'LOCATION' : 'Singapore, SG', 'ABBR' : 'singapore'},
+    {'DATACENTERID' : 10, 'LOCATION' : 'Frankfurt, DE', 'ABBR' : 'frankfurt'}
+]
+
+PLANS = [
+    {'PLANID' : 1, 'LABEL' : 'Linode 2048', 'RAM' : 2048, 'DISK' : 24, 'XFER' : 2000, 'CORES' : 1, 'PRICE' : 10.0},
+    {'PLANID' : 2, 'LABEL' : 'Linode 4096', 'RAM' : 4096, 'DISK' : 48, 'XFER' : 3000, 'CORES' : 2, 'PRICE' : 20.0},
+    {'PLANID' : 4, 'LABEL' : 'Linode 8192', 'RAM' : 8192, 'DISK' : 96, 'XFER' : 4000, 'CORES' : 4, 'PRICE' : 40.0},
+    {'PLANID' : 6, 'LABEL' : 'Linode 16384', 'RAM' : 16384, 'DISK' : 192, 'XFER' : 8000, 'CORES' : 6, 'PRICE' : 80.0}
+]
+
+DISTRIBUTIONS = [
+    {'DISTRIBUTIONID' : 124, 'LABEL' : 'Ubuntu 14.04 LTS', 'IS64BIT' : 1, 'MINIMAGESIZE' : 1500},
+    {'DISTRIBUTIONID' : 126, 'LABEL' : 'Ubuntu 12.04 LTS', 'IS64BIT' : 1, 'MINIMAGESIZE' : 600},
+    {'DISTRIBUTIONID' : 129, 'LABEL' : 'CentOS 7', 'IS64BIT' : 1, 'MINIMAGESIZE' : 750},
+    {'DISTRIBUTIONID' : 130, 'LABEL' : 'Debian 7', 'IS64BIT' : 1, 'MINIMAGESIZE' : 600},
+    {'DISTRIBUTIONID' : 140, 'LABEL' : 'Debian 8', 'IS64BIT' : 1, 'MINIMAGESIZE' : 900}
+]
+
+KERNELS = [
+    {'KERNELID' : 138, 'LABEL' : 'Latest 64 bit (4.1.5-x86_64-linode61)', 'ISXEN' : 1, 'ISKVM' : 1, 'ISPVOPS' : 1},
+    {'KERNELID' : 137, 'LABEL' : 'Latest 32 bit (4.1.5-x86-linode80)', 'ISXEN' : 1, 'ISKVM' : 1, 'ISPVOPS' : 1},
+    {'KERNELID' : 210, 'LABEL' : 'GRUB 2', 'ISXEN' : 0, 'ISKVM' : 1, 'ISPVOPS' : 0},
+    {'KERNELID' : 92, 'LABEL' : 'pv-grub-x86_64', 'ISXEN' : 1, 'ISKVM' : 0, 'ISPVOPS' : 0}
+]
+
+STACKSCRIPTS = [
+    {'STACKSCRIPTID' : 1, 'LABEL' : 'Simulated StackScript', 'DISTRIBUTIONIDLIST' : '124,129,140',
+        'SCRIPT' : '#!/bin/bash\n', 'ISPUBLIC' : 1}
+]
+
+# Simulated seconds each kind of job takes by default.
+DEFAULT_JOB_DURATIONS = {
+    'linode.create' : 0,
+    'linode.boot' : 20,
+    'linode.shutdown' : 10,
+    'linode.reboot' : 30,
+    'linode.disk.create' : 15,
+    'linode.disk.createfromdistribution' : 30,
+    'linode.disk.createfromstackscript' : 30,
+    'linode.disk.createfromimage' : 40,
+    'linode.disk.duplicate' : 30,
+    'linode.disk.delete' : 5,
+    'linode.disk.imagize' : 60,
+    'linode.clone' : 60
+}
+
+
+
+class Simulator(object):
+    '''
+    In-memory model of a Linode account that answers Linode API v3 requests.
+
+    Jobs complete after a simulated duration, so callers polling linode.job.list
+    see them pending and then finished, and effects like a linode running after
+    linode.boot or an image becoming available after linode.disk.imagize
+    are applied when the job finishes.
+
+    Use it in-process with :class:`SimulatorTransport`, or over HTTP with
+    :class:`SimulatorServer`:
+
+        sim = Simulator(job_durations = {'*' : 0.5}, time_scale = 1)
+        client = linode_api.LinodeClient('key', API_SIMULATOR_URL, transport = SimulatorTransport(sim))
+    '''
+
+    def __init__(self, request_latency = 0, latency = None, job_durations = None, time_scale = 1.0,
+        rate_limit = None, linodes_per_hour = None, failures = None, job_failures = None,
+        failure_code = ERROR_VALIDATION, http_error_rate = 0, api_keys = None, seed = None):
+        '''
+        Args:
+            - request_latency : Seconds added to every HTTP request, batch or not.
+            - latency : Dict of action to seconds added to each call of that action,
+                including calls within a batch. The '*' key applies to all other actions.
+            - job_durations : Dict of job action to seconds the job takes, overriding
+                DEFAULT_JOB_DURATIONS. The '*' key applies to all job actions.
+            - time_scale : Multiplies all job durations. Use 0 to finish jobs immediately.
+            - rate_limit : (rate, burst) of requests per second allowed per API key,
+                or None for no limit. Excess requests fail with ERRORCODE 14.
+            - linodes_per_hour : Max linode.create calls per hour per API key, or None.
+            - failures : Dict of action to probability that a call fails with `failure_code`.
+                The '*' key applies to all other actions.
+            - job_failures : Dict of job action to probability that the job fails (HOST_SUCCESS 0).
+            - failure_code : ERRORCODE of injected failures.
+            - http_error_rate : Probability that an HTTP request fails with status 503.
+            - api_keys : Set of valid API keys. By default any key is accepted.
+            - seed : Seed of the random generator used for failure injection.
+        '''
+        self.request_latency = request_latency
+        self.latency = latency or {}
+        self.job_durations = dict(DEFAULT_JOB_DURATIONS)
+        if job_durations:
+            if '*' in job_durations:
+                for action in self.job_durations:
+                    self.job_durations[action] = job_durations['*']
+            self.job_durations.update(job_durations)
+        self.time_scale = time_scale
+        self.rate_limit = rate_limit
+        self.linodes_per_hour = linodes_per_hour
+        self.failures = failures or {}
+        self.job_failures = job_failures or {}
+        self.failure_code = failure_code
+        self.http_error_rate = http_error_rate
+        self.api_keys = api_keys
+
+        self._random = random.Random(seed)
+        self._lock = threading.RLock()
+
+        self.linodes = {}
+        self.disks = {}
+        self.configs = {}
+        self.ips = {}
+        self.jobs = {}
+        self.images = {}
+
+        self._next_id = 1000
+        self._pending = []          # Heap of (finish_time, job_id)
+        self._buckets = {}          # api_key -> [tokens, last refill]
+        self._creations = {}        # api_key -> list of linode.create times
+
+        self.requests = 0
+        self.calls = {}
+        self.errors = {}
+        self.http_errors = 0
+
+
+    #=============================================================
+    # Request handling
+
+    def handle_request(self, body):
+        '''
+        Answer an urlencoded API request body.
+
+        Returns:
+            (status, response body) tuple.
+        '''
+        self._sleep(self.request_latency)
+
+        with self._lock:
+            self.requests += 1
+            if self.http_error_rate and self._random.random() < self.http_error_rate:
+                self.http_errors += 1
+                return (503, 'Service Unavailable')
+
+        params = dict(urlparse.parse_qsl(body, keep_blank_values = True))
+        api_key = params.pop('api_key', None)
+        action = params.pop('api_action', None)
+
+        error = self._check_access(api_key)
+        if error is not None:
+            resp = self._error_response(action, error)
+        elif action == 'batch':
+            resp = self._handle_batch(api_key, params)
+        else:
+            resp = self.handle(action, params, api_key)
+
+        return (200, json.dumps(resp))
+
+
+    def handle(self, action, params, api_key = None):
+        '''
+        Answer a single API action. Returns the response object.
+        '''
+        params = dict([(k.lower(), v) for k, v in (params or {}).items()])
+
+        self._sleep(self.latency.get(action, self.latency.get('*', 0)))
+
+        with self._lock:
+            self.calls[action] = self.calls.get(action, 0) + 1
+            self._finish_jobs()
+
+            rate = self.failures.get(action, self.failures.get('*', 0))
+            if rate and self._random.random() < rate:
+                return self._error_response(action, self.failure_code)
+
+            handler = ACTIONS.get(action)
+            if handler is None:
+                return self._error_response(action, ERROR_NOT_IMPLEMENTED)
+
+            try:
+                data = handler(self, params, api_key)
+            except SimulatedError as e:
+                return self._error_response(action, e.code)
+
+        return {'ACTION' : action, 'ERRORARRAY' : [], 'DATA' : data}
+
+
+    def _handle_batch(self, api_key, params):
+        try:
+            requests = json.loads(params['api_requestarray'] if 'api_requestarray' in params
+                else params['api_requestArray'])
+        except (KeyError, ValueError):
+            return self._error_response('batch', ERROR_INVALID_BATCH)
+
+        if not isinstance(requests, list):
+            return self._error_response('batch', ERROR_INVALID_BATCH)
+        if len(requests) > MAX_BATCH_SIZE:
+            return self._error_response('batch', ERROR_TOO_MANY_BATCHED)
+
+        responses = []
+        for req in requests:
+            req = dict(req)
+            action = req.pop('api_action', None)
+            responses.append(self.handle(action, req, api_key))
+        return responses
+
+
+    def _check_access(self, api_key):
+        if not api_key or (self.api_keys is not None and api_key not in self.api_keys):
+            return ERROR_AUTH_FAILED
+
+        if self.rate_limit is None:
+            return None
+
+        # Token bucket per API key, refilled at `rate` tokens per second.
+        rate, burst = self.rate_limit
+        now = time.time()
+        with self._lock:
+            bucket = self._buckets.setdefault(api_key, [burst, now])
+            bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+            if bucket[0] < 1:
+                return ratelimit.ERROR_RATE_LIMITED
+            bucket[0] -= 1
+
+        return None
+
+
+    def _error_response(self, action, code):
+        with self._lock:
+            self.errors[code] = self.errors.get(code, 0) + 1
+        return {
+            'ACTION' : action,
+            'ERRORARRAY' : [{'ERRORCODE' : code, 'ERRORMESSAGE' : ERROR_MESSAGES.get(code, 'Simulated error')}],
+            'DATA' : {}
+        }
+
+
+    def _sleep(self, seconds):
+        if seconds > 0:
+            time.sleep(seconds)
+
+
+    def stats(self):
+        with self._lock:
+            return {
+                'requests' : self.requests,
+                'calls' : dict(self.calls),
+                'errors' : dict(self.errors),
+                'http_errors' : self.http_errors,
+                'linodes' : len(self.linodes),
+                'images' : len(self.images),
+                'pending_jobs' : len(self._pending)
+            }
+
+
+    #=============================================================
+    # Model
+    #
+    # All of these are called with self._lock held.
+
+    def _new_id(self):
+        self._next_id += 1
+        return self._next_id
+
+
+    def _linode(self, params):
+        linode = self.linodes.get(_int(params, 'linodeid'))
+        if linode is None:
+            raise SimulatedError(ERROR_NOT_FOUND)
+        return linode
+
+
+    def _disk(self, linode, params):
+        disk = self.disks.get(_int(params, 'diskid'))
+        if disk is None or disk['LINODEID'] != linode['LINODEID']:
+            raise SimulatedError(ERROR_NOT_FOUND)
+        return disk
+
+
+    def _start_job(self, linode, action, label, on_finish = None):
+        job_id = self._new_id()
+        now = time.time()
+        duration = self.job_durations.get(action, self.job_durations.get('*', 0)) * self.time_scale
+        rate = self.job_failures.get(action, self.job_failures.get('*', 0))
+
+        self.jobs[job_id] = {
+            'JOBID' : job_id,
+            'LINODEID' : linode['LINODEID'],
+            'ACTION' : action,
+            'LABEL' : label,
+            'ENTERED_DT' : _timestamp(now),
+            'HOST_START_DT' : _timestamp(now),
+            'HOST_FINISH_DT' : '',
+            'DURATION' : '',
+            'HOST_MESSAGE' : '',
+            'HOST_SUCCESS' : '',
+            '_entered' : now,
+            '_fail' : bool(rate) and self._random.random() < rate,
+            '_on_finish' : on_finish
+        }
+        heapq.heappush(self._pending, (now + duration, job_id))
+        return job_id
+
+
+    def _finish_jobs(self):
+        now = time.time()
+        while self._pending and self._pending[0][0] <= now:
+            finish_at, job_id = heapq.heappop(self._pending)
+            job = self.jobs.get(job_id)
+            if job is None:
+                continue
+
+            job['HOST_FINISH_DT'] = _timestamp(finish_at)
+            job['DURATION'] = int(round(finish_at - job['_entered']))
+            if job['_fail']:
+                job['HOST_SUCCESS'] = 0
+                job['HOST_MESSAGE'] = 'Simulated job failure'
+            else:
+                job['HOST_SUCCESS'] = 1
+                if job['_on_finish'] is not None:
+                    job['_on_finish']()
+
+
+    def _create_disk(self, linode, params, action, label, size, disk_type = 'ext4', on_finish = None):
+        plan = _plan(linode['PLANID'])
+        used = sum([d['SIZE'] for d in self.disks.values() if d['LINODEID'] == linode['LINODEID']])
+        if size <= 0 or used + size > plan['DISK'] * 1024:
+            raise SimulatedError(ERROR_VALIDATION)
+
+        disk_id = self._new_id()
+        disk = {
+            'DISKID' : disk_id,
+            'LINODEID' : linode['LINODEID'],
+            'LABEL' : label,
+            'TYPE' : disk_type,
+            'SIZE' : size,
+            'STATUS' : 2,
+            'ISREADONLY' : 0,
+            'CREATE_DT' : _timestamp(time.time()),
+            'UPDATE_DT' : _timestamp(time.time())
+        }
+        self.disks[disk_id] = disk
+
+        def finished():
+            disk['STATUS'] = 1
+            if on_finish is not None:
+                on_finish()
+
+        job_id = self._start_job(linode, action, 'Create Disk %s' % (label), finished)
+        return disk_id, job_id
+
+
+    def _set_status(self, linode, status):
+        def apply():
+            linode['STATUS'] = status
+        return apply
+
+
+
+class SimulatedError(Exception):
+    def __init__(self, code):
+        Exception.__init__(self, ERROR_MESSAGES.get(code, 'Simulated error'))
+        self.code = code
+
+
+
+#=============================================================
+# Actions
+#
+# Each takes (simulator, params with lowercase keys, api_key) and returns DATA.
+
+def _int(params, key, default = None):
+    value = params.get(key, default)
+    if value is None:
+        raise SimulatedError(ERROR_MISSING_PROPERTY)
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise SimulatedError(ERROR_INVALID_PROPERTY)
+
+
+def _bool(params, key):
+    # Values are strings in urlencoded requests, but may be JSON values in batches.
+    return str(params.get(key, '')).lower() in ('1', 'true')
+
+
+def _timestamp(t):
+    # In US Eastern time, like the production API.
+    return format_api_time(t)
+
+
+def _plan(plan_id):
+    for plan in PLANS:
+        if plan['PLANID'] == plan_id:
+            return plan
+    return None
+
+
+def _public(record):
+    return dict([(k, v) for k, v in record.items() if not k.startswith('_')])
+
+
+def _filter(records, params, key, field):
+    if key in params:
+        value = _int(params, key)
+        return [r for r in records if r[field] == value]
+    return records
+
+
+def avail_datacenters(sim, params, api_key):
+    return DATACENTERS
+
+def avail_distributions(sim, params, api_key):
+    return _filter(DISTRIBUTIONS, params, 'distributionid', 'DISTRIBUTIONID')
+
+def avail_kernels(sim, params, api_key):
+    return KERNELS
+
+def avail_linodeplans(sim, params, api_key):
+    plans = []
+    for plan in _filter(PLANS, params, 'planid', 'PLANID'):
+        plan = dict(plan)
+        plan['AVAIL'] = dict([(str(dc['DATACENTERID']), 500) for dc in DATACENTERS])
+        plans.append(plan)
+    return plans
+
+def avail_stackscripts(sim, params, api_key):
+    return STACKSCRIPTS
+
+def test_echo(sim, params, api_key):
+    return params
+
+
+def linode_create(sim, params, api_key):
+    plan_id = _int(params, 'planid')
+    datacenter_id = _int(params, 'datacenterid')
+    if _plan(plan_id) is None:
+        raise SimulatedError(ERROR_INVALID_PROPERTY)
+    if datacenter_id not in [dc['DATACENTERID'] for dc in DATACENTERS]:
+        raise SimulatedError(ERROR_INVALID_PROPERTY)
+
+    if sim.linodes_per_hour is not None:
+        now = time.time()
+        recent = [t for t in sim._creations.get(api_key, []) if t > now - 3600]
+        if len(recent) >= sim.linodes_per_hour:
+            raise SimulatedError(ERROR_LINODES_PER_HOUR)
+        recent.append(now)
+        sim._creations[api_key] = recent
+
+    linode_id = sim._new_id()
+    linode = {
+        'LINODEID' : linode_id,
+        'LABEL' : 'linode%d' % (linode_id),
+        'LPM_DISPLAYGROUP' : '',
+        'DATACENTERID' : datacenter_id,
+        'PLANID' : plan_id,
+        'TOTALRAM' : _plan(plan_id)['RAM'],
+        'TOTALHD' : _plan(plan_id)['DISK'] * 1024,
+        'STATUS' : STATUS_BEING_CREATED,
+        'CREATE_DT' : _timestamp(time.time())
+    }
+    sim.linodes[linode_id] = linode
+
+    ip_id = sim._new_id()
+    sim.ips[ip_id] = {
+        'IPADDRESSID' : ip_id,
+        'LINODEID' : linode_id,
+        'ISPUBLIC' : 1,
+        'IPADDRESS' : '198.51.%d.%d' % ((ip_id >> 8) & 0xff, ip_id & 0xff),
+        'RDNS_NAME' : 'li%d.members.linode.com' % (linode_id)
+    }
+
+    sim._start_job(linode, 'linode.create', 'Linode Initial Configuration',
+        sim._set_status(linode, STATUS_BRAND_NEW))
+    return {'LinodeID' : linode_id}
+
+
+def linode_update(sim, params, api_key):
+    linode = sim._linode(params)
+    if 'label' in params:
+        linode['LABEL'] = params['label']
+    if 'lpm_displaygroup' in params:
+        linode['LPM_DISPLAYGROUP'] = params['lpm_displaygroup']
+    return {'LinodeID' : linode['LINODEID']}
+
+
+def linode_delete(sim, params, api_key):
+    linode = sim._linode(params)
+    linode_id = linode['LINODEID']
+    disks = [d for d in sim.disks.values() if d['LINODEID'] == linode_id]
+    if disks and not _bool(params, 'skipchecks'):
+        raise SimulatedError(ERROR_LINODE_HAS_DISKS)
+
+    del sim.linodes[linode_id]
+    for table in [sim.disks, sim.configs, sim.ips, sim.jobs]:
+        for key in [k for k, v in table.items() if v['LINODEID'] == linode_id]:
+            del table[key]
+    return {'LinodeID' : linode_id}
+
+
+def linode_list(sim, params, api_key):
+    nodes = sorted(sim.linodes.values(), key = lambda n: n['LINODEID'])
+    return _filter(nodes, params, 'linodeid', 'LINODEID')
+
+
+def linode_boot(sim, params, api_key):
+    linode = sim._linode(params)
+    configs = [c for c in sim.configs.values() if c['LINODEID'] == linode['LINODEID']]
+    if 'configid' in params:
+        configs = [c for c in configs if c['ConfigID'] == _int(params, 'configid')]
+    if not configs:
+        raise SimulatedError(ERROR_NOT_FOUND)
+
+    job_id = sim._start_job(linode, 'linode.boot', 'System Boot - %s' % (configs[0]['Label']),
+        sim._set_status(linode, STATUS_RUNNING))
+    return {'JobID' : job_id}
+
+
+def linode_shutdown(sim, params, api_key):
+    linode = sim._linode(params)
+    job_id = sim._start_job(linode, 'linode.shutdown', 'System Shutdown',
+        sim._set_status(linode, STATUS_POWERED_OFF))
+    return {'JobID' : job_id}
+
+
+def linode_reboot(sim, params, api_key):
+    linode = sim._linode(params)
+    job_id = sim._start_job(linode, 'linode.reboot', 'System Reboot',
+        sim._set_status(linode, STATUS_RUNNING))
+    return {'JobID' : job_id}
+
+
+def linode_clone(sim, params, api_key):
+    source = sim._linode(params)
+    data = linode_create(sim, {'planid' : params.get('planid'), 'datacenterid' : params.get('datacenterid')}, api_key)
+    linode = sim.linodes[data['LinodeID']]
+    for disk in [d for d in sim.disks.values() if d['LINODEID'] == source['LINODEID']]:
+        sim._create_disk(linode, params, 'linode.clone', disk['LABEL'], disk['SIZE'], disk['TYPE'])
+    return data
+
+
+def linode_disk_create(sim, params, api_key):
+    linode = sim._linode(params)
+    label = params.get('label') or 'disk'
+    disk_type = params.get('type') or 'ext4'
+    if 'fromdistributionid' in params:
+        distribution_id = _int(params, 'fromdistributionid')
+        if not [d for d in DISTRIBUTIONS if d['DISTRIBUTIONID'] == distribution_id]:
+            raise SimulatedError(ERROR_INVALID_PROPERTY)
+        if not params.get('rootpass') and not params.get('rootsshkey'):
+            raise SimulatedError(ERROR_MISSING_PROPERTY)
+
+    disk_id, job_id = sim._create_disk(linode, params, 'linode.disk.create', label,
+        _int(params, 'size'), disk_type)
+    return {'JobID' : job_id, 'DiskID' : disk_id}
+
+
+def linode_disk_createfromdistribution(sim, params, api_key):
+    linode = sim._linode(params)
+    distribution_id = _int(params, 'distributionid')
+    if not [d for d in DISTRIBUTIONS if d['DISTRIBUTIONID'] == distribution_id]:
+        raise SimulatedError(ERROR_INVALID_PROPERTY)
+    if not params.get('rootpass'):
+        raise SimulatedError(ERROR_MISSING_PROPERTY)
+
+    disk_id, job_id = sim._create_disk(linode, params, 'linode.disk.createfromdistribution',
+        params.get('label') or 'disk', _int(params, 'size'))
+    return {'JobID' : job_id, 'DiskID' : disk_id}
+
+
+def linode_disk_createfromstackscript(sim, params, api_key):
+    linode = sim._linode(params)
+    stackscript_id = _int(params, 'stackscriptid')
+    if not [s for s in STACKSCRIPTS if s['STACKSCRIPTID'] == stackscript_id]:
+        raise SimulatedError(ERROR_INVALID_PROPERTY)
+    if not params.get('rootpass'):
+        raise SimulatedError(ERROR_MISSING_PROPERTY)
+
+    disk_id, job_id = sim._create_disk(linode, params, 'linode.disk.createfromstackscript',
+        params.get('label') or 'disk', _int(params, 'size'))
+    return {'JobID' : job_id, 'DiskID' : disk_id}
+
+
+def linode_disk_createfromimage(sim, params, api_key):
+    linode = sim._linode(params)
+    image = sim.images.get(_int(params, 'imageid'))
+    if image is None or image['STATUS'] != 'available':
+        raise SimulatedError(ERROR_NOT_FOUND)
+
+    size = _int(params, 'size', image['MINSIZE'])
+    if size < image['MINSIZE']:
+        raise SimulatedError(ERROR_VALIDATION)
+
+    def used():
+        image['LAST_USED_DT'] = _timestamp(time.time())
+
+    disk_id, job_id = sim._create_disk(linode, params, 'linode.disk.createfromimage',
+        params.get('label') or image['LABEL'], size, image['FS_TYPE'], used)
+
+    # Unlike the other disk actions, this one returns uppercase keys.
+    return {'JOBID' : job_id, 'DISKID' : disk_id}
+
+
+def linode_disk_duplicate(sim, params, api_key):
+    linode = sim._linode(params)
+    disk = sim._disk(linode, params)
+    disk_id, job_id = sim._create_disk(linode, params, 'linode.disk.duplicate',
+        disk['LABEL'], disk['SIZE'], disk['TYPE'])
+    return {'JobID' : job_id, 'DiskID' : disk_id}
+
+
+def linode_disk_delete(sim, params, api_key):
+    linode = sim._linode(params)
+    disk = sim._disk(linode, params)
+    del sim.disks[disk['DISKID']]
+    job_id = sim._start_job(linode, 'linode.disk.delete', 'Delete Disk %s' % (disk['LABEL']))
+    return {'JobID' : job_id, 'DiskID' : disk['DISKID']}
+
+
+def linode_disk_list(sim, params, api_key):
+    linode = sim._linode(params)
+    disks = [d for d in sim.disks.values() if d['LINODEID'] == linode['LINODEID']]
+    return _filter(sorted(disks, key = lambda d: d['DISKID']), params, 'diskid', 'DISKID')
+
+
+def linode_disk_imagize(sim, params, api_key):
+    linode = sim._linode(params)
+    disk = sim._disk(linode, params)
+    if disk['TYPE'] == 'swap':
+        raise SimulatedError(ERROR_VALIDATION)
+
+    image_id = sim._new_id()
+    image = {
+        'IMAGEID' : image_id,
+        'LABEL' : params.get('label') or disk['LABEL'],
+        'DESCRIPTION' : params.get('description', ''),
+        'STATUS' : 'pending_upload',
+        'TYPE' : 'manual',
+        'ISPUBLIC' : 0,
+        'MINSIZE' : disk['SIZE'],
+        'FS_TYPE' : disk['TYPE'],
+        'CREATOR' : 'simulator',
+        'CREATE_DT' : _timestamp(time.time()),
+        'LAST_USED_DT' : ''
+    }
+    sim.images[image_id] = image
+
+    def available():
+        image['STATUS'] = 'available'
+
+    job_id = sim._start_job(linode, 'linode.disk.imagize', 'Imagize Disk %s' % (disk['LABEL']), available)
+    return {'JobID' : job_id, 'ImageID' : image_id}
+
+
+def linode_config_create(sim, params, api_key):
+    linode = sim._linode(params)
+    kernel_id = _int(params, 'kernelid')
+    if not [k for k in KERNELS if k['KERNELID'] == kernel_id]:
+        raise SimulatedError(ERROR_INVALID_PROPERTY)
+    if not params.get('label'):
+        raise SimulatedError(ERROR_MISSING_PROPERTY)
+
+    disk_list = [d for d in (params.get('disklist') or '').split(',') if d]
+    for disk_id in disk_list:
+        sim._disk(linode, {'diskid' : disk_id})
+
+    config_id = sim._new_id()
+    sim.configs[config_id] = {
+        'ConfigID' : config_id,
+        'LinodeID' : linode['LINODEID'],
+        'LINODEID' : linode['LINODEID'],
+        'KernelID' : kernel_id,
+        'Label' : params['label'],
+        'DiskList' : ','.join(disk_list)
+    }
+    return {'ConfigID' : config_id}
+
+
+def linode_config_list(sim, params, api_key):
+    linode = sim._linode(params)
+    configs = [_config(c) for c in sim.configs.values() if c['LINODEID'] == linode['LINODEID']]
+    return _filter(sorted(configs, key = lambda c: c['ConfigID']), params, 'configid', 'ConfigID')
+
+
+def _config(config):
+    config = dict(config)
+    del config['LINODEID']
+    return config
+
+
+def linode_ip_addprivate(sim, params, api_key):
+    linode = sim._linode(params)
+    linode_id = linode['LINODEID']
+    if [ip for ip in sim.ips.values() if ip['LINODEID'] == linode_id and not ip['ISPUBLIC']]:
+        raise SimulatedError(ERROR_VALIDATION)
+
+    ip_id = sim._new_id()
+    address = '192.168.%d.%d' % ((ip_id >> 8) & 0xff, ip_id & 0xff)
+    sim.ips[ip_id] = {
+        'IPADDRESSID' : ip_id,
+        'LINODEID' : linode_id,
+        'ISPUBLIC' : 0,
+        'IPADDRESS' : address,
+        'RDNS_NAME' : ''
+    }
+    return {'IPAddressID' : ip_id, 'IPADDRESS' : address}
+
+
+def linode_ip_list(sim, params, api_key):
+    ips = sorted(sim.ips.values(), key = lambda ip: ip['IPADDRESSID'])
+    if 'linodeid' in params:
+        sim._linode(params)
+    ips = _filter(ips, params, 'linodeid', 'LINODEID')
+    return _filter(ips, params, 'ipaddressid', 'IPADDRESSID')
+
+
+def linode_job_list(sim, params, api_key):
+    linode = sim._linode(params)
+    jobs = [_public(j) for j in sim.jobs.values() if j['LINODEID'] == linode['LINODEID']]
+    jobs = _filter(sorted(jobs, key = lambda j: -j['JOBID']), params, 'jobid', 'JOBID')
+    if _bool(params, 'pendingonly'):
+        jobs = [j for j in jobs if j['HOST_SUCCESS'] == '']
+    return jobs
+
+
+def image_list(sim, params, api_key):
+    images = sorted(sim.images.values(), key = lambda i: i['IMAGEID'])
+    return _filter(images, params, 'imageid', 'IMAGEID')
+
+
+def image_update(sim, params, api_key):
+    image = sim.images.get(_int(params, 'imageid'))
+    if image is None:
+        raise SimulatedError(ERROR_NOT_FOUND)
+    if 'label' in params:
+        image['LABEL'] = params['label']
+    if 'description' in params:
+        image['DESCRIPTION'] = params['description']
+    return image
+
+
+def image_delete(sim, params, api_key):
+    image = sim.images.pop(_int(params, 'imageid'), None)
+    if image is None:
+        raise SimulatedError(ERROR_NOT_FOUND)
+    return image
+
+
+ACTIONS = {
+    'avail.datacenters' : avail_datacenters,
+    'avail.distributions' : avail_distributions,
+    'avail.kernels' : avail_kernels,
+    'avail.linodeplans' : avail_linodeplans,
+    'avail.stackscripts' : avail_stackscripts,
+    'test.echo' : test_echo,
+    'linode.create' : linode_create,
+    'linode.update' : linode_update,
+    'linode.delete' : linode_delete,
+    'linode.list' : linode_list,
+    'linode.boot' : linode_boot,
+    'linode.shutdown' : linode_shutdown,
+    'linode.reboot' : linode_reboot,
+    'linode.clone' : linode_clone,
+    'linode.disk.create' : linode_disk_create,
+    'linode.disk.createfromdistribution' : linode_disk_createfromdistribution,
+    'linode.disk.createfromstackscript' : linode_disk_createfromstackscript,
+    'linode.disk.createfromimage' : linode_disk_createfromimage,
+    'linode.disk.duplicate' : linode_disk_duplicate,
+    'linode.disk.delete' : linode_disk_delete,
+    'linode.disk.list' : linode_disk_list,
+    'linode.disk.imagize' : linode_disk_imagize,
+    'linode.config.create' : linode_config_create,
+    'linode.config.list' : linode_config_list,
+    'linode.ip.addprivate' : linode_ip_addprivate,
+    'linode.ip.list' : linode_ip_list,
+    'linode.job.list' : linode_job_list,
+    'image.list' : image_list,
+    'image.update' : image_update,
+    'image.delete' : image_delete
+}
+
+
+
+#=============================================================
+# Transports
+
+class SimulatorTransport(object):
+    '''
+    Transport that answers requests with a :class:`Simulator` in the same process,
+    without any sockets. Pass it as the `transport` of a :class:`linode_api.LinodeClient`.
+    '''
+
+    def __init__(self, simulator):
+        self.simulator = simulator
+        self.requests = 0
+
+
+    def post(self, url, body, headers = None):
+        self.requests += 1
+        status, data = self.simulator.handle_request(body)
+        if status != 200:
+            raise TransportError(url, status, data, data)
+        return data
+
+
+    def post_stream(self, url, body, headers = None):
+        return StringIO.StringIO(self.post(url, body, headers))
+
+
+    def stats(self):
+        return {'requests' : self.requests}
+
+
+    def evict_idle(self):
+        pass
+
+
+    def close(self):
+        pass
+
+
+
+class SimulatorHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self._respond(*self.server.simulator.handle_request(body))
+
+
+    def do_GET(self):
+        # The API also accepts parameters in the query string.
+        self._respond(*self.server.simulator.handle_request(urlparse.urlparse(self.path).query))
+
+
+    def _respond(self, status, data):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json' if status == 200 else 'text/plain')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+    def log_message(self, *args):
+        pass
+
+
+
+class SimulatorServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    '''
+    Serves a :class:`Simulator` over HTTP, with a thread per connection.
+
+    Example:
+        server = SimulatorServer(Simulator(), port = 0)
+        server.start()
+        client = linode_api.LinodeClient('key', server.url)
+        ...
+        server.stop()
+    '''
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, simulator, host = '127.0.0.1', port = 5000):
+        BaseHTTPServer.HTTPServer.__init__(self, (host, port), SimulatorHandler)
+        self.simulator = simulator
+        self.url = 'http://%s:%d/' % (self.server_address[0], self.server_address[1])
+        self._thread = None
+
+
+    def start(self):
+        '''
+        Serve requests on a background thread. Returns the URL of the server.
+        '''
+        self._thread = threading.Thread(target = self.serve_forever, name = 'linode-api-simulator')
+        self._thread.daemon = True
+        self._thread.start()
+        return self.url
+
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+
+    def handle_error(self, request, client_address):
+        # Clients closing keep-alive connections is expected.
+        pass
+
+
+
+if __name__ == '__main__':
+    # Serves the simulator at linode_api.API_SIMULATOR_URL, or on the given port.
+    # Usage: simulator.py [port] [time_scale]
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    time_scale = float(sys.argv[2]) if len(sys.argv) > 2 else 1.0
+
+    server = SimulatorServer(Simulator(time_scale = time_scale), '127.0.0.1', port)
+    print 'Linode API simulator listening at %s' % (server.url)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
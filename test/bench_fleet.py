@@ -0,0 +1,392 @@
+'''
+Fleet provisioning benchmarks, run against the in-process API simulator.
+
+Measures Core.create_linode, Core.create_linodes, Core.wait_for_jobs, ImageManager.create_disk_from_image
+and LinodeImageProvider.create_image at several fleet sizes, and reports for each:
+wall time, API calls (HTTP requests and actions) per linode, the peak number of
+threads, and peak RSS. Results are saved as JSON and can be compared with the
+results of a previous run to catch regressions.
+
+Usage:
+    python bench_fleet.py [--sizes 1,10,100,1000] [--stages create_linode,...]
+        [--output bench_fleet.json] [--baseline old.json] [--tolerance 0.2]
+'''
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import resource
+import tempfile
+import threading
+import Queue
+
+import linode_api as lin
+import linode_core
+import image_manager
+from simulator import Simulator, SimulatorTransport
+
+
+SIZES = [1, 10, 100, 1000]
+
+# Job durations are scaled down from the simulator defaults (20s boot -> 20ms),
+# and so are poll intervals, so runs measure the library rather than the waits.
+TIME_SCALE = 0.001
+POLL_INTERVAL = 0.02
+MAX_POLL_INTERVAL = 0.03
+
+LINODE_SPEC = {
+    'plan_id' : 1,
+    'datacenter' : 9,
+    'distribution' : 'Ubuntu 14.04 LTS',
+    'kernel' : 'Latest 64 bit',
+    'label' : 'bench-{linode_id}',
+    'group' : 'bench',
+    'disks' :   {
+                    'boot' : {'disk_size' : 5000},
+                    'swap' : {'disk_size' : 'auto'},
+                    'others' : [
+                        {
+                            'label' : 'data',
+                            'disk_size' : 5000,
+                            'type' : 'ext4'
+                        }
+                    ]
+                }
+}
+
+IMAGE_SPEC = {
+    'datacenter' : 9,
+    'distribution' : 'Ubuntu 14.04 LTS',
+    'kernel' : 'Latest 64 bit',
+    'type' : 'linode-image',
+    'cluster-type' : 'bench'
+}
+
+
+
+class Environment(object):
+    '''
+    A simulator, a client for it, and a conf-dir for images.
+    '''
+
+    def __init__(self):
+        self.simulator = Simulator(time_scale = TIME_SCALE)
+        self.transport = SimulatorTransport(self.simulator)
+        self.client = lin.LinodeClient('bench-key', lin.API_SIMULATOR_URL, transport = self.transport)
+        # The simulator doesn't rate limit by default.
+        self.client.rate_limiter = None
+        self.client.retry_policy = None
+
+        self.conf_dir = tempfile.mkdtemp(prefix = 'bench-fleet-')
+        os.makedirs(os.path.join(self.conf_dir, 'images'))
+        key_file = os.path.join(self.conf_dir, 'id_rsa.pub')
+        with open(key_file, 'w') as f:
+            f.write('ssh-rsa AAAAB3NzaC1yc2EAAAADAQABAAABAQC bench@localhost\n')
+
+        self.app_ctx = {
+            'conf-dir' : self.conf_dir,
+            'root-ssh-key-file' : key_file,
+            'job-poll-interval' : POLL_INTERVAL,
+            'job-poll-max-interval' : MAX_POLL_INTERVAL
+        }
+
+
+    def core(self):
+        return linode_core.Core(self.app_ctx, self.client)
+
+
+    def create_bare_linodes(self, count):
+        return [self.client.create_node(1, 9, do_validations = False)[1] for i in range(count)]
+
+
+    def create_image(self, label):
+        '''
+        Create an image directly through the client and register it in conf-dir.
+        '''
+        linode_id = self.create_bare_linodes(1)[0]
+        disk_id, job_id = self.client.create_disk_from_distribution(linode_id, 124, 2000, 'Bench-pass1', None)[1:3]
+        self.core().wait_for_job(linode_id, job_id)
+        image_id, job_id = self.client.create_diskimage(linode_id, disk_id, label)[1:3]
+        self.core().wait_for_job(linode_id, job_id)
+
+        os.makedirs(os.path.join(self.conf_dir, 'images', label))
+        provider = image_manager.LinodeImageProvider(self.app_ctx, self.client)
+        provider.save_image(image_manager.Image(label, 'linode', IMAGE_SPEC), image_id)
+        self.client.delete_node(linode_id, 1)
+
+
+    def close(self):
+        shutil.rmtree(self.conf_dir, ignore_errors = True)
+
+
+
+def run_parallel(func, items, parallel):
+    '''
+    Call func(item) for each item on `parallel` threads. Returns the number of
+    calls that raised or returned a false value.
+    '''
+    q = Queue.Queue()
+    for item in items:
+        q.put(item)
+
+    failures = [0]
+    lock = threading.Lock()
+
+    def work():
+        while True:
+            try:
+                item = q.get_nowait()
+            except Queue.Empty:
+                return
+            try:
+                ok = func(item)
+            except Exception:
+                ok = False
+            if not ok:
+                with lock:
+                    failures[0] += 1
+
+    threads = [threading.Thread(target = work) for i in range(min(parallel, len(items)))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    return failures[0]
+
+
+#=============================================================
+# Stages
+#
+# Each takes (env, size, parallel), prepares what it needs, and returns
+# a function that performs the measured work and returns the failure count.
+
+def stage_create_linode(env, size, parallel):
+    core = env.core()
+    return lambda: run_parallel(lambda i: core.create_linode(dict(LINODE_SPEC), boot = True), range(size), parallel)
+
+
+def stage_create_linodes(env, size, parallel):
+    core = env.core()
+    def run():
+        results = core.create_linodes([dict(LINODE_SPEC) for i in range(size)], max_parallel = parallel)
+        return len([linode for i, linode in results if linode is None])
+    return run
+
+
+def stage_wait_for_jobs(env, size, parallel):
+    # One pending boot disk job per linode.
+    jobs = []
+    for linode_id in env.create_bare_linodes(size):
+        job_id = env.client.create_disk_from_distribution(linode_id, 124, 2000, 'Bench-pass1', None)[2]
+        jobs.append( (linode_id, job_id) )
+
+    core = env.core()
+    return lambda: len([r for r in core.wait_for_jobs(jobs) if not r['success']])
+
+
+def stage_create_disk_from_image(env, size, parallel):
+    env.create_image('bench-image')
+    linode_ids = env.create_bare_linodes(size)
+    manager = image_manager.ImageManager(env.app_ctx, env.client)
+
+    def create(linode_id):
+        disk_spec = {
+            'linode_id' : linode_id,
+            'label' : 'boot',
+            'disk_size' : 5000,
+            'root_password' : 'Bench-pass1',
+            'root_ssh_key_file' : env.app_ctx['root-ssh-key-file']
+        }
+        result = manager.create_disk_from_image('bench-image', disk_spec)
+        return result is not None and result[0]
+
+    return lambda: run_parallel(create, linode_ids, parallel)
+
+
+def stage_create_image(env, size, parallel):
+    def create(i):
+        provider = image_manager.LinodeImageProvider(env.app_ctx, env.client)
+        img = image_manager.Image('bench-image-%d' % (i), 'linode', dict(IMAGE_SPEC))
+        return provider.create_image(img, None)
+
+    return lambda: run_parallel(create, range(size), parallel)
+
+
+STAGES = [
+    ('create_linode', stage_create_linode),
+    ('create_linodes', stage_create_linodes),
+    ('wait_for_jobs', stage_wait_for_jobs),
+    ('create_disk_from_image', stage_create_disk_from_image),
+    ('create_image', stage_create_image)
+]
+
+
+#=============================================================
+# Measurement
+
+class ThreadSampler(object):
+    '''
+    Samples the number of live threads on a background thread, keeping the maximum.
+    '''
+
+    def __init__(self, interval = 0.005):
+        self.interval = interval
+        self.peak = threading.active_count()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target = self._sample)
+        self._thread.daemon = True
+
+
+    def start(self):
+        self._thread.start()
+
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        # Don't count the sampler itself.
+        return self.peak - 1
+
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, threading.active_count())
+
+
+
+def peak_rss_kb():
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS.
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 1024 if sys.platform == 'darwin' else rss
+
+
+def run_stage(name, stage, size, parallel, verbose):
+    env = Environment()
+    saved_stdout = sys.stdout
+    try:
+        if not verbose:
+            # Core logs every step to stdout.
+            sys.stdout = open(os.devnull, 'w')
+
+        run = stage(env, size, parallel)
+        stats_before = env.simulator.stats()
+        threads_before = threading.active_count()
+        rss_before = peak_rss_kb()
+
+        sampler = ThreadSampler()
+        sampler.start()
+        start = time.time()
+        failures = run()
+        wall_time = time.time() - start
+        peak_threads = sampler.stop()
+
+        stats_after = env.simulator.stats()
+
+    finally:
+        if not verbose:
+            sys.stdout.close()
+        sys.stdout = saved_stdout
+        env.close()
+
+    requests = stats_after['requests'] - stats_before['requests']
+    actions = sum(stats_after['calls'].values()) - sum(stats_before['calls'].values())
+
+    return {
+        'stage' : name,
+        'size' : size,
+        'parallel' : parallel,
+        'wall_time' : round(wall_time, 4),
+        'per_linode_time' : round(wall_time / size, 6),
+        'failures' : failures,
+        'http_requests' : requests,
+        'api_calls' : actions,
+        'http_requests_per_linode' : round(float(requests) / size, 3),
+        'api_calls_per_linode' : round(float(actions) / size, 3),
+        'peak_threads' : peak_threads,
+        'extra_threads' : peak_threads - (threads_before - 1),
+        'peak_rss_kb' : peak_rss_kb(),
+        'peak_rss_growth_kb' : peak_rss_kb() - rss_before
+    }
+
+
+def compare(results, baseline, tolerance):
+    '''
+    Returns a list of regressions of `results` against `baseline`: stages that got
+    slower by more than `tolerance`, or started making more API calls per linode.
+    '''
+    old = dict([((r['stage'], r['size']), r) for r in baseline['results']])
+    regressions = []
+    for r in results:
+        b = old.get( (r['stage'], r['size']) )
+        if b is None:
+            continue
+
+        if r['wall_time'] > b['wall_time'] * (1 + tolerance):
+            regressions.append('%s x%d: wall time %.3fs -> %.3fs' % (r['stage'], r['size'], b['wall_time'], r['wall_time']))
+        if r['api_calls_per_linode'] > b['api_calls_per_linode']:
+            regressions.append('%s x%d: API calls per linode %s -> %s' % (r['stage'], r['size'],
+                b['api_calls_per_linode'], r['api_calls_per_linode']))
+        if r['failures'] > b['failures']:
+            regressions.append('%s x%d: failures %d -> %d' % (r['stage'], r['size'], b['failures'], r['failures']))
+
+    return regressions
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description = 'Fleet provisioning benchmarks')
+    parser.add_argument('--sizes', default = ','.join(map(str, SIZES)))
+    parser.add_argument('--stages', default = ','.join([name for name, stage in STAGES]))
+    parser.add_argument('--parallel', type = int, default = 32,
+        help = 'Max linodes provisioned at once by stages that provision several')
+    parser.add_argument('--output', default = 'bench_fleet.json')
+    parser.add_argument('--baseline', help = 'Results of a previous run to compare with')
+    parser.add_argument('--tolerance', type = float, default = 0.2,
+        help = 'Allowed slowdown relative to the baseline')
+    parser.add_argument('--verbose', action = 'store_true')
+    args = parser.parse_args(argv)
+
+    sizes = [int(s) for s in args.sizes.split(',')]
+    names = args.stages.split(',')
+    stages = dict(STAGES)
+
+    results = []
+    print '%-24s%8s%12s%14s%14s%10s%12s' % ('Stage', 'Size', 'Wall (s)', 'Calls/linode', 'HTTP/linode', 'Threads', 'RSS (KB)')
+    print '-' * 94
+    for name in names:
+        for size in sizes:
+            r = run_stage(name, stages[name], size, args.parallel, args.verbose)
+            results.append(r)
+            print '%-24s%8d%12.3f%14.2f%14.2f%10d%12d' % (name, size, r['wall_time'], r['api_calls_per_linode'],
+                r['http_requests_per_linode'], r['peak_threads'], r['peak_rss_kb'])
+            if r['failures']:
+                print '    %d failures' % (r['failures'])
+
+    report = {
+        'created' : time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'python' : platform.python_version(),
+        'platform' : platform.platform(),
+        'time_scale' : TIME_SCALE,
+        'poll_interval' : POLL_INTERVAL,
+        'results' : results
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent = 4, separators = (',',':'), sort_keys = True)
+    print 'Results saved to %s' % (args.output)
+
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print 'REGRESSION: %s' % (regression)
+        if regressions:
+            return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
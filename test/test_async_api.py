@@ -0,0 +1,79 @@
+import time
+import threading
+
+from test_linode_api import FakeTransport, with_transport, restore_transport
+
+import linode_api as lin
+from async_api import AsyncClient, gather
+from exc import TransportError
+
+
+def handler(action, params):
+    if action == 'linode.create':
+        return {'ACTION' : action, 'ERRORARRAY' : [], 'DATA' : {'LinodeID' : int(params['PLANID'])}}
+        
+    if action == 'linode.job.list':
+        return {'ACTION' : action, 'ERRORARRAY' : [], 
+            'DATA' : [{'JOBID' : int(params['JobID']), 'HOST_SUCCESS' : 1}]}
+            
+    raise ValueError(action)
+    
+    
+def test_bounded_concurrency():
+    fake, saved = with_transport(handler)
+    client = AsyncClient(max_concurrency = 4, poll_interval = 0.05)
+    try:
+        futures = [client.create_node(i, 9, do_validations = False) for i in range(100)]
+        results = gather(futures)
+        assert [linode_id for success, linode_id, errors in results] == range(100)
+        assert len(client._workers) == 4
+        
+        jobs = gather([client.wait_for_job(i, 1000 + i) for i in range(100)])
+        assert jobs == [(True, True)] * 100
+        # All 100 jobs were checked with a handful of batched polls.
+        assert len(fake.posts) < 100 + 10
+    finally:
+        client.close()
+        restore_transport(saved)
+        
+
+def test_exceptions_propagate():
+    fake, saved = with_transport(handler)
+    client = AsyncClient(max_concurrency = 2)
+    try:
+        f = client.shutdown_node(1)
+        try:
+            f.result()
+            assert False
+        except ValueError:
+            pass
+    finally:
+        client.close()
+        restore_transport(saved)
+        
+        
+def test_job_deadlines():
+    def failing_handler(action, params):
+        raise TransportError('url', 503, 'Service Unavailable')
+        
+    client = lin.LinodeClient('key', 'http://localhost:5000/', transport = FakeTransport(handler))
+    client.rate_limiter = None
+    client.retry_policy = None
+    async_client = AsyncClient(poll_interval = 10, client = client)
+    try:
+        # The first check is right away, not after a poll interval.
+        start = time.time()
+        assert async_client.wait_for_job(1, 1001).result(5) == (True, True)
+        assert time.time() - start < 5
+        
+        # Jobs that can't be checked still time out.
+        client.transport = FakeTransport(failing_handler)
+        assert async_client.wait_for_job(1, 1002, timeout = 0.2).result(5) == (False, None)
+    finally:
+        async_client.close()
+        
+        
+if __name__ == '__main__':
+    test_bounded_concurrency()
+    test_exceptions_propagate()
+    test_job_deadlines()
@@ -0,0 +1,93 @@
+import os
+import shutil
+import tempfile
+
+import linode_api as lin
+from cassette import CassetteTransport, request_key
+from exc import CassetteMissError, TransportError
+from simulator import Simulator, SimulatorTransport
+
+
+def make_client(transport):
+    client = lin.LinodeClient('secret-key', lin.API_SIMULATOR_URL, transport = transport)
+    client.rate_limiter = None
+    client.retry_policy = None
+    return client
+
+
+def create_flow(client, password):
+    success, linode_id, errors = client.create_node(1, 'singapore')
+    disk_id, job_id = client.create_disk_from_distribution(linode_id, 'CentOS 7', 5000, password, None)[1:3]
+    finished = [client.is_job_finished(linode_id, job_id) for i in range(2)]
+    deleted, errors = client.delete_all_nodes(1)
+    return linode_id, disk_id, finished, deleted
+
+
+def test_request_key():
+    a = request_key('api_key=one&api_action=linode.create&PLANID=1&DATACENTERID=9')
+    b = request_key('DATACENTERID=9&api_action=linode.create&api_key=two&PLANID=1')
+    assert a == b and 'api_key' not in a
+    assert request_key('api_action=linode.disk.create&rootPass=x') == request_key('api_action=linode.disk.create&rootPass=y')
+
+
+def test_record_and_replay():
+    cassette_dir = tempfile.mkdtemp()
+    try:
+        for name in ['flow.ndjson', 'flow.ndjson.gz']:
+            path = os.path.join(cassette_dir, name)
+            
+            # The first poll sees the disk job pending, the second sees it finished.
+            sim = Simulator(job_durations = {'*' : 0})
+            recorder = CassetteTransport(path, 'record', SimulatorTransport(sim))
+            recorded = create_flow(make_client(recorder), 'Password1')
+            recorder.close()
+            
+            if not name.endswith('.gz'):
+                with open(path) as f:
+                    assert 'secret-key' not in f.read()
+            
+            player = CassetteTransport(path)
+            client = make_client(player)
+            assert create_flow(client, 'Password2') == recorded
+            assert player.stats()['replayed'] == recorder.stats()['recorded']
+            
+            # Catalogs are cached by the client, so replay with a new one.
+            player.rewind()
+            assert create_flow(make_client(player), 'Password3') == recorded
+            
+            try:
+                client.request('linode.list', {'LinodeID' : 1})
+                assert False
+            except CassetteMissError:
+                pass
+    finally:
+        shutil.rmtree(cassette_dir)
+
+
+def test_replays_transport_errors():
+    cassette_dir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(cassette_dir, 'errors.ndjson')
+        recorder = CassetteTransport(path, 'record', SimulatorTransport(Simulator(http_error_rate = 1)))
+        for i in range(2):
+            try:
+                recorder.post(lin.API_SIMULATOR_URL, 'api_key=k&api_action=test.echo')
+                assert False
+            except TransportError:
+                pass
+        recorder.close()
+        
+        player = CassetteTransport(path, replay_timing = True)
+        try:
+            player.post(lin.API_SIMULATOR_URL, 'api_key=k&api_action=test.echo')
+            assert False
+        except TransportError as e:
+            assert e.status == 503
+    finally:
+        shutil.rmtree(cassette_dir)
+
+
+if __name__ == '__main__':
+    test_request_key()
+    test_record_and_replay()
+    test_replays_transport_errors()
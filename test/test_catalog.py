@@ -0,0 +1,64 @@
+import os
+import tempfile
+
+from catalog import CatalogCache, CatalogIndex
+
+
+KERNELS = [
+    {'KERNELID' : 138, 'LABEL' : 'Latest 64 bit (4.1.5-x86_64-linode61)'},
+    {'KERNELID' : 137, 'LABEL' : 'Latest 32 bit (4.1.5-x86-linode80)'},
+    {'KERNELID' : 210, 'LABEL' : 'GRUB 2'},
+    {'KERNELID' : 211, 'LABEL' : 'GRUB 2'}
+]
+
+
+def linear_find_kernel(kernel):
+    for k in KERNELS:
+        if kernel.lower() in k['LABEL'].lower():
+            return k
+    return None
+    
+    
+def test_index_matches_linear_scan():
+    index = CatalogIndex(KERNELS, 'KERNELID', ['LABEL'], 'LABEL')
+    for query in ['latest', 'Latest 32', 'x86', '4.1.5', 'grub', 'GRUB 2', 'b', '', 'linode8', 'nope']:
+        assert index.find_substring(query) is linear_find_kernel(query), query
+        
+    assert index.find(137)['KERNELID'] == 137
+    assert index.find('137')['KERNELID'] == 137
+    assert index.find('grub 2')['KERNELID'] == 210
+    assert index.find(999) is None
+    
+    
+def test_snapshot_persistence():
+    fetches = []
+    def fetch(action):
+        fetches.append(action)
+        return KERNELS
+        
+    fd, snapshot_file = tempfile.mkstemp()
+    os.close(fd)
+    os.remove(snapshot_file)
+    try:
+        cache = CatalogCache(fetch, snapshot_file = snapshot_file, namespace = 'test')
+        cache.get('avail.kernels')
+        cache.get('avail.kernels')
+        assert fetches == ['avail.kernels']
+        
+        # A new cache starts warm from the snapshot.
+        cache = CatalogCache(fetch, snapshot_file = snapshot_file, namespace = 'test')
+        assert cache.index('avail.kernels').find(210)['LABEL'] == 'GRUB 2'
+        assert fetches == ['avail.kernels']
+        
+        # But not if it's for a different API endpoint.
+        cache = CatalogCache(fetch, snapshot_file = snapshot_file, namespace = 'other')
+        cache.get('avail.kernels')
+        assert len(fetches) == 2
+    finally:
+        if os.path.exists(snapshot_file):
+            os.remove(snapshot_file)
+    
+    
+if __name__ == '__main__':
+    test_index_matches_linear_scan()
+    test_snapshot_persistence()
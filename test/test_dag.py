@@ -0,0 +1,67 @@
+import time
+import threading
+
+from dag import StepGraph, format_path
+
+
+def test_steps_overlap():
+    graph = StepGraph()
+    running = []
+    lock = threading.Lock()
+    
+    def step(name, seconds, value = None):
+        def run(results):
+            with lock:
+                running.append(name)
+            time.sleep(seconds)
+            return value
+        return run
+    
+    graph.add('create', step('create', 0.01, 7))
+    graph.add('disk', lambda results: time.sleep(0.1) or results['create'] * 2, ['create'])
+    graph.add('ip', step('ip', 0.02, 'ip'), ['create'])
+    graph.add('config', lambda results: results['disk'] + 1, ['disk'])
+    graph.add('boot', step('boot', 0.01), ['config', 'ip'])
+    
+    start = time.time()
+    results = graph.run()
+    elapsed = time.time() - start
+    
+    assert results['config'] == 15 and results['ip'] == 'ip'
+    # disk and ip ran side by side.
+    assert elapsed < 0.1 + 0.02 + 0.05
+    assert [name for name, seconds in graph.critical_path()] == ['create', 'disk', 'config', 'boot']
+    assert format_path([('a', 1), ('b', 2.5)]) == 'a 1.00s -> b 2.50s = 3.50s'
+
+
+def test_failure_stops_new_steps():
+    graph = StepGraph()
+    started = []
+    
+    def fail(results):
+        raise ValueError('no disk')
+    
+    graph.add('create', lambda results: started.append('create'))
+    graph.add('disk', fail, ['create'])
+    graph.add('ip', lambda results: time.sleep(0.05) or started.append('ip'), ['create'])
+    graph.add('boot', lambda results: started.append('boot'), ['disk', 'ip'])
+    
+    try:
+        graph.run()
+        assert False
+    except ValueError as e:
+        assert str(e) == 'no disk'
+    
+    # Running steps finish, but no step starts after the failure.
+    assert started == ['create', 'ip']
+    
+    try:
+        graph.add('other', lambda results: None, ['missing'])
+        assert False
+    except ValueError:
+        pass
+
+
+if __name__ == '__main__':
+    test_steps_overlap()
+    test_failure_stops_new_steps()
@@ -0,0 +1,102 @@
+import json
+import StringIO
+
+import linode_api as lin
+from linode_core import Linode
+from fleet import Fleet, pack_ip, unpack_ip
+from simulator import Simulator, SimulatorTransport
+
+
+def make_fleet(count):
+    fleet = Fleet()
+    for i in range(1, count + 1):
+        fleet.add(i, 'web-%d' % (i), 'web' if i % 2 else 'db', 9, 1, 1024 * (1 + i % 4),
+            lin.STATUS_RUNNING if i % 3 else lin.STATUS_POWERED_OFF,
+            '10.0.%d.%d' % (i // 256, i % 256), '192.168.%d.%d' % (i // 256, i % 256))
+    return fleet
+
+
+def test_linode_slots():
+    linode = Linode(1, 'web-1', public_ip = ['1.2.3.4'])
+    try:
+        linode.no_such_attribute = 1
+        assert False
+    except AttributeError:
+        pass
+    
+    d = json.loads(json.dumps([linode], default = lambda o: o.to_dict()))[0]
+    assert d == linode.to_dict()
+    assert d['id'] == 1 and d['public_ip'] == ['1.2.3.4'] and d['private_ip'] is None
+    
+    
+def test_pack_ip():
+    assert unpack_ip(pack_ip('255.1.2.3')) == '255.1.2.3'
+    assert pack_ip(None) == 0 and unpack_ip(0) is None
+    try:
+        pack_ip('fe80::1')
+        assert False
+    except ValueError:
+        pass
+    
+    
+def test_lookups_and_filter():
+    fleet = make_fleet(100)
+    assert len(fleet) == 100
+    assert fleet.rows([1, 100, 101]) == [0, 99, None]
+    assert fleet.ids_by_ip(['10.0.0.5', '192.168.0.7', '1.1.1.1']) == [5, 7, None]
+    
+    linode = fleet[fleet.row(42)]
+    assert (linode.id, linode.label, linode.group, linode.ram_mb) == (42, 'web-42', 'db', 3072)
+    assert linode.public_ip == ['10.0.0.42'] and linode.private_ip == '192.168.0.42'
+    
+    web = fleet.filter(group = 'web', status = lin.STATUS_RUNNING, min_ram_mb = 2048)
+    expected = [i for i in range(1, 101) if i % 2 and i % 3 and 1 + i % 4 >= 2]
+    assert list(web.ids) == expected
+    assert fleet.select(group = 'nope') == []
+    assert fleet.select(label = 'web-1?') == range(9, 19)
+    
+    stats = fleet.stats()
+    assert stats['linodes'] == 100 and stats['groups'] == 2
+    assert sum(stats['status'].values()) == 100
+    
+    
+def test_json():
+    fleet = make_fleet(10)
+    fleet.add(11, u'caf\xe9 "1"', None)
+    
+    # The same as serializing Linode records.
+    expected = [dict((k, v) for k, v in linode.to_dict().items() if k in ('id', 'label', 'group',
+        'datacenter_id', 'plan_id', 'ram_mb', 'status', 'private_ip', 'public_ip')) for linode in fleet]
+    assert json.loads(fleet.to_json()) == expected
+    
+    out = StringIO.StringIO()
+    fleet.write_ndjson(out)
+    assert [json.loads(line) for line in out.getvalue().splitlines()] == expected
+    
+    
+def test_from_inventory():
+    sim = Simulator(time_scale = 0)
+    client = lin.LinodeClient('key', lin.API_SIMULATOR_URL, transport = SimulatorTransport(sim))
+    client.rate_limiter = None
+    client.retry_policy = None
+    for i in range(3):
+        success, linode_id, errors = client.create_node(1, 9)
+        client.update_node(linode_id, 'node-%d' % (i), 'g')
+        client.add_private_ip(linode_id)
+    
+    client.enable_inventory()
+    fleet = Fleet.from_inventory(client.inventory)
+    assert sorted(fleet.labels) == ['node-0', 'node-1', 'node-2']
+    for linode in fleet:
+        assert linode.datacenter_id == 9 and linode.ram_mb == 2048
+        assert linode.public_ip == [client.get_public_ip_address(linode.id)]
+        assert fleet.ids_by_ip([linode.private_ip]) == [linode.id]
+        
+        
+        
+if __name__ == '__main__':
+    test_linode_slots()
+    test_pack_ip()
+    test_lookups_and_filter()
+    test_json()
+    test_from_inventory()
@@ -0,0 +1,105 @@
+import threading
+
+import linode_api as lin
+from simulator import Simulator, SimulatorTransport
+
+
+def make_client(sim):
+    client = lin.LinodeClient('key', lin.API_SIMULATOR_URL, transport = SimulatorTransport(sim))
+    client.rate_limiter = None
+    client.retry_policy = None
+    return client
+
+
+def create_linode(client, label, group):
+    linode_id = client.create_node(1, 9, do_validations = False)[1]
+    client.update_node(linode_id, label, group)
+    disk_id = client.create_disk_from_distribution(linode_id, 124, 2000, 'Secret-pass1', None)[1]
+    client.create_config(linode_id, 138, [disk_id], 'config')
+    return linode_id
+
+
+def test_lookups_are_local():
+    sim = Simulator(time_scale = 0)
+    client = make_client(sim)
+    web = [create_linode(client, 'web-%d' % (i), 'web') for i in range(3)]
+    db = create_linode(client, 'db-1', 'db')
+
+    inventory = client.enable_inventory()
+    public_ip = client.get_public_ip_address(web[1])
+    requests = sim.stats()['requests']
+
+    assert client.get_public_ip_address(web[1]) == public_ip
+    assert client.get_node_memory(db) == 2048
+    assert inventory.find('WEB-2')['LINODEID'] == web[2]
+    assert [n['LINODEID'] for n in inventory.group('web')] == web
+    assert inventory.node_by_ip(public_ip)['LINODEID'] == web[1]
+    assert len(inventory.disks(db)) == 1 and len(inventory.configs(db)) == 1
+    assert client.get_disks(db) == inventory.disks(db)
+    assert client.get_configs(db) == inventory.configs(db)
+    assert inventory.node(12345) is None
+    assert sim.stats()['requests'] == requests
+
+
+def test_mutations_and_incremental_refresh():
+    sim = Simulator(time_scale = 0)
+    client = make_client(sim)
+    linode_ids = [create_linode(client, 'node-%d' % (i), 'fleet') for i in range(30)]
+    inventory = client.enable_inventory()
+    inventory.nodes()
+
+    # A mutation marks the linode dirty; it's resynced with one request on its next lookup.
+    private_ip = client.add_private_ip(linode_ids[0])[1]
+    requests = sim.stats()['requests']
+    assert inventory.node_by_ip(private_ip) is None
+    assert inventory.private_ip(linode_ids[0]) == private_ip
+    assert inventory.node_by_ip(private_ip)['LINODEID'] == linode_ids[0]
+    assert sim.stats()['requests'] == requests + 1
+
+    client.update_node(linode_ids[1], 'renamed', 'other')
+    assert inventory.node(linode_ids[1])['LABEL'] == 'renamed'
+    assert inventory.find('node-1') is None
+    assert [n['LINODEID'] for n in inventory.group('other')] == [linode_ids[1]]
+
+    client.delete_node(linode_ids[2], 1)
+    assert inventory.node(linode_ids[2]) is None and inventory.find('node-2') is None
+
+    # Changes made elsewhere are picked up by refresh, which only fetches the
+    # disks and configs of new or changed linodes.
+    calls = sim.stats()['calls']
+    sim.handle('linode.update', {'LinodeID' : linode_ids[3], 'Label' : 'outside'})
+    other = sim.handle('linode.create', {'DatacenterID' : 9, 'PlanID' : 1})['DATA']['LinodeID']
+    inventory.refresh()
+    after = sim.stats()['calls']
+    assert after['linode.disk.list'] - calls['linode.disk.list'] == 2
+    assert inventory.find('outside')['LINODEID'] == linode_ids[3]
+    assert inventory.node(other) is not None
+    assert inventory.stats()['linodes'] == 30
+
+
+def test_cold_mirror_is_loaded_once():
+    sim = Simulator(time_scale = 0)
+    client = make_client(sim)
+    linode_ids = [create_linode(client, 'node-%d' % (i), 'fleet') for i in range(5)]
+    inventory = client.enable_inventory()
+    lists = sim.stats()['calls'].get('linode.list', 0)
+
+    threads = [threading.Thread(target = inventory.node, args = (linode_id,)) for linode_id in linode_ids * 4]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    # The callers that waited for the first load didn't list the account again.
+    assert inventory.stats()['refreshes'] == 1
+    assert sim.stats()['calls']['linode.list'] == lists + 1
+
+    # Refreshes of a loaded mirror still run.
+    inventory.refresh()
+    assert inventory.stats()['refreshes'] == 2
+
+
+if __name__ == '__main__':
+    test_lookups_are_local()
+    test_mutations_and_incremental_refresh()
+    test_cold_mirror_is_loaded_once()
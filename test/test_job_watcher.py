@@ -0,0 +1,151 @@
+import time
+import threading
+
+import linode_api as lin
+import linode_core
+from job_watcher import JobWatcher
+from polling import PollPolicy, JobHistory
+from simulator import Simulator, SimulatorTransport
+
+
+def make_client(sim):
+    client = lin.LinodeClient('key', lin.API_SIMULATOR_URL, transport = SimulatorTransport(sim))
+    client.rate_limiter = None
+    client.retry_policy = None
+    return client
+
+
+def create_disk_jobs(client, linode_count, jobs_per_linode):
+    jobs = []
+    for i in range(linode_count):
+        linode_id = client.create_node(1, 9, do_validations = False)[1]
+        for j in range(jobs_per_linode):
+            jobs.append( (linode_id, client.create_disk(linode_id, 'ext4', 100, 'disk%d' % (j))[2]) )
+    return jobs
+
+
+def test_polls_are_multiplexed():
+    sim = Simulator(time_scale = 0.001)
+    client = make_client(sim)
+    jobs = create_disk_jobs(client, 100, 4)
+    
+    policy = PollPolicy(min_interval = 0.01, max_interval = 0.02, timeout = 10, history = JobHistory())
+    watcher = JobWatcher(client, policy)
+    
+    requests = sim.stats()['requests']
+    threads = threading.active_count()
+    futures = watcher.watch_all(jobs, 'linode.disk.create')
+    assert threading.active_count() <= threads + 1
+    results = [f.result(10) for f in futures]
+    
+    assert results == [(True, True)] * len(jobs)
+    # At most one linode.job.list per linode per poll, batched 25 linodes per request.
+    assert watcher.checks <= 100 * watcher.polls
+    assert sim.stats()['requests'] - requests <= 4 * watcher.polls
+    assert sim.stats()['calls']['linode.job.list'] == watcher.checks
+    assert watcher.pending() == 0
+    
+    # The poller exits once there's nothing to watch.
+    for i in range(100):
+        if watcher._poller is None:
+            break
+        time.sleep(0.01)
+    assert watcher._poller is None
+
+
+def test_timeouts_and_callbacks():
+    sim = Simulator(time_scale = 0.001, job_durations = {'linode.disk.create' : 3600})
+    client = make_client(sim)
+    (linode_id, job_id), = create_disk_jobs(client, 1, 1)
+    
+    watcher = JobWatcher(client, PollPolicy(min_interval = 0.01, history = JobHistory()))
+    called = []
+    future = watcher.watch(linode_id, job_id, timeout = 0.05, callback = called.append)
+    assert future.result(5) == (False, None)
+    assert called == [future]
+    
+    # Unknown jobs resolve as no such job.
+    assert watcher.watch(linode_id, 999999).result(5) == (None, None)
+    
+    pending = watcher.watch(linode_id, job_id)
+    watcher.close()
+    assert pending.result(1) == (False, None)
+
+
+def test_core_wait_for_jobs():
+    sim = Simulator(time_scale = 0.001)
+    client = make_client(sim)
+    jobs = create_disk_jobs(client, 10, 2)
+    
+    core = linode_core.Core({'job-poll-interval' : 0.01}, client)
+    results = core.wait_for_jobs(jobs)
+    assert [(r['linode_id'], r['job_id']) for r in results] == jobs
+    assert all([r['finished'] and r['success'] for r in results])
+
+
+def test_sharded_client():
+    sims = [Simulator(time_scale = 0.001), Simulator(time_scale = 0.001)]
+    sims[1]._next_id = 500000
+    clients = [make_client(sim) for sim in sims]
+    sharded = lin.ShardedClient(clients)
+    jobs = []
+    for i in range(4):
+        linode_id = sharded.create_node(1, 9, do_validations = False)[1]
+        jobs.append( (linode_id, sharded.create_disk(linode_id, 'ext4', 100, 'disk')[2]) )
+    
+    watcher = JobWatcher(sharded, PollPolicy(min_interval = 0.01, max_interval = 0.02, timeout = 10))
+    results = [f.result(10) for f in watcher.watch_all(jobs, 'linode.disk.create')]
+    assert results == [(True, True)] * 4
+    assert [sim.stats()['calls']['linode.job.list'] > 0 for sim in sims] == [True, True]
+    
+    
+def test_programming_errors_fail_jobs():
+    class BrokenClient(object):
+        def batch_request(self, requests):
+            raise AttributeError('batch_request')
+            
+    watcher = JobWatcher(BrokenClient(), PollPolicy(min_interval = 0.01, timeout = 60))
+    future = watcher.watch(1, 2)
+    # Raised at the first check, not after the timeout.
+    try:
+        future.result(5)
+        assert False
+    except AttributeError:
+        pass
+    assert watcher.pending() == 0
+    
+    
+def test_bad_responses_fail_only_their_jobs():
+    class OddClient(object):
+        def batch_request(self, requests):
+            # Linode 1 answers without DATA. Linode 2's job is done.
+            return [{'ERRORARRAY' : []} if params['LinodeID'] == 1 else
+                {'ERRORARRAY' : [], 'DATA' : [{'JOBID' : 20, 'HOST_SUCCESS' : 1}]}
+                for action, params in requests]
+    
+    class BrokenPolicy(PollPolicy):
+        def record(self, job_label, duration):
+            raise ValueError('record')
+            
+    watcher = JobWatcher(OddClient(), BrokenPolicy(min_interval = 0.01, timeout = 60))
+    odd, done = watcher.watch_all([(1, 10), (2, 20)])
+    try:
+        odd.result(5)
+        assert False
+    except KeyError:
+        pass
+    assert done.result(5) == (True, True)
+    
+    # The poller survived the failing policy, and serves new jobs.
+    assert watcher.watch(2, 20).result(5) == (True, True)
+    assert watcher.stats()['polls'] >= 2 and watcher.pending() == 0
+    
+    
+    
+if __name__ == '__main__':
+    test_polls_are_multiplexed()
+    test_timeouts_and_callbacks()
+    test_core_wait_for_jobs()
+    test_sharded_client()
+    test_programming_errors_fail_jobs()
+    test_bad_responses_fail_only_their_jobs()
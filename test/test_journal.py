@@ -0,0 +1,175 @@
+import os
+import tempfile
+
+import linode_api as lin
+import linode_core
+from journal import CreationJournal, pending_journals
+from simulator import Simulator, SimulatorTransport
+
+
+SPEC = {
+    'plan_id' : 1,
+    'datacenter' : 9,
+    'distribution' : 'Ubuntu 14.04 LTS',
+    'kernel' : 'Latest 64 bit',
+    'label' : 'web-{linode_id}',
+    'group' : 'web',
+    'disks' : {'boot' : {'disk_size' : 5000}, 'swap' : {'disk_size' : 'auto'}}
+}
+
+
+def make_core(sim, journal_dir):
+    client = lin.LinodeClient('key', lin.API_SIMULATOR_URL, transport = SimulatorTransport(sim))
+    client.rate_limiter = None
+    client.retry_policy = None
+    
+    key_file = os.path.join(tempfile.mkdtemp(), 'id_rsa.pub')
+    with open(key_file, 'w') as f:
+        f.write('ssh-rsa AAAA test@localhost\n')
+    return linode_core.Core({'root-ssh-key-file' : key_file, 'job-poll-interval' : 0.005,
+        'journal-dir' : journal_dir}, client)
+
+
+def test_journal_removed_on_success():
+    journal_dir = tempfile.mkdtemp()
+    sim = Simulator(time_scale = 0.001)
+    linode = make_core(sim, journal_dir).create_linode(SPEC)
+    
+    assert linode.inited and linode.private_ip and linode.public_ip
+    assert pending_journals(journal_dir) == []
+    
+    
+def test_resume_after_failed_step():
+    journal_dir = tempfile.mkdtemp()
+    sim = Simulator(time_scale = 0.001, failures = {'linode.config.create' : 1.0})
+    core = make_core(sim, journal_dir)
+    
+    assert core.create_linode(SPEC, delete_on_error = False) is None
+    
+    # The linode and its disks are kept, and the journal says how far the creation got.
+    journals = pending_journals(journal_dir)
+    assert len(journals) == 1
+    journal = journals[0]
+    assert journal.linode_id in sim.linodes
+    assert set(['create_node', 'boot_disk', 'swap_disk', 'private_ip']) <= set(journal.results.keys())
+    assert 'create_config' not in journal.results
+    
+    sim.failures = {}
+    calls = dict(sim.stats()['calls'])
+    results = core.resume_linodes()
+    
+    linode = results[0][1]
+    assert linode.inited and linode.id == journal.linode_id
+    assert linode.boot_disk_id == journal.results['boot_disk']
+    
+    # Only the missing steps ran.
+    after = sim.stats()['calls']
+    for action in ['linode.create', 'linode.disk.createfromdistribution', 'linode.disk.create', 'linode.ip.addprivate']:
+        assert after.get(action, 0) == calls.get(action, 0), action
+    assert after['linode.config.create'] == calls.get('linode.config.create', 0) + 1
+    assert len(sim.linodes) == 1
+    assert pending_journals(journal_dir) == []
+    
+    
+def test_resume_after_failed_job():
+    journal_dir = tempfile.mkdtemp()
+    sim = Simulator(time_scale = 0.001, job_failures = {'linode.boot' : 1.0})
+    core = make_core(sim, journal_dir)
+    
+    assert core.create_linode(SPEC, delete_on_error = False) is None
+    journal = pending_journals(journal_dir)[0]
+    # A failed job is forgotten, so that the resumed step starts a new one.
+    assert 'boot' not in journal.jobs
+    
+    sim.job_failures = {}
+    boots = sim.stats()['calls']['linode.boot']
+    linode = core.resume_linode(journal)
+    assert linode.inited
+    assert sim.stats()['calls']['linode.boot'] == boots + 1
+    
+    
+def test_resume_deletes_failed_disks():
+    journal_dir = tempfile.mkdtemp()
+    sim = Simulator(time_scale = 0.001, job_failures = {'linode.disk.create' : 1.0})
+    core = make_core(sim, journal_dir)
+    
+    assert core.create_linode(SPEC, delete_on_error = False) is None
+    journal = pending_journals(journal_dir)[0]
+    failed = list(journal.failed_disks['swap_disk'])
+    assert len(failed) == 1 and failed[0] in sim.disks
+    
+    sim.job_failures = {}
+    linode = core.resume_linode(journal)
+    assert linode.inited
+    # The disk of the failed job was deleted, and only the boot and swap disks are left.
+    assert failed[0] not in sim.disks
+    assert len([d for d in sim.disks.values() if d['LINODEID'] == linode.id]) == 2
+    
+    
+def test_rollback_removes_journal():
+    journal_dir = tempfile.mkdtemp()
+    sim = Simulator(time_scale = 0.001, failures = {'linode.config.create' : 1.0})
+    core = make_core(sim, journal_dir)
+    
+    results = list(core.create_linodes([SPEC] * 2))
+    assert [linode for i, linode in results] == [None, None]
+    assert sim.linodes == {}
+    assert pending_journals(journal_dir) == []
+    
+    
+def test_discard():
+    journal_dir = tempfile.mkdtemp()
+    sim = Simulator(time_scale = 0.001, failures = {'linode.config.create' : 1.0})
+    core = make_core(sim, journal_dir)
+    core.create_linode(SPEC, delete_on_error = False)
+    
+    assert core.discard_linode(pending_journals(journal_dir)[0])
+    assert sim.linodes == {}
+    assert pending_journals(journal_dir) == []
+    
+    
+def test_load_torn_journal():
+    journal_dir = tempfile.mkdtemp()
+    journal = CreationJournal.create(journal_dir, SPEC)
+    journal.record('create_node', 42)
+    journal.record_job('boot_disk', 7, 100)
+    journal.record_job('swap_disk', 8, 101)
+    journal.record_job_failed('swap_disk')
+    with open(journal.path, 'a') as f:
+        f.write('{"step":"private_ip","res')
+    
+    loaded = CreationJournal.load(journal.path)
+    assert loaded.linode_spec == SPEC and loaded.boot
+    assert loaded.linode_id == 42
+    assert loaded.results == {'create_node' : 42}
+    assert loaded.jobs == {'boot_disk' : {'job_id' : 7, 'disk_id' : 100}}
+    
+    loaded.finish()
+    assert not os.path.exists(journal.path)
+    
+    
+def test_skip_unreadable_journals():
+    journal_dir = tempfile.mkdtemp()
+    journal = CreationJournal.create(journal_dir, SPEC)
+    journal.record('create_node', 42)
+    for name, content in [('empty', ''), ('torn', '{"version":1,"crea')]:
+        with open(os.path.join(journal_dir, name + '.journal'), 'w') as f:
+            f.write(content)
+    
+    # Set aside, so that they don't break every later listing.
+    assert [j.linode_id for j in pending_journals(journal_dir)] == [42]
+    assert sorted(os.listdir(journal_dir)) == sorted([os.path.basename(journal.path),
+        'empty.journal.corrupt', 'torn.journal.corrupt'])
+    assert [j.linode_id for j in pending_journals(journal_dir)] == [42]
+    
+    
+    
+if __name__ == '__main__':
+    test_journal_removed_on_success()
+    test_resume_after_failed_step()
+    test_resume_after_failed_job()
+    test_resume_deletes_failed_disks()
+    test_rollback_removes_journal()
+    test_discard()
+    test_load_torn_journal()
+    test_skip_unreadable_journals()
@@ -0,0 +1,51 @@
+import json
+import StringIO
+
+from json_stream import ResponseStream
+
+
+RESPONSE = {
+    'ERRORARRAY' : [],
+    'ACTION' : 'linode.list',
+    'DATA' : [
+        {
+            'LINODEID' : 1000 + i, 
+            'LABEL' : u'node-\u00e9-%d' % (i), 
+            'TOTALRAM' : 2048,
+            'BACKUPSENABLED' : 0,
+            'STATUS' : 1,
+            'TOTALHD' : 49152.5
+        } for i in range(200)
+    ]
+}
+
+
+def test_stream_matches_json_loads():
+    body = json.dumps(RESPONSE, indent = 4)
+    for chunk_size in [1, 7, 64, 4096]:
+        stream = ResponseStream(StringIO.StringIO(body), chunk_size = chunk_size)
+        assert list(stream) == RESPONSE['DATA']
+        assert stream.errors == []
+        assert stream.action == 'linode.list'
+        
+        
+def test_projection_and_key_order():
+    # DATA before the other keys, no whitespace.
+    body = '{"DATA":[{"LINODEID":1,"LABEL":"a","TOTALRAM":1024},{"LINODEID":22,"LABEL":"b"}],' \
+        '"ACTION":"linode.list","ERRORARRAY":[{"ERRORCODE":4,"ERRORMESSAGE":"x"}]}'
+    stream = ResponseStream(StringIO.StringIO(body), fields = ['LINODEID', 'TOTALRAM'], chunk_size = 3)
+    assert list(stream) == [{'LINODEID' : 1, 'TOTALRAM' : 1024}, {'LINODEID' : 22}]
+    assert stream.errors[0]['ERRORCODE'] == 4
+    
+    
+def test_non_list_data():
+    body = '{"ERRORARRAY":[],"ACTION":"linode.create","DATA":{"LinodeID":5}}'
+    stream = ResponseStream(StringIO.StringIO(body))
+    assert list(stream) == []
+    assert stream.other['DATA'] == {'LinodeID' : 5}
+    
+    
+if __name__ == '__main__':
+    test_stream_matches_json_loads()
+    test_projection_and_key_order()
+    test_non_list_data()
@@ -0,0 +1,392 @@
+import os
+import time
+import threading
+import urlparse
+import json
+import StringIO
+import calendar
+
+os.environ.setdefault('LINODE_API_KEY', 'test-key')
+os.environ.setdefault('LINODE_API_URL', 'http://localhost:5000/')
+
+import linode_api as lin
+import ratelimit
+from simulator import Simulator, SimulatorTransport
+from api_time import format_api_time
+from inventory import Inventory
+
+
+class FakeTransport(object):
+    '''
+    Stands in for the pooled HTTP transport. Answers requests with `handler(action, params)`
+    and expands batch requests the same way the real API does.
+    '''
+    def __init__(self, handler):
+        self.handler = handler
+        self.posts = []
+        self.lock = threading.Lock()
+        
+    def post(self, url, body, headers = None):
+        params = dict(urlparse.parse_qsl(body))
+        with self.lock:
+            self.posts.append(params)
+            
+        action = params.pop('api_action')
+        if action == 'batch':
+            resp = [self.handler(req.pop('api_action'), req) 
+                for req in json.loads(params['api_requestArray'])]
+        else:
+            resp = self.handler(action, params)
+        return json.dumps(resp)
+        
+    def post_stream(self, url, body, headers = None):
+        return StringIO.StringIO(self.post(url, body, headers))
+
+
+def job_handler(action, params):
+    assert action == 'linode.job.list'
+    job_id = int(params['JobID'])
+    if job_id == 0:
+        return {'ACTION' : action, 'ERRORARRAY' : [], 'DATA' : []}
+    return {'ACTION' : action, 'ERRORARRAY' : [], 
+        'DATA' : [{'JOBID' : job_id, 'HOST_SUCCESS' : '' if job_id % 2 else 1}]}
+
+
+def with_transport(handler):
+    fake = FakeTransport(handler)
+    client = lin.default_client()
+    saved = client.transport
+    client.transport = fake
+    return fake, saved
+    
+    
+def restore_transport(saved):
+    lin.default_client().transport = saved
+
+
+def test_batch_demultiplexes_results():
+    fake, saved = with_transport(job_handler)
+    try:
+        results = lin.are_jobs_finished([(1, 1), (1, 2), (1, 0)])
+        assert results == [(False, None), (True, True), (None, None)]
+        assert len(fake.posts) == 1
+    finally:
+        restore_transport(saved)
+        
+        
+def test_batch_is_chunked():
+    fake, saved = with_transport(job_handler)
+    try:
+        jobs = [(1, i) for i in range(1, lin.MAX_BATCH_SIZE * 2 + 2)]
+        results = lin.are_jobs_finished(jobs)
+        assert len(results) == len(jobs)
+        assert len(fake.posts) == 3
+    finally:
+        restore_transport(saved)
+        
+        
+def test_coalescing():
+    fake, saved = with_transport(job_handler)
+    coalescer = lin.enable_coalescing(window = 0.2)
+    try:
+        results = {}
+        def poll(job_id):
+            results[job_id] = lin.is_job_finished(1, job_id)
+            
+        threads = [threading.Thread(target = poll, args = (i,)) for i in range(1, 11)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+            
+        assert results[1] == (False, None)
+        assert results[2] == (True, True)
+        assert coalescer.stats()['requests'] == 10
+        assert len(fake.posts) < 10
+    finally:
+        lin.disable_coalescing()
+        restore_transport(saved)
+
+
+def test_coalesced_calls_retry_when_throttled():
+    throttled = set()
+    def handler(action, params):
+        # linode.update of linode 3 is rate limited the first time.
+        if params['LinodeID'] == 3 and 3 not in throttled:
+            throttled.add(3)
+            return {'ACTION' : action, 'DATA' : {}, 'ERRORARRAY' : [{'ERRORCODE' : 14, 'ERRORMESSAGE' : 'Rate limited'}]}
+        return {'ACTION' : action, 'ERRORARRAY' : [], 'DATA' : {'LinodeID' : params['LinodeID']}}
+    
+    fake = FakeTransport(handler)
+    client = lin.LinodeClient('key', 'http://localhost:5000/', transport = fake,
+        retry_policy = ratelimit.RetryPolicy(base_delay = 0.01))
+    client.rate_limiter = None
+    client.enable_coalescing(window = 0.2)
+    try:
+        results = {}
+        def update(linode_id):
+            results[linode_id] = client.update_node(linode_id, 'l', 'g')
+            
+        threads = [threading.Thread(target = update, args = (i,)) for i in range(1, 6)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        
+        # Only the throttled call was sent again.
+        assert all([results[i][0] for i in range(1, 6)]), results
+        assert len(fake.posts) == 2
+        assert json.loads(fake.posts[1]['api_requestArray'])[0]['LinodeID'] == 3
+    finally:
+        client.disable_coalescing()
+
+
+KERNELS = [
+    {'KERNELID' : 138, 'LABEL' : 'Latest 64 bit (4.1.5-x86_64-linode61)', 'ISKVM' : 1, 'ISXEN' : 1},
+    {'KERNELID' : 137, 'LABEL' : 'Latest 32 bit (4.1.5-x86-linode80)', 'ISKVM' : 1, 'ISXEN' : 1},
+    {'KERNELID' : 210, 'LABEL' : 'GRUB 2', 'ISKVM' : 1, 'ISXEN' : 0}
+]
+
+def catalog_handler(action, params):
+    assert action == 'avail.kernels'
+    return {'ACTION' : action, 'ERRORARRAY' : [], 'DATA' : KERNELS}
+
+
+def test_catalog_cache():
+    fake, saved = with_transport(catalog_handler)
+    lin.invalidate_catalogs()
+    try:
+        assert lin.find_kernel('Latest 64') == (138, KERNELS[0]['LABEL'])
+        assert lin.find_kernel('grub') == (210, 'GRUB 2')
+        assert lin.find_kernel(137) == (137, KERNELS[1]['LABEL'])
+        assert lin.find_kernel('no such kernel') == (None, None)
+        assert len(fake.posts) == 1
+        
+        lin.invalidate_catalogs('avail.kernels')
+        lin.find_kernel('grub')
+        assert len(fake.posts) == 2
+    finally:
+        lin.invalidate_catalogs()
+        restore_transport(saved)
+
+
+def image_handler(action, params):
+    assert action == 'image.list'
+    return {'ACTION' : action, 'ERRORARRAY' : [], 
+        'DATA' : [{'IMAGEID' : i, 'LABEL' : 'img%d' % (i), 'MINSIZE' : 100 * i} for i in range(5)]}
+
+
+def test_streamed_list():
+    fake, saved = with_transport(image_handler)
+    try:
+        assert lin.image_stats() == (5, 1000)
+        assert list(lin.iter_images(['IMAGEID']))[-1] == {'IMAGEID' : 4}
+    finally:
+        restore_transport(saved)
+
+
+def test_sharded_client():
+    def make_handler(account):
+        def handler(action, params):
+            if action == 'linode.create':
+                linode_id = account * 100 + len(created[account])
+                created[account].append(linode_id)
+                return {'ACTION' : action, 'ERRORARRAY' : [], 'DATA' : {'LinodeID' : linode_id}}
+            if action == 'linode.update':
+                assert int(params['LinodeID']) in created[account]
+                updated[account].append(int(params['LinodeID']))
+                return {'ACTION' : action, 'ERRORARRAY' : [], 'DATA' : {'LinodeID' : int(params['LinodeID'])}}
+            raise ValueError(action)
+        return handler
+        
+    created = {1 : [], 2 : []}
+    updated = {1 : [], 2 : []}
+    clients = [lin.LinodeClient('key%d' % (i), 'http://localhost:5000/', 
+        transport = FakeTransport(make_handler(i))) for i in [1, 2]]
+    sharded = lin.ShardedClient(clients)
+    
+    linode_ids = [sharded.create_node(1, 9, do_validations = False)[1] for i in range(4)]
+    assert len(created[1]) == 2 and len(created[2]) == 2
+    
+    for linode_id in linode_ids:
+        assert sharded.update_node(linode_id, 'label', 'group')[0]
+    assert sorted(updated[1]) == created[1]
+    assert sorted(updated[2]) == created[2]
+
+
+def test_coalesced_mutations():
+    sim = Simulator(time_scale = 0)
+    client = lin.LinodeClient('key', 'http://localhost:5000/', transport = SimulatorTransport(sim))
+    client.rate_limiter = None
+    linode_ids = [client.create_node(1, 9, do_validations = False)[1] for i in range(5)]
+    
+    mutations = []
+    class Recorder(object):
+        def on_mutation(self, action, params, resp):
+            mutations.append( (action, params['LinodeID']) )
+    client.inventory = Recorder()
+    client.enable_coalescing(window = 0.2)
+    requests = sim.stats()['requests']
+    lin.enable_metrics(reset = True)
+    try:
+        threads = [threading.Thread(target = client.update_node, args = (linode_id, 'l', 'g'))
+            for linode_id in linode_ids]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+            
+        # Sent as one batch, but told to the inventory and counted once per action.
+        assert sim.stats()['requests'] == requests + 1
+        assert sorted(mutations) == sorted([('linode.update', linode_id) for linode_id in linode_ids])
+        calls = lin.api_metrics.to_dict()['calls']
+        assert calls['linode.update'] == 5 and calls['batch'] == 1
+    finally:
+        lin.disable_metrics()
+        lin.api_metrics.reset()
+        client.disable_coalescing()
+        
+        
+def test_sharded_client_spans_accounts():
+    sims = [Simulator(time_scale = 0), Simulator(time_scale = 0)]
+    sims[1]._next_id = 500000
+    clients = [lin.LinodeClient('key', 'http://localhost:5000/', transport = SimulatorTransport(sim)) for sim in sims]
+    for client in clients:
+        client.rate_limiter = None
+    sharded = lin.ShardedClient(clients)
+    
+    linode_ids = [sharded.create_node(1, 9, do_validations = False)[1] for i in range(4)]
+    for linode_id in linode_ids:
+        sharded.add_private_ip(linode_id)
+    assert [len(sim.linodes) for sim in sims] == [2, 2]
+    
+    # Requests go to the owner of their LinodeID, and batches are split per account.
+    responses = sharded.batch_request([('linode.list', {'LinodeID' : linode_id}) for linode_id in linode_ids])
+    assert [resp['DATA'][0]['LINODEID'] for resp in responses] == linode_ids
+    assert sharded.request('linode.ip.list', {'LinodeID' : linode_ids[1]})['DATA'][0]['LINODEID'] == linode_ids[1]
+    assert sorted([n['LINODEID'] for n in sharded.iter_nodes()]) == sorted(linode_ids)
+    assert len(list(sharded.iter_ip_addresses())) == 8
+    assert sharded.catalogs is clients[0].catalogs
+    
+    inventory = Inventory(sharded)
+    assert sorted([n['LINODEID'] for n in inventory.nodes()]) == sorted(linode_ids)
+    assert len(inventory.disks(linode_ids[3])) == 0
+    
+    disks = [sharded.create_disk(linode_id, 'ext4', 1000, 'boot')[1] for linode_id in linode_ids[:2]]
+    image_ids = [sharded.create_diskimage(linode_id, disk_id, 'img')[1] for linode_id, disk_id in zip(linode_ids, disks)]
+    assert sorted([i['IMAGEID'] for i in sharded.iter_images()]) == sorted(image_ids)
+    
+    progress = []
+    results = sharded.delete_image_ids(image_ids[::-1])
+    assert results.keys() == image_ids[::-1] and all([success for success, errors in results.values()])
+    results = sharded.delete_node_ids(linode_ids, progress = lambda *args: progress.append(args[0]))
+    assert results.keys() == linode_ids and all([success for success, errors in results.values()])
+    assert sorted(progress) == [1, 2, 3, 4]
+    assert [sim.linodes for sim in sims] == [{}, {}] and [sim.images for sim in sims] == [{}, {}]
+    
+    # Linodes no account owns get the API's own error.
+    success, errors = sharded.delete_node_ids([123])[123]
+    assert not success and errors[0]['ERRORCODE'] == 5
+    
+    
+def test_bulk_delete():
+    sim = Simulator(time_scale = 0)
+    client = lin.LinodeClient('key', 'http://localhost:5000/', transport = SimulatorTransport(sim))
+    client.rate_limiter = None
+    
+    linode_ids = [client.create_node(1, 9, do_validations = False)[1] for i in range(60)]
+    for i, linode_id in enumerate(linode_ids):
+        client.update_node(linode_id, 'test-%d' % (i) if i % 2 else 'keep-%d' % (i), 'temporary')
+    client.update_node(linode_ids[1], 'test-1', 'production')
+    sim.linodes[linode_ids[3]]['CREATE_DT'] = '2000-01-01 00:00:00.0'
+    
+    assert client.delete_nodes(label = 'test-*', older_than = 3600, dry_run = True).keys() == [linode_ids[3]]
+    
+    progress = []
+    results = client.delete_nodes(group = 'temporary', label = 'test-*', parallel = 3, batch_size = 4,
+        progress = lambda *args: progress.append(args))
+    expected = linode_ids[3::2]
+    assert results.keys() == expected
+    assert all([success for success, errors in results.values()])
+    assert sorted([p[0] for p in progress]) == range(1, len(expected) + 1)
+    assert sorted(sim.linodes.keys()) == sorted(set(linode_ids) - set(expected))
+    
+    try:
+        client.delete_node_ids(linode_ids, parallel = 0)
+        assert False
+    except ValueError:
+        pass
+    
+    deleted, errors = client.delete_all_nodes(1)
+    assert len(deleted) == 60 - len(expected) and not errors
+    
+    assert lin.parse_duration('2h') == 7200 and lin.parse_duration('90') == 90
+
+
+def test_api_time_is_us_eastern():
+    utc = lambda *t: calendar.timegm(t)
+    # EDT in summer, EST in winter.
+    assert lin.parse_api_time('2015-08-13 17:39:55.0') == utc(2015, 8, 13, 21, 39, 55)
+    assert lin.parse_api_time('2015-01-13 17:39:55.0') == utc(2015, 1, 13, 22, 39, 55)
+    # Around the switches of 2015, and before the 2007 rules.
+    assert lin.parse_api_time('2015-03-08 01:59:59.0') == utc(2015, 3, 8, 6, 59, 59)
+    assert lin.parse_api_time('2015-03-08 03:00:00.0') == utc(2015, 3, 8, 7, 0, 0)
+    assert lin.parse_api_time('2015-11-01 00:59:59.0') == utc(2015, 11, 1, 4, 59, 59)
+    assert lin.parse_api_time('2015-11-01 01:30:00.0') == utc(2015, 11, 1, 6, 30, 0)
+    assert lin.parse_api_time('2006-03-20 12:00:00.0') == utc(2006, 3, 20, 17, 0, 0)
+    assert lin.parse_api_time('2006-04-10 12:00:00.0') == utc(2006, 4, 10, 16, 0, 0)
+    
+    for t in [utc(2015, 8, 13, 21, 39, 55), utc(2015, 1, 13, 22, 39, 55), utc(2015, 3, 8, 7, 0, 0)]:
+        assert lin.parse_api_time(format_api_time(t)) == t
+    
+    # A linode created an hour ago isn't older than 2 hours, which it would be if read as UTC.
+    record = {'CREATE_DT' : '2015-08-13 17:39:55.0'}
+    now = utc(2015, 8, 13, 22, 39, 55)
+    assert not lin.match_record(record, 'LABEL', older_than = 7200, now = now)
+    assert lin.match_record(record, 'LABEL', older_than = 3000, now = now)
+    
+    
+def test_single_flight():
+    release = threading.Event()
+    def handler(action, params):
+        release.wait()
+        return {'ACTION' : action, 'ERRORARRAY' : [], 'DATA' : [{'KERNELID' : 138}]}
+    
+    fake = FakeTransport(handler)
+    client = lin.LinodeClient('key', 'http://localhost:5000/', transport = fake)
+    client.rate_limiter = None
+    
+    results = []
+    threads = [threading.Thread(target = lambda: results.append(client.request('avail.kernels', None)))
+        for i in range(10)]
+    for t in threads:
+        t.start()
+    while client.single_flight.stats()['requests'] < 10:
+        time.sleep(0.001)
+    release.set()
+    for t in threads:
+        t.join()
+    
+    assert len(fake.posts) == 1
+    assert client.single_flight.stats() == {'requests' : 10, 'saved' : 9, 'in_flight' : 0}
+    assert len(results) == 10 and all([r['DATA'][0]['KERNELID'] == 138 for r in results])
+    
+    # Requests after the leader finished, and writes, are sent again.
+    client.request('avail.kernels', None)
+    client.request('linode.boot', {'LinodeID' : 1})
+    assert len(fake.posts) == 3
+
+
+if __name__ == '__main__':
+    test_batch_demultiplexes_results()
+    test_batch_is_chunked()
+    test_coalescing()
+    test_coalesced_calls_retry_when_throttled()
+    test_catalog_cache()
+    test_streamed_list()
+    test_sharded_client()
+    test_coalesced_mutations()
+    test_sharded_client_spans_accounts()
+    test_bulk_delete()
+    test_api_time_is_us_eastern()
+    test_single_flight()
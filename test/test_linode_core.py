@@ -1,5 +1,12 @@
+import os
+import tempfile
+import threading
+
 import linode_core
+import linode_api as lin
 import simplejson as json
+from simulator import Simulator, SimulatorTransport
+from exc import PlanError
 
 def test_create_linode_from_image():
     core = linode_core.Core({'conf-dir' : '../../test'})
@@ -39,8 +46,124 @@ def test_linode_to_json():
         
         nodes.append(l)
     
-    print(json.dumps(nodes, default=lambda o:o.__dict__))
+    print(json.dumps(nodes, default=lambda o:o.to_dict()))
+    
+
+def test_plan_linode():
+    sim = Simulator(time_scale = 0)
+    client = lin.LinodeClient('key', lin.API_SIMULATOR_URL, transport = SimulatorTransport(sim))
+    client.rate_limiter = None
+    client.retry_policy = None
+    
+    key_file = os.path.join(tempfile.mkdtemp(), 'id_rsa.pub')
+    with open(key_file, 'w') as f:
+        f.write('ssh-rsa AAAA test@localhost\n')
+    core = linode_core.Core({'root-ssh-key-file' : key_file, 'job-poll-interval' : 0.001}, client)
+    
+    spec = {
+        'plan_id' : 1,
+        'datacenter' : 'singapore',
+        'distribution' : 'Ubuntu 14.04 LTS',
+        'kernel' : 'Latest 64 bit',
+        'label' : 'planned-{linode_id}',
+        'group' : 'temporary',
+        'disks' : {
+            'boot' : {'disk_size' : 5000},
+            'swap' : {'disk_size' : 'auto'},
+            'others' : [{'label' : 'data', 'disk_size' : 1000, 'type' : 'xfs'}]
+        }
+    }
+    plan = core.plan_linode(spec)
+    assert plan.datacenter_id == 9 and plan.distribution_id == 124 and plan.kernel_id == 138
+    assert plan.swap_disk_size == lin.calc_swap_disk_size(2048)
+    assert plan.other_disks[0]['type'] == 'raw'
+    assert plan.call_count() == 9 and plan.job_count() == 4
+    
+    # Creating a linode sends only the planned calls, plus job polls.
+    before = sim.stats()['calls']
+    linode = core.create_linode(spec)
+    assert linode is not None and linode.inited
+    steps = [step for step, seconds in linode.critical_path]
+    assert steps[0] == 'create_node' and steps[-1] == 'boot'
+    after = sim.stats()['calls']
+    calls = dict([(a, n - before.get(a, 0)) for a, n in after.items() if n != before.get(a, 0)])
+    calls.pop('linode.job.list', None)
+    assert sum(calls.values()) == plan.call_count(), calls
+    assert 'linode.list' not in calls
+    
+    # An invalid spec fails before anything is created.
+    spec['kernel'] = 'No such kernel'
+    spec['plan_id'] = 3
+    try:
+        core.plan_linode(spec)
+        assert False
+    except PlanError as e:
+        assert len(e.errors) == 2
+    assert core.create_linode(spec) is None
+    assert sim.stats()['linodes'] == 1
+
+
+def test_create_linodes():
+    sim = Simulator(time_scale = 0.001)
+    client = lin.LinodeClient('key', lin.API_SIMULATOR_URL, transport = SimulatorTransport(sim))
+    client.rate_limiter = None
+    client.retry_policy = None
+    
+    key_file = os.path.join(tempfile.mkdtemp(), 'id_rsa.pub')
+    with open(key_file, 'w') as f:
+        f.write('ssh-rsa AAAA test@localhost\n')
+    core = linode_core.Core({'root-ssh-key-file' : key_file, 'job-poll-interval' : 0.005}, client)
+    
+    def spec(datacenter, boot_disk_size = 5000):
+        return {
+            'plan_id' : 1,
+            'datacenter' : datacenter,
+            'distribution' : 'Ubuntu 14.04 LTS',
+            'kernel' : 'Latest 64 bit',
+            'label' : 'fleet-{linode_id}',
+            'group' : 'fleet',
+            'disks' : {'boot' : {'disk_size' : boot_disk_size}, 'swap' : {'disk_size' : 'auto'}}
+        }
+    
+    # Count creations in progress per datacenter.
+    lock = threading.Lock()
+    running = {}
+    peaks = {}
+    create_linode = core.create_linode
+    def counting_create_linode(linode_spec, boot, delete_on_error):
+        dc = linode_spec['datacenter']
+        with lock:
+            running[dc] = running.get(dc, 0) + 1
+            peaks[dc] = max(peaks.get(dc, 0), running[dc])
+        try:
+            return create_linode(linode_spec, boot, delete_on_error)
+        finally:
+            with lock:
+                running[dc] -= 1
+    core.create_linode = counting_create_linode
+    
+    # The third boot disk is too large for the plan, so that member fails and is deleted.
+    specs = [spec(9), spec(9), spec(9, 100000), spec(9), spec('newark'), spec('newark'), spec('newark')]
+    results = list(core.create_linodes(specs, max_parallel = 4, datacenter_limits = {'singapore' : 2}))
+    
+    assert sorted([i for i, linode in results]) == range(len(specs))
+    failed = [i for i, linode in results if linode is None]
+    assert failed == [2]
+    assert all([linode.inited for i, linode in results if linode is not None])
+    assert sim.stats()['linodes'] == len(specs) - 1
+    assert peaks[9] <= 2 and peaks['newark'] <= 3
     
+    # A limit of 0 would leave its specs waiting forever.
+    for kwargs in [{'datacenter_limits' : {'singapore' : 0}}, {'max_parallel' : 0}]:
+        try:
+            core.create_linodes(specs, **kwargs)
+            assert False, kwargs
+        except ValueError:
+            pass
+
+
 if __name__ == '__main__':
     #test_create_linode_from_image()
     test_linode_to_json()
+    test_plan_linode()
+    test_create_linodes()
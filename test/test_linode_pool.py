@@ -0,0 +1,137 @@
+import os
+import time
+import tempfile
+
+import linode_api as lin
+import linode_core
+from linode_pool import LinodePool, POOL_GROUP
+from simulator import Simulator, SimulatorTransport
+from reaper import Reaper
+
+
+SPEC = {
+    'plan_id' : 1,
+    'datacenter' : 9,
+    'distribution' : 'Ubuntu 14.04 LTS',
+    'kernel' : 'Latest 64 bit',
+    'label' : 'web-{linode_id}',
+    'group' : 'web',
+    'disks' : {'boot' : {'disk_size' : 5000}, 'swap' : {'disk_size' : 'auto'}}
+}
+
+
+def make_core(sim):
+    client = lin.LinodeClient('key', lin.API_SIMULATOR_URL, transport = SimulatorTransport(sim))
+    client.rate_limiter = None
+    client.retry_policy = None
+    
+    key_file = os.path.join(tempfile.mkdtemp(), 'id_rsa.pub')
+    with open(key_file, 'w') as f:
+        f.write('ssh-rsa AAAA test@localhost\n')
+    return linode_core.Core({'root-ssh-key-file' : key_file, 'job-poll-interval' : 0.005}, client)
+
+
+def test_acquire_from_pool():
+    sim = Simulator(time_scale = 0.001)
+    pool = LinodePool(make_core(sim))
+    pool.reserve(SPEC, 2)
+    pool.replenish()
+    
+    assert pool.stats()['warm'] == 2
+    assert set([n['LPM_DISPLAYGROUP'] for n in sim.linodes.values()]) == set([POOL_GROUP])
+    
+    # Hits take one linode.update. A spec that resolves the same is served from the pool too.
+    updates = sim.stats()['calls']['linode.update']
+    linode = pool.acquire(dict(SPEC, datacenter = 'singapore'), 'web-1')
+    assert linode.inited
+    assert (linode.label, linode.group) == ('web-1', 'web')
+    assert sim.linodes[linode.id]['LABEL'] == 'web-1' and sim.linodes[linode.id]['LPM_DISPLAYGROUP'] == 'web'
+    assert sim.stats()['calls']['linode.update'] == updates + 1
+    
+    pool.acquire(SPEC)
+    # The pool is empty, so this one is created.
+    linode = pool.acquire(SPEC)
+    assert sim.linodes[linode.id]['LABEL'] == 'web-%d' % (linode.id)
+    
+    stats = pool.stats()
+    assert (stats['hits'], stats['misses'], stats['warm']) == (2, 1, 0)
+    assert stats['acquire_latency']['count'] == 3
+    
+    # Refill, then shrink.
+    pool.replenish()
+    assert pool.stats()['warm'] == 2 and pool.stats()['created'] == 4
+    pool.reserve(SPEC, 1)
+    pool.replenish()
+    assert pool.stats()['warm'] == 1 and pool.stats()['reaped'] == 1
+    pool.drain()
+    assert pool.stats()['warm'] == 0
+    assert len(sim.linodes) == 3
+
+
+def test_background_replenish():
+    sim = Simulator(time_scale = 0.001)
+    pool = LinodePool(make_core(sim), boot = False)
+    pool.reserve(SPEC, 1)
+    pool.start(interval = 60)
+    
+    def wait_for_warm(count):
+        for i in range(500):
+            if pool.stats()['warm'] == count:
+                return True
+            time.sleep(0.01)
+        return False
+    
+    assert wait_for_warm(1)
+    pool.acquire(SPEC)
+    # Acquisitions wake the replenisher up.
+    assert wait_for_warm(1)
+    pool.stop()
+    assert pool.stats()['hits'] == 1 and pool.stats()['created'] == 2
+
+
+def test_failed_relabel_and_delete():
+    sim = Simulator(time_scale = 0.001)
+    core = make_core(sim)
+    core.reaper = Reaper(core.client)
+    pool = LinodePool(core, boot = False)
+    pool.reserve(SPEC, 2)
+    pool.replenish()
+    
+    # The linode is handed out with its pool label rather than lost.
+    sim.failures = {'linode.update' : 1.0}
+    linode = pool.acquire(SPEC, 'web-1')
+    assert linode is not None and linode.group == POOL_GROUP
+    
+    # Surplus linodes that can't be deleted are left to the reaper.
+    sim.failures = {'linode.delete' : 1.0}
+    pool.drain()
+    assert len(core.reaper.tracked()['linode']) == 1
+    
+    
+def test_failed_replenish_releases_counts():
+    sim = Simulator(time_scale = 0.001)
+    core = make_core(sim)
+    pool = LinodePool(core, boot = False)
+    pool.reserve(SPEC, 2)
+    
+    create_linodes = core.create_linodes
+    def broken_create_linodes(*args, **kwargs):
+        raise RuntimeError('create_linodes')
+    core.create_linodes = broken_create_linodes
+    try:
+        pool.replenish()
+        assert False
+    except RuntimeError:
+        pass
+    
+    # The spec is topped up by the next replenish.
+    core.create_linodes = create_linodes
+    pool.replenish()
+    assert pool.stats()['warm'] == 2
+    
+    
+if __name__ == '__main__':
+    test_acquire_from_pool()
+    test_background_replenish()
+    test_failed_relabel_and_delete()
+    test_failed_replenish_releases_counts()
@@ -0,0 +1,64 @@
+import os
+
+os.environ.setdefault('LINODE_API_KEY', 'test-key')
+os.environ.setdefault('LINODE_API_URL', 'http://localhost:5000/')
+
+import linode_api as lin
+from metrics import ApiMetrics, Histogram
+
+from test_linode_api import FakeTransport, job_handler
+
+
+def test_histogram_is_cumulative():
+    h = Histogram([1, 5])
+    for value in [0.5, 1, 3, 10]:
+        h.observe(value)
+    
+    d = h.to_dict()
+    assert d['buckets'] == [(1, 2), (5, 3), ('+Inf', 4)]
+    assert d['count'] == 4 and d['sum'] == 14.5
+
+
+def test_prometheus_format():
+    m = ApiMetrics()
+    m.record_call('linode.create', 0.2, 10, 20, [8])
+    m.record_job('linode.boot', 30, True)
+    
+    text = m.to_prometheus()
+    assert 'linode_api_calls_total{action="linode.create"} 1' in text
+    assert 'linode_api_errors_total{action="linode.create",code="8"} 1' in text
+    assert 'linode_api_request_duration_seconds_bucket{action="linode.create",le="0.25"} 1' in text
+    assert 'linode_api_job_duration_seconds_count{job="linode.boot",outcome="success"} 1' in text
+
+
+def test_client_records_when_enabled():
+    def handler(action, params):
+        if action == 'linode.list':
+            return {'ACTION' : action, 'ERRORARRAY' : [], 'DATA' : [{'LINODEID' : 1}, {'LINODEID' : 2}]}
+        return job_handler(action, params)
+    
+    client = lin.LinodeClient('key', 'http://localhost:5000/', transport = FakeTransport(handler))
+    client.rate_limiter = None
+    
+    client.is_job_finished(1, 1)
+    assert lin.api_metrics.to_dict()['calls'] == {}
+    
+    lin.enable_metrics(reset = True)
+    try:
+        client.is_job_finished(1, 1)
+        client.is_job_finished(1, 2)
+        assert len(list(client.stream_request('linode.list', None))) == 2
+    finally:
+        lin.disable_metrics()
+    
+    d = lin.metrics_snapshot()
+    assert d['calls'] == {'linode.job.list' : 2, 'linode.list' : 1}
+    assert d['latency']['linode.job.list']['count'] == 2
+    assert d['bytes_sent']['linode.job.list'] > 0
+    assert d['bytes_received']['linode.list'] > 0
+
+
+if __name__ == '__main__':
+    test_histogram_is_cumulative()
+    test_prometheus_format()
+    test_client_records_when_enabled()
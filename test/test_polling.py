@@ -0,0 +1,60 @@
+import itertools
+
+import linode_api as lin
+import linode_core
+from polling import PollPolicy, JobHistory
+from simulator import Simulator, SimulatorTransport
+
+
+def test_delays():
+    history = JobHistory()
+    policy = PollPolicy(min_interval = 1, max_interval = 10, backoff = 2, timeout = 240,
+        timeouts = {'linode.boot' : 60}, history = history)
+    
+    # Immediate check, then exponential backoff up to the cap.
+    assert list(itertools.islice(policy.delays('linode.boot'), 7)) == [0, 1, 2, 4, 8, 10, 10]
+    
+    # With history, the second check is shortly before jobs of that kind usually finish.
+    for duration in [30, 50, 40]:
+        policy.record('linode.disk.create', duration)
+    assert history.estimate('linode.disk.create') == 40
+    assert list(itertools.islice(policy.delays('linode.disk.create'), 4)) == [0, 32, 1, 2]
+    
+    # Jobs that are usually done at once don't get an extra check.
+    policy.record('linode.config.create', 0.01)
+    assert list(itertools.islice(policy.delays('linode.config.create'), 2)) == [0, 1]
+    
+    assert policy.timeout_for('linode.boot') == 60 and policy.timeout_for('linode.disk.create') == 240
+
+
+def test_wait_for_job():
+    sim = Simulator(time_scale = 0.001)
+    client = lin.LinodeClient('key', lin.API_SIMULATOR_URL, transport = SimulatorTransport(sim))
+    client.rate_limiter = None
+    client.retry_policy = None
+    
+    history = JobHistory()
+    policy = PollPolicy(min_interval = 0.01, max_interval = 0.05, timeout = 5, history = history)
+    core = linode_core.Core({'job-poll-policy' : policy}, client)
+    
+    linode_id = client.create_node(1, 9, do_validations = False)[1]
+    disk_id, job_id = client.create_disk_from_distribution(linode_id, 124, 2000, 'Secret-pass1', None)[1:3]
+    client.create_config(linode_id, 138, [disk_id], 'config')
+    assert core.wait_for_job(linode_id, job_id, 'linode.disk.createfromdistribution') == (True, True)
+    assert history.estimate('linode.disk.createfromdistribution') > 0
+    
+    # A finished job is seen on the first, immediate check.
+    polls = sim.stats()['calls']['linode.job.list']
+    assert core.wait_for_job(linode_id, job_id) == (True, True)
+    assert sim.stats()['calls']['linode.job.list'] == polls + 1
+    
+    # Waits give up at the deadline.
+    policy.timeouts['linode.boot'] = 0.05
+    sim.job_durations['linode.boot'] = 3600
+    job_id = client.boot_node(linode_id)[1]
+    assert core.wait_for_job(linode_id, job_id, 'linode.boot') == (False, None)
+
+
+if __name__ == '__main__':
+    test_delays()
+    test_wait_for_job()
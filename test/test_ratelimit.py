@@ -0,0 +1,93 @@
+import time
+
+from test_linode_api import with_transport, restore_transport
+
+import linode_api as lin
+import ratelimit
+
+
+RATE_LIMITED = {'ERRORCODE' : 14, 'ERRORMESSAGE' : 'Rate limit exceeded'}
+VALIDATION_FAILED = {'ERRORCODE' : 8, 'ERRORMESSAGE' : 'Validation failed'}
+
+
+def make_handler(failures, error):
+    calls = []
+    def handler(action, params):
+        calls.append(action)
+        if len(calls) <= failures:
+            return {'ACTION' : action, 'ERRORARRAY' : [error], 'DATA' : {}}
+        return {'ACTION' : action, 'ERRORARRAY' : [], 'DATA' : {'LinodeID' : 1}}
+    return handler, calls
+    
+    
+def with_policy():
+    client = lin.default_client()
+    saved = (client.rate_limiter, client.retry_policy)
+    client.rate_limiter = ratelimit.AdaptiveRateLimiter(rate = 50)
+    client.retry_policy = ratelimit.RetryPolicy(max_retries = 3, base_delay = 0.01)
+    return saved
+    
+    
+def restore_policy(saved):
+    client = lin.default_client()
+    client.rate_limiter, client.retry_policy = saved
+    
+    
+def test_rate_limited_create_is_retried():
+    handler, calls = make_handler(2, RATE_LIMITED)
+    fake, saved = with_transport(handler)
+    saved_policy = with_policy()
+    try:
+        assert lin.create_node(1, 9, do_validations = False) == (True, 1, None)
+        assert len(calls) == 3
+        assert lin.default_client().rate_limiter.stats()['throttled'] == 2
+        assert lin.default_client().rate_limiter.rate < 50
+    finally:
+        restore_transport(saved)
+        restore_policy(saved_policy)
+        
+        
+def test_other_errors_are_not_retried():
+    handler, calls = make_handler(2, VALIDATION_FAILED)
+    fake, saved = with_transport(handler)
+    saved_policy = with_policy()
+    try:
+        success, linode_id, errors = lin.create_node(1, 9, do_validations = False)
+        assert not success
+        assert len(calls) == 1
+    finally:
+        restore_transport(saved)
+        restore_policy(saved_policy)
+        
+        
+def test_partially_throttled_batch_is_not_retried():
+    policy = ratelimit.RetryPolicy()
+    ok = {'ERRORARRAY' : []}
+    throttled = {'ERRORARRAY' : [RATE_LIMITED]}
+    assert policy.should_retry_response('batch', [throttled, throttled], 0)
+    assert not policy.should_retry_response('batch', [ok, throttled], 0)
+    
+    
+def test_token_bucket_limits_rate():
+    limiter = ratelimit.AdaptiveRateLimiter(rate = 100, burst = 1, increase = 0)
+    start = time.time()
+    for i in range(21):
+        limiter.acquire()
+    assert time.time() - start >= 0.18
+    
+    
+def test_aimd():
+    limiter = ratelimit.AdaptiveRateLimiter(rate = 10, max_rate = 20)
+    limiter.on_throttled()
+    assert limiter.rate == 5
+    for i in range(1000):
+        limiter.on_success()
+    assert limiter.rate == 20
+    
+    
+if __name__ == '__main__':
+    test_rate_limited_create_is_retried()
+    test_other_errors_are_not_retried()
+    test_partially_throttled_batch_is_not_retried()
+    test_token_bucket_limits_rate()
+    test_aimd()
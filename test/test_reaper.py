@@ -0,0 +1,139 @@
+import os
+import time
+import calendar
+import tempfile
+
+import linode_api as lin
+import linode_core
+from reaper import Reaper, ReapRule, default_rules
+from simulator import Simulator, SimulatorTransport
+from api_time import format_api_time
+
+
+SPEC = {
+    'plan_id' : 1,
+    'datacenter' : 9,
+    'distribution' : 'Ubuntu 14.04 LTS',
+    'kernel' : 'Latest 64 bit',
+    'label' : 'web-{linode_id}',
+    'group' : 'web',
+    'disks' : {'boot' : {'disk_size' : 5000}, 'swap' : {'disk_size' : 'auto'}}
+}
+
+
+def make_client(sim):
+    client = lin.LinodeClient('key', lin.API_SIMULATOR_URL, transport = SimulatorTransport(sim))
+    client.rate_limiter = None
+    client.retry_policy = None
+    return client
+
+
+def make_core(client, app_ctx):
+    key_file = os.path.join(tempfile.mkdtemp(), 'id_rsa.pub')
+    with open(key_file, 'w') as f:
+        f.write('ssh-rsa AAAA test@localhost\n')
+    return linode_core.Core(dict(app_ctx, **{'root-ssh-key-file' : key_file, 'job-poll-interval' : 0.005}), client)
+
+
+def create_node(client, label, group):
+    success, linode_id, errors = client.create_node(1, 9)
+    client.update_node(linode_id, label, group)
+    return linode_id
+
+
+def test_reap_failed_cleanup():
+    sim = Simulator(time_scale = 0.001, failures = {'linode.config.create' : 1.0, 'linode.delete' : 1.0})
+    client = make_client(sim)
+    reaper = Reaper(client, rules = [])
+    core = make_core(client, {'reaper' : reaper})
+    
+    assert core.create_linode(SPEC) is None
+    linode_id = sim.linodes.keys()[0]
+    assert reaper.tracked()['linode'].keys() == [linode_id]
+    
+    # Deleting still fails, so it stays tracked.
+    report = reaper.sweep()
+    assert (report['deleted'], report['failed']) == (0, 1)
+    assert linode_id in reaper.tracked()['linode']
+    
+    sim.failures = {}
+    # Resources that are already gone count as deleted.
+    reaper.track_image(424242)
+    report = reaper.sweep()
+    assert (report['deleted'], report['failed']) == (2, 0)
+    assert report['linodes'].keys() == [linode_id]
+    assert sim.linodes == {}
+    assert reaper.tracked() == {'linode' : {}, 'image' : {}}
+    assert reaper.stats()['deleted_linodes'] == 1 and reaper.stats()['sweeps'] == 2
+    
+    
+def test_reap_orphans():
+    sim = Simulator(time_scale = 0.001, job_durations = {'linode.disk.imagize' : 3600})
+    client = make_client(sim)
+    temporary = [create_node(client, 'img-%d' % (i), 'temporary') for i in range(3)]
+    web = create_node(client, 'web-1', 'web')
+    
+    success, disk_id, job_id, errors = client.create_disk(web, 'ext4', 1000, 'boot')
+    success, image_id, job_id, errors = client.create_diskimage(web, disk_id, 'half-made')
+    assert sim.images[image_id]['STATUS'] == 'pending_upload'
+    
+    # Nothing is old enough for the default rules, and there are no rules by default.
+    assert Reaper(client, default_rules()).sweep()['deleted'] == 0
+    assert Reaper(client).find() == {'linode' : [], 'image' : []}
+    
+    reaper = Reaper(client, rules = default_rules(grace = None), parallel = 2, batch_size = 2, max_deletes = 3)
+    report = reaper.sweep(dry_run = True)
+    assert report['linodes'].keys() == temporary and report['images'].keys() == []
+    assert report['skipped'] == 1 and len(sim.linodes) == 4
+    
+    reaper.sweep()
+    assert sim.linodes.keys() == [web] and image_id in sim.images
+    reaper.sweep()
+    assert image_id not in sim.images
+    assert reaper.sweep()['deleted'] == 0
+    
+    
+def test_grace():
+    sim = Simulator(time_scale = 0.001)
+    client = make_client(sim)
+    recent, old = [create_node(client, 'img', 'temporary') for i in range(2)]
+    # The simulator reports CREATE_DT in US Eastern time, like production.
+    sim.linodes[recent]['CREATE_DT'] = format_api_time(time.time() - 2 * 3600)
+    sim.linodes[old]['CREATE_DT'] = format_api_time(time.time() - 4 * 3600)
+    
+    reaper = Reaper(client, default_rules(grace = 3 * 3600))
+    assert reaper.find()['linode'] == [old]
+    
+    rule = default_rules()[0]
+    record = {'LPM_DISPLAYGROUP' : 'temporary', 'CREATE_DT' : '2015-08-13 17:39:55.0'}
+    assert not rule.matches(record, now = calendar.timegm((2015, 8, 13, 23, 39, 0)))
+    assert rule.matches(record, now = calendar.timegm((2015, 8, 14, 0, 40, 0)))
+    
+    
+def test_journaled_linodes_are_kept():
+    journal_dir = tempfile.mkdtemp()
+    sim = Simulator(time_scale = 0.001, failures = {'linode.config.create' : 1.0})
+    client = make_client(sim)
+    core = make_core(client, {'journal-dir' : journal_dir})
+    spec = dict(SPEC, group = 'temporary')
+    
+    assert core.create_linode(spec, delete_on_error = False) is None
+    orphan = create_node(client, 'orphan', 'temporary')
+    
+    rules = [ReapRule('linode', group = 'temporary', older_than = None)]
+    reaper = Reaper(client, rules, journal_dir = journal_dir)
+    assert reaper.sweep()['linodes'].keys() == [orphan]
+    assert len(sim.linodes) == 1
+    
+    # Journals nobody resumed expire.
+    reaper = Reaper(client, rules, journal_dir = journal_dir, journal_expiry = 0)
+    assert reaper.sweep()['deleted'] == 1
+    assert sim.linodes == {}
+    
+    
+    
+if __name__ == '__main__':
+    test_reap_failed_cleanup()
+    test_reap_orphans()
+    test_grace()
+    test_journaled_linodes_are_kept()
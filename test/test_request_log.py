@@ -0,0 +1,92 @@
+import os
+import gzip
+import json
+import shutil
+import urllib
+import tempfile
+
+from request_log import RequestLog
+
+
+RESPONSE = {'ACTION' : 'linode.list', 'ERRORARRAY' : [], 'DATA' : [{'LINODEID' : i} for i in range(100)]}
+
+
+def test_records_are_ndjson_without_api_key():
+    log_dir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(log_dir, 'api.log')
+        log = RequestLog(path, max_body_bytes = 50)
+        log.log('http://localhost:5000/', 'api_key=secret&api_action=linode.list&LinodeID=5', RESPONSE, 0.25)
+        log.close()
+        
+        with open(path) as f:
+            lines = f.readlines()
+        assert len(lines) == 1
+        assert 'secret' not in lines[0]
+        
+        record = json.loads(lines[0])
+        assert record['action'] == 'linode.list'
+        assert record['params'] == {'LinodeID' : '5'}
+        assert record['duration'] == 0.25
+        assert len(record['response']) == 50
+        assert record['response_truncated'] > 50
+    finally:
+        shutil.rmtree(log_dir)
+        
+        
+def test_credentials_are_scrubbed():
+    log_dir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(log_dir, 'api.log')
+        log = RequestLog(path)
+        disk = {'api_action' : 'linode.disk.createfromdistribution', 'LinodeID' : 5, 'DistributionID' : 124,
+            'Size' : 5000, 'rootPass' : 'hunter2-single', 'rootSSHKey' : 'ssh-rsa AAAA-single'}
+        log.log('http://localhost:5000/', urllib.urlencode(dict(disk, api_key = 'secret')),
+            {'ERRORARRAY' : [], 'DATA' : {'DiskID' : 1, 'JobID' : 2}})
+        batch = [dict(disk, rootPass = 'hunter2-batch', rootSSHKey = 'ssh-rsa AAAA-batch'),
+            {'api_action' : 'linode.list', 'LinodeID' : 5}]
+        log.log('http://localhost:5000/', urllib.urlencode({'api_key' : 'secret', 'api_action' : 'batch',
+            'api_requestArray' : json.dumps(batch)}), [])
+        log.close()
+        
+        with open(path) as f:
+            text = f.read()
+        for secret in ['secret', 'hunter2-single', 'hunter2-batch', 'AAAA-single', 'AAAA-batch']:
+            assert secret not in text, secret
+        
+        records = [json.loads(line) for line in text.splitlines()]
+        assert records[0]['params']['LinodeID'] == '5'
+        assert records[1]['action'] == 'batch'
+        assert [r['api_action'] for r in records[1]['params']['api_requestArray']] == [
+            'linode.disk.createfromdistribution', 'linode.list']
+    finally:
+        shutil.rmtree(log_dir)
+        
+        
+def test_rotation_and_sampling():
+    log_dir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(log_dir, 'api.log')
+        log = RequestLog(path, max_bytes = 1000, backup_count = 2, compress = True, sample_rate = 0.0)
+        for i in range(50):
+            log.log('http://localhost:5000/', 'api_action=linode.list', RESPONSE)
+            log.log('http://localhost:5000/', 'api_action=linode.create', 
+                {'ERRORARRAY' : [{'ERRORCODE' : 8}], 'DATA' : {}})
+        log.close()
+        
+        # Only the errors are logged
+        assert log.sampled_out == 50
+        assert log.written == 50
+        
+        assert sorted(os.listdir(log_dir)) == ['api.log', 'api.log.1.gz', 'api.log.2.gz']
+        assert os.path.getsize(path) <= 1000
+        with gzip.open(path + '.1.gz') as f:
+            assert json.loads(f.readline())['action'] == 'linode.create'
+    finally:
+        shutil.rmtree(log_dir)
+        
+        
+if __name__ == '__main__':
+    test_records_are_ndjson_without_api_key()
+    test_credentials_are_scrubbed()
+    test_rotation_and_sampling()
@@ -0,0 +1,98 @@
+import time
+
+import linode_api as lin
+from simulator import Simulator, SimulatorTransport, SimulatorServer
+import ratelimit
+
+
+def make_client(sim, url = lin.API_SIMULATOR_URL):
+    client = lin.LinodeClient('key', url, transport = SimulatorTransport(sim))
+    client.rate_limiter = None
+    client.retry_policy = None
+    return client
+
+
+def test_create_boot_and_imagize():
+    sim = Simulator(time_scale = 0)
+    client = make_client(sim)
+    
+    success, linode_id, errors = client.create_node(1, 'singapore')
+    assert success, errors
+    success, disk_id, job_id, errors = client.create_disk_from_distribution(linode_id, 
+        'Ubuntu 14.04 LTS', 5000, 'secret', None)
+    assert success, errors
+    assert client.is_job_finished(linode_id, job_id) == (True, True)
+    
+    success, config_id, errors = client.create_config(linode_id, 'Latest 64 bit', [disk_id], 'config')
+    assert success, errors
+    success, job_id, errors = client.boot_node(linode_id, config_id)
+    assert success, errors
+    assert client.is_job_finished(linode_id, job_id) == (True, True)
+    assert sim.linodes[linode_id]['STATUS'] == 1
+    assert client.get_public_ip_address(linode_id)
+    assert client.add_private_ip(linode_id)[1].startswith('192.168.')
+    
+    success, image_id, job_id, errors = client.create_diskimage(linode_id, disk_id, 'golden')
+    assert success, errors
+    assert client.find_image('golden')[0] == image_id
+    
+    success, new_linode_id, errors = client.create_node(1, 9, do_validations = False)
+    success, disk_id, job_id, errors = client.create_disk_from_image(new_linode_id, image_id, 
+        'from-image', 6000, 'secret', None)
+    assert success, errors
+    
+    deleted, errors = client.delete_all_nodes(1)
+    assert sorted(deleted) == sorted([linode_id, new_linode_id]) and not errors
+
+
+def test_job_duration_and_failures():
+    sim = Simulator(job_durations = {'linode.boot' : 0.2, 'linode.shutdown' : 0}, job_failures = {'linode.shutdown' : 1}, 
+        failures = {'linode.update' : 1})
+    client = make_client(sim)
+    
+    linode_id = client.create_node(1, 9, do_validations = False)[1]
+    disk_id = client.create_disk(linode_id, 'ext4', 1000, 'disk')[1]
+    config_id = client.create_config(linode_id, 138, [disk_id], 'config', do_validations = False)[1]
+    job_id = client.boot_node(linode_id, config_id)[1]
+    assert client.is_job_finished(linode_id, job_id) == (False, None)
+    time.sleep(0.25)
+    assert client.is_job_finished(linode_id, job_id) == (True, True)
+    
+    job_id = client.shutdown_node(linode_id)[1]
+    time.sleep(0.05)
+    assert client.are_jobs_finished([(linode_id, job_id), (linode_id, 1)]) == [(True, False), (None, None)]
+    assert client.update_node(linode_id, 'label', 'group')[2][0]['ERRORCODE'] == 8
+    
+    # Linodes with disks need skipChecks to be deleted.
+    assert client.delete_node(linode_id, 0)[0] is False
+
+
+def test_rate_limit():
+    sim = Simulator(rate_limit = (1, 3))
+    client = make_client(sim)
+    codes = [ratelimit.error_codes(client.request('test.echo', {'n' : i})) for i in range(5)]
+    assert codes[:3] == [set(), set(), set()]
+    assert codes[3:] == [set([ratelimit.ERROR_RATE_LIMITED])] * 2
+
+
+def test_http_server():
+    sim = Simulator(time_scale = 0)
+    server = SimulatorServer(sim, port = 0)
+    url = server.start()
+    transport = lin.PooledTransport()
+    try:
+        client = lin.LinodeClient('key', url, transport = transport)
+        assert client.get_datacenter('london') == 7
+        linode_ids = [client.create_node(1, 9, do_validations = False)[1] for i in range(3)]
+        assert sorted([n['LINODEID'] for n in client.iter_nodes(fields = ['LINODEID'])]) == linode_ids
+        assert sim.stats()['calls']['linode.create'] == 3
+    finally:
+        transport.close()
+        server.stop()
+
+
+if __name__ == '__main__':
+    test_create_boot_and_imagize()
+    test_job_duration_and_failures()
+    test_rate_limit()
+    test_http_server()
@@ -0,0 +1,155 @@
+import time
+import httplib
+import threading
+import SocketServer
+import BaseHTTPServer
+
+from transport import PooledTransport
+
+
+class EchoHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        
+    def log_message(self, *args):
+        pass
+
+
+class EchoServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    
+    def handle_error(self, request, client_address):
+        # Clients closing connections midway is expected in these tests.
+        pass
+
+
+def start_server(handler = EchoHandler):
+    server = EchoServer(('127.0.0.1', 0), handler)
+    t = threading.Thread(target = server.serve_forever)
+    t.daemon = True
+    t.start()
+    return server
+
+
+def test_connection_reuse():
+    server = start_server()
+    url = 'http://127.0.0.1:%d/' % (server.server_address[1])
+    
+    transport = PooledTransport(pool_size = 2)
+    for i in range(10):
+        assert transport.post(url, 'req=%d' % (i)) == 'req=%d' % (i)
+    
+    stats = transport.stats()
+    assert stats['requests'] == 10
+    assert stats['connections_created'] == 1
+    assert stats['connections_reused'] == 9
+    
+    transport.close()
+    server.shutdown()
+    
+
+def test_idle_eviction():
+    server = start_server()
+    url = 'http://127.0.0.1:%d/' % (server.server_address[1])
+    
+    transport = PooledTransport(idle_timeout = 60)
+    transport.post(url, 'a=1')
+    assert transport.evict_idle(max_idle = 0) == 1
+    transport.post(url, 'a=2')
+    
+    stats = transport.stats()
+    assert stats['connections_created'] == 2
+    assert stats['connections_reused'] == 0
+    
+    transport.close()
+    server.shutdown()
+
+    
+def test_stream_releases_connection():
+    server = start_server()
+    url = 'http://127.0.0.1:%d/' % (server.server_address[1])
+    
+    transport = PooledTransport()
+    with transport.post_stream(url, 'abcdef') as resp:
+        assert resp.read(3) == 'abc'
+        assert resp.read(10) == 'def'
+        assert resp.read(10) == ''
+        
+    # Closed without reading fully. The connection can't be reused.
+    resp = transport.post_stream(url, 'abcdef')
+    resp.read(3)
+    resp.close()
+    
+    transport.post(url, 'x=1')
+    
+    stats = transport.stats()
+    assert stats['connections_created'] == 2
+    assert stats['connections_reused'] == 1
+    
+    transport.close()
+    server.shutdown()
+    
+    
+def test_sent_requests_are_not_retried():
+    received = []
+    
+    class DroppingHandler(EchoHandler):
+        # Acts on the second request, then closes the connection without responding.
+        def do_POST(self):
+            received.append(self.headers['Content-Length'])
+            if len(received) == 2:
+                self.rfile.read(int(self.headers['Content-Length']))
+                self.close_connection = 1
+                return
+            EchoHandler.do_POST(self)
+            
+    server = start_server(DroppingHandler)
+    url = 'http://127.0.0.1:%d/' % (server.server_address[1])
+    
+    transport = PooledTransport()
+    transport.post(url, 'a=1')
+    try:
+        transport.post(url, 'api_action=linode.create')
+        assert False
+    except httplib.BadStatusLine:
+        pass
+    assert len(received) == 2
+    
+    transport.close()
+    server.shutdown()
+    
+    
+def test_dropped_idle_connections_are_not_reused():
+    class ClosingHandler(EchoHandler):
+        # Responds as keep-alive, then closes the connection anyway.
+        def do_POST(self):
+            EchoHandler.do_POST(self)
+            self.close_connection = 1
+            
+    server = start_server(ClosingHandler)
+    url = 'http://127.0.0.1:%d/' % (server.server_address[1])
+    
+    transport = PooledTransport()
+    assert transport.post(url, 'a=1') == 'a=1'
+    time.sleep(0.1)
+    assert transport.post(url, 'a=2') == 'a=2'
+    
+    stats = transport.stats()
+    assert stats['connections_created'] == 2 and stats['connections_reused'] == 0
+    
+    transport.close()
+    server.shutdown()
+    
+    
+if __name__ == '__main__':
+    test_connection_reuse()
+    test_idle_eviction()
+    test_stream_releases_connection()
+    test_sent_requests_are_not_retried()
+    test_dropped_idle_connections_are_not_reused()
@@ -0,0 +1,388 @@
+import httplib
+import urlparse
+import socket
+import select
+import threading
+import time
+import collections
+
+from exc import TransportError
+
+
+# Errors that indicate a pooled keep-alive connection was closed by the server
+# while it sat idle. A request that fails with one of these on a *reused*
+# connection, while it's being sent, is retried once on a fresh connection.
+# Once it has been sent the server may have acted on it, so it isn't retried,
+# and neither are timeouts.
+STALE_CONNECTION_ERRORS = (httplib.BadStatusLine, httplib.CannotSendRequest,
+    httplib.ResponseNotReady, socket.error)
+
+
+class ConnectionPool(object):
+    '''
+    A pool of idle keep-alive connections to a single (scheme, host, port).
+
+    Connections are handed out with :meth:`acquire` and given back with :meth:`release`.
+    Idle connections older than `idle_timeout` seconds are closed instead of being reused.
+    '''
+
+    def __init__(self, scheme, host, port, max_size = 10, idle_timeout = 60, timeout = 60):
+        '''
+        Args:
+            - scheme : 'http' or 'https'
+            - host, port : Address of the server.
+            - max_size : Max number of idle connections kept in this pool.
+            - idle_timeout : Seconds after which an idle connection is evicted.
+            - timeout : Socket timeout in seconds for new connections.
+        '''
+        self.scheme = scheme
+        self.host = host
+        self.port = port
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+
+        # (connection, last_used_time) tuples. Most recently used at the right end.
+        self._idle = collections.deque()
+        self._lock = threading.Lock()
+
+        self.created = 0
+        self.reused = 0
+        self.discarded = 0
+        self.requests = 0
+
+
+    def acquire(self):
+        '''
+        Returns a (connection, reused) tuple. `reused` is True if the connection
+        came from the pool rather than being newly created.
+        '''
+        now = time.time()
+        with self._lock:
+            self.requests += 1
+            while self._idle:
+                conn, last_used = self._idle.pop()
+                if now - last_used > self.idle_timeout or _is_dropped(conn):
+                    self._discard(conn)
+                    continue
+
+                self.reused += 1
+                return (conn, True)
+
+            self.created += 1
+
+        return (self._new_connection(), False)
+
+
+    def connect(self):
+        '''
+        Returns a new connection, bypassing the idle connections.
+        '''
+        with self._lock:
+            self.created += 1
+
+        return self._new_connection()
+
+
+    def release(self, conn):
+        with self._lock:
+            if len(self._idle) < self.max_size:
+                self._idle.append( (conn, time.time()) )
+                return
+
+            self._discard(conn)
+
+
+    def discard(self, conn):
+        with self._lock:
+            self._discard(conn)
+
+
+    def evict_idle(self, max_idle = None):
+        '''
+        Close all idle connections that have been unused for more than `max_idle`
+        seconds (defaults to the pool's idle_timeout). Returns the number evicted.
+        '''
+        if max_idle is None:
+            max_idle = self.idle_timeout
+
+        now = time.time()
+        evicted = 0
+        with self._lock:
+            keep = collections.deque()
+            while self._idle:
+                conn, last_used = self._idle.popleft()
+                if now - last_used > max_idle:
+                    self._discard(conn)
+                    evicted += 1
+                else:
+                    keep.append( (conn, last_used) )
+            self._idle = keep
+
+        return evicted
+
+
+    def close(self):
+        with self._lock:
+            while self._idle:
+                conn, _ = self._idle.pop()
+                self._discard(conn)
+
+
+    def stats(self):
+        with self._lock:
+            return {
+                'requests' : self.requests,
+                'connections_created' : self.created,
+                'connections_reused' : self.reused,
+                'connections_discarded' : self.discarded,
+                'idle' : len(self._idle)
+            }
+
+
+    def _discard(self, conn):
+        # Caller must hold self._lock
+        self.discarded += 1
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+    def _new_connection(self):
+        if self.scheme == 'https':
+            return httplib.HTTPSConnection(self.host, self.port, timeout = self.timeout)
+
+        return httplib.HTTPConnection(self.host, self.port, timeout = self.timeout)
+
+
+
+def _is_dropped(conn):
+    # An idle keep-alive connection is readable only if the server closed it, or
+    # sent something unexpected. Either way it can't be reused.
+    if conn.sock is None:
+        return True
+    try:
+        return bool(select.select([conn.sock], [], [], 0)[0])
+    except (select.error, socket.error, ValueError):
+        return True
+
+
+
+class PooledTransport(object):
+    '''
+    Thread-safe HTTP transport that keeps keep-alive connections open
+    per host, so that successive API calls don't pay for a new TCP + TLS
+    handshake each time.
+
+    A single transport is meant to be shared by every thread in the process.
+    '''
+
+    def __init__(self, pool_size = 10, idle_timeout = 60, timeout = 60, host_pool_sizes = None):
+        '''
+        Args:
+            - pool_size : Default max number of idle connections kept per host.
+            - idle_timeout : Seconds after which idle connections are evicted.
+            - timeout : Socket timeout in seconds.
+            - host_pool_sizes : Optional dict of hostname -> pool size to override
+                `pool_size` for specific hosts.
+        '''
+        self.pool_size = pool_size
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self.host_pool_sizes = dict(host_pool_sizes or {})
+
+        self._pools = {}
+        self._lock = threading.Lock()
+
+
+    def post(self, url, body, headers = None):
+        '''
+        POST `body` to `url` and return the response body as a string.
+
+        Raises:
+            TransportError if the server responds with a non-2xx status.
+        '''
+        pool, conn, resp = self._send(url, body, headers)
+        try:
+            # The response has to be read fully before the connection can be reused.
+            data = resp.read()
+        except:
+            pool.discard(conn)
+            raise
+
+        if resp.will_close:
+            pool.discard(conn)
+        else:
+            pool.release(conn)
+
+        if not (200 <= resp.status < 300):
+            raise TransportError(url, resp.status, resp.reason, data)
+
+        return data
+
+
+    def post_stream(self, url, body, headers = None):
+        '''
+        POST `body` to `url` and return a :class:`StreamedResponse` to read the
+        response body incrementally. The caller must close it; the connection
+        goes back to the pool if the body was read fully.
+
+        Raises:
+            TransportError if the server responds with a non-2xx status.
+        '''
+        pool, conn, resp = self._send(url, body, headers)
+        if not (200 <= resp.status < 300):
+            try:
+                data = resp.read()
+            finally:
+                pool.discard(conn)
+            raise TransportError(url, resp.status, resp.reason, data)
+
+        return StreamedResponse(pool, conn, resp)
+
+
+    def stats(self):
+        '''
+        Returns a dict with per-host pool stats under 'hosts' and totals
+        across all hosts.
+        '''
+        with self._lock:
+            pools = self._pools.items()
+
+        totals = collections.Counter()
+        hosts = {}
+        for key, pool in pools:
+            s = pool.stats()
+            hosts['%s://%s:%s' % key] = s
+            totals.update(s)
+
+        result = dict(totals)
+        result['hosts'] = hosts
+        return result
+
+
+    def evict_idle(self, max_idle = None):
+        with self._lock:
+            pools = self._pools.values()
+
+        return sum([pool.evict_idle(max_idle) for pool in pools])
+
+
+    def close(self):
+        with self._lock:
+            pools = self._pools.values()
+            self._pools = {}
+
+        for pool in pools:
+            pool.close()
+
+
+    def _get_pool(self, parts):
+        scheme = parts.scheme or 'http'
+        host = parts.hostname
+        port = parts.port or (443 if scheme == 'https' else 80)
+        key = (scheme, host, port)
+
+        with self._lock:
+            pool = self._pools.get(key)
+            if pool is None:
+                pool = ConnectionPool(scheme, host, port,
+                    max_size = self.host_pool_sizes.get(host, self.pool_size),
+                    idle_timeout = self.idle_timeout,
+                    timeout = self.timeout)
+                self._pools[key] = pool
+
+        return pool
+
+
+    def _send(self, url, body, headers):
+        # Send the request and return (pool, connection, response) with the
+        # response body still unread.
+        parts = urlparse.urlsplit(url)
+        pool = self._get_pool(parts)
+
+        path = parts.path or '/'
+        if parts.query:
+            path = path + '?' + parts.query
+
+        req_headers = {
+            'Content-Type' : 'application/x-www-form-urlencoded',
+            'Connection' : 'keep-alive'
+        }
+        if headers:
+            req_headers.update(headers)
+
+        conn, reused = pool.acquire()
+        try:
+            conn.request('POST', path, body, req_headers)
+
+        except socket.timeout:
+            pool.discard(conn)
+            raise
+
+        except STALE_CONNECTION_ERRORS:
+            pool.discard(conn)
+            if not reused:
+                raise
+
+            # The server closed the idle connection before the request was sent,
+            # so it can't have been acted on. Retry once on a new one.
+            conn = pool.connect()
+            try:
+                conn.request('POST', path, body, req_headers)
+            except:
+                pool.discard(conn)
+                raise
+
+        except:
+            pool.discard(conn)
+            raise
+
+        try:
+            resp = conn.getresponse()
+        except:
+            pool.discard(conn)
+            raise
+
+        return (pool, conn, resp)
+
+
+
+class StreamedResponse(object):
+    '''
+    File-like response body returned by :meth:`PooledTransport.post_stream`.
+    '''
+
+    def __init__(self, pool, conn, resp):
+        self._pool = pool
+        self._conn = conn
+        self._resp = resp
+        self._closed = False
+
+
+    def read(self, size = None):
+        if size is None:
+            return self._resp.read()
+        return self._resp.read(size)
+
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+
+        # Reuse the connection only if the whole body was consumed. Otherwise
+        # the unread remainder would be mistaken for the next response.
+        if self._resp.isclosed() and not self._resp.will_close:
+            self._pool.release(self._conn)
+        else:
+            self._pool.discard(self._conn)
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *args):
+        self.close()